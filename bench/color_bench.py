@@ -0,0 +1,128 @@
+"""
+Per-frame timing of the single-pass color classifier against the original
+per-color inRange/morphology/findContours implementation.
+
+Usage:
+    python bench/color_bench.py [--iterations 200] [--sizes 224x224,640x480,1280x720]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.utils.color_classifier import ColorClassifier  # noqa: E402
+
+
+def legacy_detect_simple(frame: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    The original per-color detector (inRange + open/close + findContours per color),
+    kept verbatim as the reference for this benchmark.
+    """
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    detections = []
+
+    # Define color ranges for multiple objects
+    colors = {
+        'red': ([0, 50, 50], [10, 255, 255], [170, 50, 50], [180, 255, 255]),
+        'blue': ([100, 50, 50], [130, 255, 255]),
+        'green': ([40, 50, 50], [80, 255, 255]),
+        'yellow': ([20, 50, 50], [40, 255, 255])
+    }
+
+    kernel = np.ones((3, 3), np.uint8)
+
+    for color_name, ranges in colors.items():
+        if len(ranges) == 4:  # Red has two ranges
+            mask1 = cv2.inRange(hsv, np.array(ranges[0]), np.array(ranges[1]))
+            mask2 = cv2.inRange(hsv, np.array(ranges[2]), np.array(ranges[3]))
+            mask = mask1 + mask2
+        else:
+            mask = cv2.inRange(hsv, np.array(ranges[0]), np.array(ranges[1]))
+
+        # Clean up mask
+        mask = cv2.morphologyEx(mask.astype(np.uint8), cv2.MORPH_OPEN, kernel)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+
+        # Find contours
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area > 300:  # Lower threshold for better detection
+                x, y, w, h = cv2.boundingRect(contour)
+                # Filter out very thin or very wide rectangles
+                aspect_ratio = w / h if h > 0 else 0
+                if 0.2 < aspect_ratio < 5.0:
+                    detections.append({
+                        'bbox': [x, y, x + w, y + h],
+                        'confidence': min(0.95, area / 8000),
+                        'class_id': list(colors.keys()).index(color_name),
+                        'label': color_name
+                    })
+
+    return detections
+
+
+def synthetic_frame(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Noise background with a few solid colored shapes."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 80, (height, width, 3), dtype=np.uint8)
+    colors = [(0, 0, 255), (255, 0, 0), (0, 255, 0), (0, 255, 255)]
+    for i, color in enumerate(colors):
+        x = int(width * (0.1 + 0.2 * i))
+        y = int(height * (0.2 + 0.15 * i))
+        size = max(12, min(width, height) // 6)
+        if i % 2:
+            cv2.circle(frame, (x + size // 2, y + size // 2), size // 2, color, -1)
+        else:
+            cv2.rectangle(frame, (x, y), (x + size, y + size), color, -1)
+    return frame
+
+
+def time_per_frame(fn, frame: np.ndarray, iterations: int) -> float:
+    fn(frame)  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(frame)
+    return (time.perf_counter() - start) * 1000.0 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--sizes", default="224x224,640x480,1280x720")
+    parser.add_argument("--mask-scale", type=float, default=0.5, help="scale for the downscaled-mask variant")
+    args = parser.parse_args()
+
+    full = ColorClassifier()
+    scaled = ColorClassifier(mask_scale=args.mask_scale)
+
+    results = []
+    for size in args.sizes.split(","):
+        w, h = (int(v) for v in size.lower().split("x"))
+        frame = synthetic_frame(w, h)
+        row = {
+            "size": f"{w}x{h}",
+            "legacy_ms": time_per_frame(legacy_detect_simple, frame, args.iterations),
+            "lut_ms": time_per_frame(full.detect, frame, args.iterations),
+            f"lut_scaled_{args.mask_scale}_ms": time_per_frame(scaled.detect, frame, args.iterations),
+            "legacy_detections": len(legacy_detect_simple(frame)),
+            "lut_detections": len(full.detect(frame)),
+        }
+        row["speedup"] = row["legacy_ms"] / row["lut_ms"] if row["lut_ms"] else None
+        results.append(row)
+        print(f"{row['size']:>10}  legacy {row['legacy_ms']:7.3f} ms   lut {row['lut_ms']:7.3f} ms   "
+              f"lut@{args.mask_scale} {row[f'lut_scaled_{args.mask_scale}_ms']:7.3f} ms   x{row['speedup']:.2f}")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+Headless load generator for the detection server.
+
+Drives /api/detect with synthetic JPEG frames (colored shapes on noise) at a
+fixed request rate or with closed-loop concurrency, while N listeners on
+/ws/detection measure fan-out. Each client uses its own session by default (a
+shared session would drop frames to latest-frame-wins rather than capacity)
+and reports every answered frame to /api/metrics/frame, with the response
+arrival as the display time, so the server-side summary covers the run.
+Writes a JSON report with throughput, latency percentiles and error rates,
+plus the server's /api/metrics at the end.
+
+Usage:
+    python bench/load_gen.py --duration 30 --rate 10 --listeners 2
+    python bench/load_gen.py --duration 30 --concurrency 4 --resolution 640x480 --quality 80
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from color_bench import synthetic_frame  # noqa: E402
+
+
+def synthetic_stream(width: int, height: int, count: int, quality: int, seed: int = 0) -> List[bytes]:
+    """Pre-encoded JPEG frames with the shapes drifting right, so the client side costs ~nothing."""
+    base = synthetic_frame(width, height, seed)
+    step = max(1, width // max(1, count))
+    return [
+        cv2.imencode(".jpg", np.roll(base, i * step, axis=1), [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+        for i in range(count)
+    ]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p90": None, "p95": None, "p99": None, "max": None, "mean": None}
+    arr = np.asarray(values, np.float64)
+    p50, p90, p95, p99 = np.percentile(arr, [50, 90, 95, 99])
+    return {"p50": p50, "p90": p90, "p95": p95, "p99": p99, "max": float(arr.max()), "mean": float(arr.mean())}
+
+
+class DetectClient:
+    """One keep-alive HTTP connection posting frames to /api/detect."""
+
+    def __init__(self, base_url: str, session_id: str, body_format: str = "binary"):
+        url = urlparse(base_url)
+        self.host, self.port = url.hostname, url.port or (443 if url.scheme == "https" else 80)
+        self.https = url.scheme == "https"
+        self.session_id = session_id
+        self.body_format = body_format
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.conn = cls(self.host, self.port, timeout=30)
+        return self.conn
+
+    def post(self, frame: bytes, frame_id: str) -> Dict[str, Any]:
+        capture_ts = int(time.time() * 1000)
+        headers = {"X-Requested-With": "load_gen", "X-Session-Id": self.session_id}
+        if self.body_format == "json":
+            body = json.dumps({
+                "image": "data:image/jpeg;base64," + base64.b64encode(frame).decode(),
+                "frame_id": frame_id,
+                "capture_ts": capture_ts,
+            }).encode()
+            headers["Content-Type"] = "application/json"
+        else:
+            body = frame
+            headers.update({
+                "Content-Type": "application/octet-stream",
+                "X-Frame-Id": frame_id,
+                "X-Capture-Ts": str(capture_ts),
+            })
+        try:
+            conn = self._connect()
+            conn.request("POST", "/api/detect", body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+            if resp.status != 200:
+                return {"error": f"HTTP {resp.status}"}
+            return json.loads(data)
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            self.close()
+            return {"error": str(e)}
+
+    def report(self, result: Dict[str, Any]) -> None:
+        """Post a frame's timestamps to /api/metrics/frame, as the browser does after drawing it."""
+        body = json.dumps({
+            "frame_id": result.get("frame_id"),
+            "capture_ts": result.get("capture_ts"),
+            "recv_ts": result.get("recv_ts"),
+            "inference_ts": result.get("inference_ts"),
+            "overlay_display_ts": int(time.time() * 1000),
+        }).encode()
+        headers = {
+            "X-Requested-With": "load_gen",
+            "X-Session-Id": self.session_id,
+            "Content-Type": "application/json",
+        }
+        try:
+            conn = self._connect()
+            conn.request("POST", "/api/metrics/frame", body=body, headers=headers)
+            conn.getresponse().read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class DetectionListener(threading.Thread):
+    """
+    Minimal RFC 6455 client for /ws/detection (stdlib only): records when each
+    result arrives, keyed by frame_id.
+    """
+
+    def __init__(self, base_url: str, name: str):
+        super().__init__(name=name, daemon=True)
+        url = urlparse(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.received: Dict[str, float] = {}
+        self.messages = 0
+        self.error: Optional[str] = None
+        self.connected = threading.Event()
+        self._stopping = threading.Event()
+        self._sock: Optional[socket.socket] = None
+
+    def run(self) -> None:
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=10)
+            key = base64.b64encode(os.urandom(16)).decode()
+            sock.sendall((
+                f"GET /ws/detection HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nUpgrade: websocket\r\n"
+                f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+            ).encode())
+            reader = sock.makefile("rb")
+            status = reader.readline()
+            if b" 101 " not in status:
+                raise ConnectionError(f"WebSocket upgrade failed: {status.strip().decode(errors='replace')}")
+            while reader.readline() not in (b"\r\n", b""):
+                pass
+            # Block on reads; stop() closes the socket to end the loop
+            sock.settimeout(None)
+            self._sock = sock
+            self.connected.set()
+            while not self._stopping.is_set():
+                opcode, payload = self._read_frame(reader)
+                if opcode == 0x8:  # close
+                    break
+                if opcode == 0x1:
+                    self.messages += 1
+                    try:
+                        frame_id = str(json.loads(payload).get("frame_id"))
+                    except ValueError:
+                        continue
+                    self.received.setdefault(frame_id, time.perf_counter())
+        except Exception as e:
+            if not self._stopping.is_set():
+                self.error = str(e)
+            self.connected.set()
+
+    @staticmethod
+    def _read_exact(reader, n: int) -> bytes:
+        data = reader.read(n)
+        if data is None or len(data) < n:
+            raise ConnectionError("WebSocket closed")
+        return data
+
+    def _read_frame(self, reader):
+        b1, b2 = self._read_exact(reader, 2)
+        length = b2 & 0x7F
+        if length == 126:
+            (length,) = struct.unpack(">H", self._read_exact(reader, 2))
+        elif length == 127:
+            (length,) = struct.unpack(">Q", self._read_exact(reader, 8))
+        mask = self._read_exact(reader, 4) if b2 & 0x80 else None
+        payload = self._read_exact(reader, length) if length else b""
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return b1 & 0x0F, payload
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+
+
+def http_json(base_url: str, method: str, path: str) -> Optional[Dict[str, Any]]:
+    url = urlparse(base_url)
+    cls = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+    conn = cls(url.hostname, url.port or (443 if url.scheme == "https" else 80), timeout=10)
+    try:
+        conn.request(method, path)
+        return json.loads(conn.getresponse().read())
+    except (OSError, http.client.HTTPException, ValueError):
+        return None
+    finally:
+        conn.close()
+
+
+def run(args) -> Dict[str, Any]:
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    frames = synthetic_stream(width, height, args.distinct_frames, args.quality)
+
+    if args.reset_metrics:
+        http_json(args.url, "POST", "/api/metrics/reset")
+
+    listeners = [DetectionListener(args.url, f"listener-{i}") for i in range(args.listeners)]
+    for listener in listeners:
+        listener.start()
+    for listener in listeners:
+        listener.connected.wait(10)
+
+    lock = threading.Lock()
+    sent_at: Dict[str, float] = {}
+    latencies: List[float] = []
+    counts = {"sent": 0, "ok": 0, "dropped": 0, "errors": 0}
+    error_kinds: Dict[str, int] = {}
+
+    def record(frame_id: str, started: float, result: Dict[str, Any]) -> None:
+        elapsed = (time.perf_counter() - started) * 1000.0
+        with lock:
+            if "error" in result:
+                counts["errors"] += 1
+                error_kinds[result["error"]] = error_kinds.get(result["error"], 0) + 1
+            elif result.get("dropped"):
+                counts["dropped"] += 1
+            else:
+                counts["ok"] += 1
+                latencies.append(elapsed)
+
+    seq = iter(range(1 << 62))
+    seq_lock = threading.Lock()
+
+    def next_frame():
+        with seq_lock:
+            i = next(seq)
+        return i, f"lg-{i}", frames[i % len(frames)]
+
+    def send(client: DetectClient) -> None:
+        i, frame_id, frame = next_frame()
+        started = time.perf_counter()
+        with lock:
+            sent_at[frame_id] = started
+            counts["sent"] += 1
+        result = client.post(frame, frame_id)
+        record(frame_id, started, result)
+        if args.frame_metrics and "error" not in result and not result.get("dropped"):
+            client.report(result)
+
+    # One session per client unless asked otherwise
+    sessions = [f"load-gen-{i}" for i in range(max(1, args.sessions or args.concurrency))]
+    start = time.perf_counter()
+    deadline = start + args.duration
+
+    if args.rate > 0:
+        # Open loop: fixed arrival rate regardless of response time
+        workers = max(1, args.concurrency)
+        local = threading.local()
+        thread_ids = iter(range(workers))
+
+        def client_for_thread() -> DetectClient:
+            if not hasattr(local, "client"):
+                with seq_lock:
+                    sid = sessions[next(thread_ids) % len(sessions)]
+                local.client = DetectClient(args.url, sid, args.format)
+            return local.client
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            interval = 1.0 / args.rate
+            n = 0
+            while True:
+                due = start + n * interval
+                if due >= deadline:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(lambda: send(client_for_thread()))
+                n += 1
+    else:
+        # Closed loop: each worker sends its next frame as soon as the last returns
+        def worker(idx: int) -> None:
+            client = DetectClient(args.url, sessions[idx % len(sessions)], args.format)
+            while time.perf_counter() < deadline:
+                send(client)
+            client.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(max(1, args.concurrency))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    elapsed = time.perf_counter() - start
+    time.sleep(args.drain)
+    for listener in listeners:
+        listener.stop()
+
+    listener_reports = []
+    for listener in listeners:
+        fanout = [(at - sent_at[fid]) * 1000.0 for fid, at in listener.received.items() if fid in sent_at]
+        listener_reports.append({
+            "name": listener.name,
+            "error": listener.error,
+            "messages": listener.messages,
+            "delivered_ratio": (len(fanout) / counts["ok"]) if counts["ok"] else None,
+            "fanout_latency_ms": percentiles(fanout),
+        })
+
+    return {
+        "config": {
+            "url": args.url,
+            "duration_s": args.duration,
+            "mode": "open_loop" if args.rate > 0 else "closed_loop",
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "sessions": len(sessions),
+            "resolution": args.resolution,
+            "quality": args.quality,
+            "format": args.format,
+            "frame_bytes_mean": float(np.mean([len(f) for f in frames])),
+            "listeners": args.listeners,
+            "frame_metrics": args.frame_metrics,
+        },
+        "elapsed_s": elapsed,
+        "requests": dict(counts),
+        "throughput_fps": counts["ok"] / elapsed if elapsed else 0.0,
+        "error_rate": counts["errors"] / counts["sent"] if counts["sent"] else 0.0,
+        "drop_rate": counts["dropped"] / counts["sent"] if counts["sent"] else 0.0,
+        "errors": error_kinds,
+        "latency_ms": percentiles(latencies),
+        "listeners": listener_reports,
+        "server_metrics": http_json(args.url, "GET", "/api/metrics"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--rate", type=float, default=0.0, help="requests/s (open loop); 0 = closed loop")
+    parser.add_argument("--concurrency", type=int, default=1, help="closed-loop workers / open-loop senders")
+    parser.add_argument("--sessions", type=int, default=0,
+                        help="distinct X-Session-Id values; 0 = one per concurrent client")
+    parser.add_argument("--listeners", type=int, default=1, help="/ws/detection listeners")
+    parser.add_argument("--resolution", default="640x480")
+    parser.add_argument("--quality", type=int, default=70)
+    parser.add_argument("--format", choices=("binary", "json"), default="binary")
+    parser.add_argument("--distinct-frames", type=int, default=30)
+    parser.add_argument("--drain", type=float, default=1.0, help="seconds to wait for late results")
+    parser.add_argument("--reset-metrics", action="store_true")
+    parser.add_argument("--no-frame-metrics", dest="frame_metrics", action="store_false",
+                        help="don't report answered frames to /api/metrics/frame")
+    parser.add_argument("--output", help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
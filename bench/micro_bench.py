@@ -0,0 +1,197 @@
+"""
+In-process micro-benchmarks for the detector hot paths:
+
+  - VLMDetector._detect_simple (color path)
+  - VLMDetector.detect_regions (color path, only around the frame's detections as in ROI mode)
+  - VLMDetector._detect_with_model (ONNX path, tiny generated model)
+  - VLMDetector._tiled_arrays (ONNX path over overlapping tiles, one batch)
+  - draw_detections (copying, and in place as the preview stream draws)
+  - FrameMetrics.record_frame (per /api/metrics/frame report)
+
+Before timing, the histogram-based /api/metrics latency keys are checked
+against the original sorted-list computation (statistics.median, lower-rank
+p95) on random samples below 1 s, where the buckets are exact; a mismatch
+exits non-zero.
+
+The model benchmark generates a small YOLO-shaped ONNX graph (one strided
+conv, pooled into a single [x1, y1, x2, y2, conf, class] row) so it runs
+without downloading weights; it is skipped if onnx / onnxruntime are missing.
+
+Usage:
+    python bench/micro_bench.py [--iterations 100] [--sizes 224x224,640x480] [--output micro.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from color_bench import synthetic_frame  # noqa: E402
+from server.utils.metrics import FrameMetrics  # noqa: E402
+from server.utils.tiling import roi_regions  # noqa: E402
+from server.utils.vlm_detector import VLMDetector, draw_detections  # noqa: E402
+
+
+def make_tiny_model(path: str, input_size: int = 640) -> None:
+    """
+    Write a tiny ONNX detector: Conv(3->6, k4, s4) -> GlobalAveragePool, plus
+    a constant box, giving one [1, 1, 6] detection row per image.
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+    weights = numpy_helper.from_array((rng.standard_normal((6, 3, 4, 4)) * 0.01).astype(np.float32), "w")
+    shape = numpy_helper.from_array(np.array([-1, 1, 6], np.int64), "shape")
+    box = numpy_helper.from_array(
+        np.array([[[0.25 * input_size, 0.25 * input_size, 0.75 * input_size, 0.75 * input_size, 0.9, 1.0]]],
+                 np.float32),
+        "box",
+    )
+    nodes = [
+        helper.make_node("Conv", ["input", "w"], ["c"], kernel_shape=[4, 4], strides=[4, 4]),
+        helper.make_node("GlobalAveragePool", ["c"], ["g"]),
+        helper.make_node("Reshape", ["g", "shape"], ["r"]),
+        helper.make_node("Add", ["r", "box"], ["output"]),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "tiny_detector",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", 3, input_size, input_size])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["N", 1, 6])],
+        [weights, shape, box],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+def time_ms(fn, iterations: int) -> Dict[str, float]:
+    """Per-call timing: mean plus p50/p95 over individual calls."""
+    fn()  # warm-up
+    samples = np.empty(iterations, np.float64)
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples[i] = (time.perf_counter() - start) * 1000.0
+    p50, p95 = np.percentile(samples, [50, 95])
+    return {"mean_ms": float(samples.mean()), "p50_ms": float(p50), "p95_ms": float(p95)}
+
+
+def model_detector(model_dir: str) -> Optional[VLMDetector]:
+    try:
+        import onnxruntime  # noqa: F401
+        path = os.path.join(model_dir, "tiny_detector.onnx")
+        make_tiny_model(path)
+    except ImportError as e:
+        print(f"Skipping model benchmark: {e}")
+        return None
+    detector = VLMDetector(path)
+    return detector if detector.use_model else None
+
+
+def legacy_latency_summary(e2e: List[int], server: List[int], network: List[int]) -> Dict[str, Any]:
+    """Latency keys as /api/metrics computed them from the full frame list."""
+    def p95(vals):
+        if not vals:
+            return None
+        vals_sorted = sorted(vals)
+        return vals_sorted[int(0.95 * (len(vals_sorted) - 1))]
+
+    return {
+        "median_e2e_ms": statistics.median(e2e) if e2e else None,
+        "p95_e2e_ms": p95(e2e),
+        "server_latency_median_ms": statistics.median(server) if server else None,
+        "network_latency_median_ms": statistics.median(network) if network else None,
+    }
+
+
+def metrics_parity(trials: int = 200, seed: int = 0) -> List[Dict[str, Any]]:
+    """Histogram summaries vs. legacy_latency_summary on random frame timestamps; returns mismatches."""
+    rng = np.random.default_rng(seed)
+    mismatches = []
+    for trial in range(trials):
+        n = int(rng.integers(1, 400))
+        capture = rng.integers(0, 10_000, n)
+        network = rng.integers(0, 300, n)
+        server = rng.integers(0, 300, n)
+        display = rng.integers(0, 300, n)
+        metrics = FrameMetrics()
+        for c, nw, sv, d in zip(capture, network, server, display):
+            metrics.record_frame(int(c), int(c + nw), int(c + nw + sv), int(c + nw + sv + d), now=0.0)
+        expected = legacy_latency_summary((network + server + display).tolist(), server.tolist(), network.tolist())
+        summary = metrics.summary()
+        for key, value in expected.items():
+            if summary[key] != value:
+                mismatches.append({"trial": trial, "frames": n, "key": key, "expected": value, "got": summary[key]})
+    return mismatches
+
+
+def run(iterations: int, sizes: List[str]) -> Dict[str, Any]:
+    color = VLMDetector()
+    results: Dict[str, Any] = {"iterations": iterations, "benchmarks": []}
+
+    mismatches = metrics_parity()
+    results["metrics_parity_mismatches"] = mismatches
+    if mismatches:
+        print(f"Metrics parity: {len(mismatches)} mismatches, e.g. {mismatches[0]}")
+    else:
+        print("Metrics parity: histogram summaries match the sorted-list computation")
+    metrics = FrameMetrics()
+    entry = {"name": "metrics_record_frame", "size": "-",
+             **time_ms(lambda: metrics.record_frame(0, 20, 45, 80), iterations)}
+    results["benchmarks"].append(entry)
+    print(f"{entry['name']:>18}  mean {entry['mean_ms']:8.4f} ms  p95 {entry['p95_ms']:8.4f} ms")
+    with tempfile.TemporaryDirectory() as model_dir:
+        model = model_detector(model_dir)
+        for size in sizes:
+            w, h = (int(v) for v in size.lower().split("x"))
+            frame = synthetic_frame(w, h)
+            detections = color._detect_simple(frame)
+            regions = roi_regions(color.detect_contract(frame), w, h)
+            canvas = frame.copy()
+            rows = [
+                ("detect_simple", lambda: color._detect_simple(frame)),
+                ("detect_regions", lambda: color.detect_regions(frame, regions)),
+                ("draw_detections", lambda: draw_detections(frame, detections)),
+                ("draw_detections_in_place", lambda: draw_detections(canvas, detections, in_place=True)),
+            ]
+            if model is not None:
+                rows.append(("detect_with_model", lambda: model._detect_with_model(frame)))
+                rows.append(("detect_tiled", lambda: model._tiled_arrays(frame)))
+            for name, fn in rows:
+                entry = {"name": name, "size": f"{w}x{h}", **time_ms(fn, iterations)}
+                results["benchmarks"].append(entry)
+                print(f"{name:>18} {entry['size']:>10}  mean {entry['mean_ms']:8.3f} ms  "
+                      f"p50 {entry['p50_ms']:8.3f} ms  p95 {entry['p95_ms']:8.3f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--sizes", default="224x224,640x480,1280x720")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.sizes.split(","))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if results["metrics_parity_mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Summarize benchmark reports and flag regressions against a baseline.
+
+Understands the JSON written by bench/load_gen.py, bench/micro_bench.py and
+/api/metrics (metrics.json). With --baseline, exits non-zero when any tracked
+metric is worse than the baseline by more than --max-regression, so it can
+gate CI.
+
+Usage:
+    python bench/parser.py load.json
+    python bench/parser.py micro.json --baseline bench/baseline_micro.json --max-regression 0.15
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+# metric name -> True if higher is better
+Metrics = Dict[str, Tuple[float, bool]]
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def report_kind(report: Dict[str, Any]) -> str:
+    if "benchmarks" in report:
+        return "micro"
+    if "requests" in report and "latency_ms" in report:
+        return "load"
+    if "count_frames" in report:
+        return "metrics"
+    raise ValueError("Unrecognized report format")
+
+
+def extract_metrics(report: Dict[str, Any]) -> Metrics:
+    """Flatten a report into {metric: (value, higher_is_better)}, skipping missing values."""
+    kind = report_kind(report)
+    metrics: Metrics = {}
+
+    def put(name: str, value: Any, higher_is_better: bool) -> None:
+        if isinstance(value, (int, float)):
+            metrics[name] = (float(value), higher_is_better)
+
+    if kind == "micro":
+        for bench in report["benchmarks"]:
+            key = f"{bench['name']}@{bench['size']}"
+            put(f"{key}.mean_ms", bench.get("mean_ms"), False)
+            put(f"{key}.p95_ms", bench.get("p95_ms"), False)
+    elif kind == "load":
+        put("throughput_fps", report.get("throughput_fps"), True)
+        put("error_rate", report.get("error_rate"), False)
+        put("drop_rate", report.get("drop_rate"), False)
+        for q in ("p50", "p95", "p99"):
+            put(f"latency_{q}_ms", (report.get("latency_ms") or {}).get(q), False)
+        for listener in report.get("listeners") or []:
+            put(f"{listener['name']}.fanout_p95_ms", (listener.get("fanout_latency_ms") or {}).get("p95"), False)
+    else:
+        put("processed_fps", report.get("processed_fps"), True)
+        put("median_e2e_ms", report.get("median_e2e_ms"), False)
+        put("p95_e2e_ms", report.get("p95_e2e_ms"), False)
+        put("server_latency_median_ms", report.get("server_latency_median_ms"), False)
+        put("network_latency_median_ms", report.get("network_latency_median_ms"), False)
+    return metrics
+
+
+def compare(current: Metrics, baseline: Metrics, max_regression: float) -> List[Dict[str, Any]]:
+    """
+    Relative change of every metric present in both reports.
+
+    Returns:
+        [{metric, baseline, current, change, regression}, ...]; change is
+        positive when the metric got worse
+    """
+    rows = []
+    for name, (value, higher_is_better) in current.items():
+        if name not in baseline:
+            continue
+        base = baseline[name][0]
+        if base == 0:
+            change = 0.0 if value == 0 else float("inf")
+            if higher_is_better:
+                change = -change
+        else:
+            change = (value - base) / abs(base)
+            if higher_is_better:
+                change = -change
+        rows.append({
+            "metric": name,
+            "baseline": base,
+            "current": value,
+            "change": change,
+            "regression": change > max_regression,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("report", help="load_gen / micro_bench / metrics.json report")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="allowed relative worsening per metric (0.10 = 10%%)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable output")
+    args = parser.parse_args()
+
+    current = extract_metrics(load_report(args.report))
+    if not args.baseline:
+        if args.json:
+            print(json.dumps({name: value for name, (value, _) in current.items()}, indent=2))
+        else:
+            for name, (value, _) in current.items():
+                print(f"{name:>40}  {value:12.3f}")
+        return
+
+    rows = compare(current, extract_metrics(load_report(args.baseline)), args.max_regression)
+    regressions = [row for row in rows if row["regression"]]
+    if args.json:
+        print(json.dumps({"comparisons": rows, "regressions": len(regressions)}, indent=2))
+    else:
+        for row in rows:
+            flag = "REGRESSION" if row["regression"] else ""
+            print(f"{row['metric']:>40}  {row['baseline']:12.3f} -> {row['current']:12.3f}  "
+                  f"{row['change'] * 100:+7.1f}%  {flag}")
+        print(f"{len(regressions)} regression(s) over {args.max_regression * 100:.0f}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
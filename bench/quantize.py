@@ -0,0 +1,227 @@
+"""
+Build INT8 variants of an ONNX detector and compare them with the float32 model.
+
+Writes <model>.int8-dynamic.onnx (weights only, no calibration) and
+<model>.int8-static.onnx (weights + activations, calibrated on frames) next
+to the model. The server picks them up with MODEL_PRECISION=int8 (or
+int8-static / int8-dynamic); in MODELS_DIR they are also selectable per
+request as ?model=<name>.int8-static.
+
+The report times VLMDetector.detect_contract for every variant (mean /
+p50 / p95 latency, throughput) and scores detection agreement with the
+float32 model: per frame, detections of the same label are matched greedily
+at IoU >= --match-iou; precision / recall treat the float32 output as ground
+truth.
+
+Frames come from a frame recording (RECORD_DIR), a directory of images, a
+video file, or synthetic frames.
+
+Usage:
+    python bench/quantize.py model.onnx --frames samples/ --output quant_report.json
+    python bench/quantize.py model.onnx --frames recordings/ --letterbox
+    python bench/quantize.py model.onnx --modes dynamic --synthetic 16
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from color_bench import synthetic_frame  # noqa: E402
+from server.utils.quantization import (  # noqa: E402
+    QUANT_MODES,
+    quantize_dynamic_model,
+    quantize_static_model,
+)
+from server.utils.recorder import SEGMENT_EXT, RecordingReader, list_segments  # noqa: E402
+from server.utils.vlm_detector import VLMDetector  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_frames(source: Optional[str], max_frames: int, synthetic: int) -> List[np.ndarray]:
+    """BGR frames from a recording, an image directory or a video file, else synthetic ones."""
+    frames: List[np.ndarray] = []
+    if source and (source.endswith(SEGMENT_EXT) or (os.path.isdir(source) and list_segments(source))):
+        with RecordingReader(source) as reader:
+            for record in reader:
+                frame = cv2.imdecode(np.frombuffer(record.frame, np.uint8), cv2.IMREAD_COLOR)
+                del record
+                if frame is not None:
+                    frames.append(frame)
+                if len(frames) >= max_frames:
+                    break
+    elif source and os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(source, name), cv2.IMREAD_COLOR)
+                if frame is not None:
+                    frames.append(frame)
+            if len(frames) >= max_frames:
+                break
+    elif source:
+        capture = cv2.VideoCapture(source)
+        while len(frames) < max_frames:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+        capture.release()
+    if source and not frames:
+        raise SystemExit(f"No frames read from {source}")
+    if not frames:
+        frames = [synthetic_frame(640, 480, seed=i) for i in range(synthetic)]
+    return frames
+
+
+def _iou(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    iw = max(0.0, min(a["xmax"], b["xmax"]) - max(a["xmin"], b["xmin"]))
+    ih = max(0.0, min(a["ymax"], b["ymax"]) - max(a["ymin"], b["ymin"]))
+    inter = iw * ih
+    union = ((a["xmax"] - a["xmin"]) * (a["ymax"] - a["ymin"])
+             + (b["xmax"] - b["xmin"]) * (b["ymax"] - b["ymin"]) - inter)
+    return inter / union if union > 0 else 0.0
+
+
+def match_detections(reference: List[Dict[str, Any]], candidate: List[Dict[str, Any]],
+                     min_iou: float = 0.5) -> List[float]:
+    """Greedy same-label IoU matching; returns the IoU of every matched pair."""
+    pairs = sorted(
+        ((_iou(r, c), i, j) for i, r in enumerate(reference) for j, c in enumerate(candidate)
+         if r["label"] == c["label"]),
+        reverse=True,
+    )
+    used_ref, used_cand, ious = set(), set(), []
+    for iou, i, j in pairs:
+        if iou < min_iou:
+            break
+        if i in used_ref or j in used_cand:
+            continue
+        used_ref.add(i)
+        used_cand.add(j)
+        ious.append(iou)
+    return ious
+
+
+def agreement(reference: List[List[Dict[str, Any]]], candidate: List[List[Dict[str, Any]]],
+              min_iou: float) -> Dict[str, Any]:
+    matched, ious = 0, []
+    n_ref = sum(len(d) for d in reference)
+    n_cand = sum(len(d) for d in candidate)
+    for ref, cand in zip(reference, candidate):
+        frame_ious = match_detections(ref, cand, min_iou)
+        matched += len(frame_ious)
+        ious.extend(frame_ious)
+    precision = matched / n_cand if n_cand else None
+    recall = matched / n_ref if n_ref else None
+    f1 = 2 * precision * recall / (precision + recall) if precision and recall else None
+    return {
+        "reference": n_ref,
+        "candidate": n_cand,
+        "matched": matched,
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "mean_iou": float(np.mean(ious)) if ious else None,
+    }
+
+
+def evaluate(path: str, frames: List[np.ndarray], iterations: int, letterbox: bool = False) -> Dict[str, Any]:
+    """Latency over all frames and the detections of each frame."""
+    detector = VLMDetector(path, warmup_runs=2, letterbox=letterbox)
+    if not detector.use_model:
+        raise SystemExit(f"Could not load {path}")
+    detections = [detector.detect_contract(frame) for frame in frames]
+    samples = []
+    for _ in range(iterations):
+        for frame in frames:
+            start = time.perf_counter()
+            detector.detect_contract(frame)
+            samples.append((time.perf_counter() - start) * 1000.0)
+    samples = np.asarray(samples)
+    p50, p95 = np.percentile(samples, [50, 95])
+    return {
+        "size_mb": os.path.getsize(path) / 2**20,
+        "latency_ms": {"mean": float(samples.mean()), "p50": float(p50), "p95": float(p95)},
+        "throughput_fps": 1000.0 / float(samples.mean()),
+        "detections": detections,
+    }
+
+
+def run(model: str, modes: List[str], frames: List[np.ndarray], calibration_frames: int,
+        iterations: int, match_iou: float, letterbox: bool) -> Dict[str, Any]:
+    variants = {"fp32": model}
+    for mode in modes:
+        start = time.perf_counter()
+        if mode == "dynamic":
+            path = quantize_dynamic_model(model)
+        else:
+            path = quantize_static_model(model, frames[:calibration_frames], letterbox=letterbox)
+        print(f"Wrote {path} ({time.perf_counter() - start:.1f} s)")
+        variants[f"int8-{mode}"] = path
+
+    results = {name: evaluate(path, frames, iterations, letterbox) for name, path in variants.items()}
+    baseline = results["fp32"]
+    report: Dict[str, Any] = {
+        "model": model,
+        "frames": len(frames),
+        "calibration_frames": min(calibration_frames, len(frames)),
+        "iterations": iterations,
+        "match_iou": match_iou,
+        "variants": [],
+    }
+    for name, result in results.items():
+        entry = {
+            "name": name,
+            "path": variants[name],
+            "size_mb": result["size_mb"],
+            "latency_ms": result["latency_ms"],
+            "throughput_fps": result["throughput_fps"],
+            "speedup": baseline["latency_ms"]["mean"] / result["latency_ms"]["mean"],
+            "agreement": agreement(baseline["detections"], result["detections"], match_iou),
+        }
+        report["variants"].append(entry)
+        a = entry["agreement"]
+        fmt = lambda v: "   n/a" if v is None else f"{v:6.3f}"  # noqa: E731
+        print(f"{name:>13}  {entry['size_mb']:7.2f} MB  mean {entry['latency_ms']['mean']:8.2f} ms  "
+              f"p95 {entry['latency_ms']['p95']:8.2f} ms  x{entry['speedup']:5.2f}  "
+              f"P {fmt(a['precision'])}  R {fmt(a['recall'])}  IoU {fmt(a['mean_iou'])}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="float32 ONNX model")
+    parser.add_argument("--modes", default=",".join(QUANT_MODES), help="comma-separated: static,dynamic")
+    parser.add_argument("--frames", help="recording, directory of images or video file (default: synthetic frames)")
+    parser.add_argument("--max-frames", type=int, default=64)
+    parser.add_argument("--synthetic", type=int, default=32, help="synthetic frames when --frames is not given")
+    parser.add_argument("--calibration-frames", type=int, default=32)
+    parser.add_argument("--iterations", type=int, default=3, help="timing passes over the frames")
+    parser.add_argument("--match-iou", type=float, default=0.5)
+    parser.add_argument("--letterbox", action="store_true", help="calibrate and evaluate with MODEL_LETTERBOX preprocessing")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(QUANT_MODES)
+    if unknown:
+        raise SystemExit(f"Unknown modes: {', '.join(sorted(unknown))}")
+    frames = load_frames(args.frames, args.max_frames, args.synthetic)
+    report = run(args.model, modes, frames, args.calibration_frames, args.iterations,
+                 args.match_iou, args.letterbox)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
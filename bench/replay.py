@@ -0,0 +1,214 @@
+"""
+Replay a frame recording (RECORD_DIR) through the detector offline.
+
+Every recorded frame is decoded and detected with the same worker code the
+server uses (scheduler.run_detection), either as fast as the worker pool
+allows or at the original arrival times (--realtime, scaled by --speed) to
+reproduce queueing under the recorded load. The per-request thresholds that
+were recorded with each frame are applied unless --ignore-options is given.
+Frames recorded with a per-request model (?model=<name>) run on that model
+from --models-dir; frames whose model isn't there are skipped and counted.
+
+New detections are diffed against the recorded ones for every frame that had
+a full detection (dropped, failed, temporally tracked and ROI-mode region-only
+frames are replayed but not compared): same-label boxes are matched at IoU >= --match-iou, with
+the recording as the reference. The report includes throughput, latency
+(submit to result, so realtime runs include queueing), replayed vs. recorded
+compute time, agreement and the frames that differ most.
+
+Usage:
+    python bench/replay.py recordings/ --model models/yolo.onnx --workers 4 --executor process --output replay.json
+    python bench/replay.py recordings/ --realtime --speed 2 --session phone-1
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Deque, Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from load_gen import percentiles  # noqa: E402
+from quantize import agreement, match_detections  # noqa: E402
+from server.utils.model_registry import COLOR_MODEL, model_path  # noqa: E402
+from server.utils.recorder import RecordingReader  # noqa: E402
+from server.utils.scheduler import _init_worker, run_detection  # noqa: E402
+
+# Recorded frames compared against (None: temporal mode off)
+COMPARED_MODES = (None, "keyframe")
+# ROI modes of comparable frames (None: ROI mode off; "roi" frames only searched regions)
+COMPARED_ROI_MODES = (None, "sweep")
+
+
+def _ready(_: int) -> None:
+    """No-op task; the worker initializer has built (and warmed up) the detector."""
+
+
+def _mark_done(entry: Dict[str, Any], future) -> None:
+    entry["done"] = time.perf_counter()
+
+
+def replay(args) -> Dict[str, Any]:
+    detector_options = {"letterbox": args.letterbox}
+    registry_config = {"models_dir": args.models_dir, "detector_options": detector_options}
+    pool_cls = ProcessPoolExecutor if args.executor == "process" else ThreadPoolExecutor
+    executor = pool_cls(max_workers=args.workers, initializer=_init_worker,
+                        initargs=(args.model, 1, 5.0, detector_options, registry_config))
+    # Warm every worker up before the clock starts
+    list(executor.map(_ready, range(args.workers * 2)))
+
+    entries: List[Dict[str, Any]] = []
+    pending: Deque[Dict[str, Any]] = deque()
+    # Recorded per-request models not found in --models-dir: frames skipped per name
+    missing_models: Dict[str, int] = {}
+    max_inflight = args.workers * 4
+
+    with RecordingReader(args.recording) as reader:
+        records = (r for r in reader if args.session is None or r.meta.get("session_id") == args.session)
+        start = time.perf_counter()
+        first_recv: Optional[float] = None
+        for record in records:
+            if args.limit and len(entries) >= args.limit:
+                break
+            name = record.meta.get("model")
+            if name and name != COLOR_MODEL and model_path(args.models_dir, name) is None:
+                missing_models[name] = missing_models.get(name, 0) + 1
+                continue
+            if args.realtime:
+                first_recv = record.recv_ms if first_recv is None else first_recv
+                delay = start + (record.recv_ms - first_recv) / 1000.0 / args.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                while len(pending) >= max_inflight:
+                    pending.popleft()["future"].result()
+            # Threads decode straight from the mapped segment; processes need a copy
+            frame = record.frame if args.executor == "thread" else bytes(record.frame)
+            options = {} if args.ignore_options else record.meta.get("options") or {}
+            entry = {"seq": record.seq, "meta": record.meta, "submitted": time.perf_counter()}
+            model = (name, 0) if name else None
+            entry["future"] = executor.submit(run_detection, frame, args.model, 0, options, None, None, model)
+            entry["future"].add_done_callback(partial(_mark_done, entry))
+            entries.append(entry)
+            pending.append(entry)
+            del frame, record
+        for entry in pending:
+            entry["future"].result()
+        elapsed = time.perf_counter() - start
+        results = []
+        for entry in entries:
+            results.append(entry.pop("future").result())
+            # Done-callbacks run after result() waiters wake up
+            entry.setdefault("done", time.perf_counter())
+    executor.shutdown()
+
+    latency, compute, recorded_compute = [], [], []
+    reference, candidate, compared = [], [], []
+    errors = 0
+    for entry, result in zip(entries, results):
+        latency.append((entry["done"] - entry["submitted"]) * 1000.0)
+        if "error" in result:
+            errors += 1
+            continue
+        compute.append(sum(result["timings"].values()) * 1000.0)
+        meta = entry["meta"]
+        if meta.get("timings"):
+            recorded_compute.append(sum(meta["timings"].values()) * 1000.0)
+        if ("detections" in meta and meta.get("temporal") in COMPARED_MODES
+                and meta.get("roi") in COMPARED_ROI_MODES):
+            reference.append(meta["detections"])
+            candidate.append(result["detections"])
+            compared.append(entry)
+
+    changed = []
+    for entry, ref, cand in zip(compared, reference, candidate):
+        matched = len(match_detections(ref, cand, args.match_iou))
+        if matched != len(ref) or matched != len(cand):
+            meta = entry["meta"]
+            changed.append({
+                "seq": entry["seq"],
+                "session_id": meta.get("session_id"),
+                "frame_id": meta.get("frame_id"),
+                "recorded": len(ref),
+                "replayed": len(cand),
+                "matched": matched,
+                "unmatched": len(ref) + len(cand) - 2 * matched,
+            })
+    changed.sort(key=lambda c: c["unmatched"], reverse=True)
+
+    return {
+        "recording": args.recording,
+        "model": args.model,
+        "mode": "realtime" if args.realtime else "fast",
+        "speed": args.speed if args.realtime else None,
+        "executor": args.executor,
+        "workers": args.workers,
+        "frames": len(entries),
+        "errors": errors,
+        "skipped_missing_models": missing_models,
+        "elapsed_s": elapsed,
+        "throughput_fps": len(entries) / elapsed if elapsed > 0 else None,
+        "latency_ms": percentiles(latency),
+        "compute_ms": percentiles(compute),
+        "recorded_compute_ms": percentiles(recorded_compute),
+        "diff": {
+            "compared": len(compared),
+            "changed_frames": len(changed),
+            "agreement": agreement(reference, candidate, args.match_iou),
+            "worst": changed[:args.top],
+        },
+    }
+
+
+def print_summary(report: Dict[str, Any]) -> None:
+    fmt = lambda v: "n/a" if v is None else f"{v:.2f}"  # noqa: E731
+    print(f"Replayed {report['frames']} frames ({report['mode']}, {report['workers']} {report['executor']} workers) "
+          f"in {report['elapsed_s']:.2f} s: {fmt(report['throughput_fps'])} fps, {report['errors']} errors")
+    for name, count in report["skipped_missing_models"].items():
+        print(f"  skipped {count} frames recorded with model {name} (not in --models-dir)")
+    for key in ("latency_ms", "compute_ms", "recorded_compute_ms"):
+        p = report[key]
+        print(f"  {key:<20} p50 {fmt(p['p50'])}  p95 {fmt(p['p95'])}  max {fmt(p['max'])}")
+    diff = report["diff"]
+    a = diff["agreement"]
+    print(f"  diff: {diff['changed_frames']}/{diff['compared']} frames changed, precision {fmt(a['precision'])}, "
+          f"recall {fmt(a['recall'])}, mean IoU {fmt(a['mean_iou'])}")
+    for c in diff["worst"]:
+        print(f"    seq {c['seq']} frame {c['frame_id']} ({c['session_id']}): "
+              f"{c['recorded']} recorded, {c['replayed']} replayed, {c['matched']} matched")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="recording directory (RECORD_DIR) or a single .rec segment")
+    parser.add_argument("--model", help="ONNX model for frames recorded without ?model= (default: color detection)")
+    parser.add_argument("--models-dir", default=os.getenv("MODELS_DIR") or "models",
+                        help="directory of the per-request models named in the recording (MODELS_DIR)")
+    parser.add_argument("--letterbox", action="store_true", help="preprocess like MODEL_LETTERBOX=true")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--realtime", action="store_true", help="submit frames at their recorded arrival times")
+    parser.add_argument("--speed", type=float, default=1.0, help="realtime playback speed factor")
+    parser.add_argument("--session", help="only replay this session's frames")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many frames")
+    parser.add_argument("--ignore-options", action="store_true", help="use default thresholds, not the recorded ones")
+    parser.add_argument("--match-iou", type=float, default=0.5)
+    parser.add_argument("--top", type=int, default=10, help="most changed frames listed in the report")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    report = replay(args)
+    print_summary(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
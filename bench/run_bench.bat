@@ -1,6 +1,7 @@
 @echo off
 REM Benchmark script for WebRTC VLM Detection (Windows)
 REM Usage: bench\run_bench.bat --duration 30 --mode server
+REM        bench\run_bench.bat --duration 30 --mode synthetic   (headless, no phone needed)
 
 setlocal enabledelayedexpansion
 
@@ -51,12 +52,19 @@ REM Reset metrics
 echo 📊 Resetting metrics...
 curl -s -X POST http://localhost:%PORT%/api/metrics/reset >nul
 
-echo ⏱️  Running benchmark for %DURATION% seconds...
-echo 📱 Please use your phone to connect and stream video during this time
-echo 🎯 Move colored objects in front of the camera for detection
+if "%MODE%"=="synthetic" (
+    REM Headless: synthetic frames from bench\load_gen.py instead of a phone
+    echo ⏱️  Running synthetic load for %DURATION% seconds...
+    python "%~dp0load_gen.py" --url http://localhost:%PORT% --duration %DURATION% --output load_report.json >nul
+    python "%~dp0parser.py" load_report.json
+) else (
+    echo ⏱️  Running benchmark for %DURATION% seconds...
+    echo 📱 Please use your phone to connect and stream video during this time
+    echo 🎯 Move colored objects in front of the camera for detection
 
-REM Wait for benchmark duration
-timeout /t %DURATION% /nobreak >nul
+    REM Wait for benchmark duration
+    timeout /t %DURATION% /nobreak >nul
+)
 
 REM Collect metrics
 echo 📈 Collecting metrics...
@@ -2,6 +2,7 @@
 
 # Benchmark script for WebRTC VLM Detection
 # Usage: ./bench/run_bench.sh --duration 30 --mode server
+#        ./bench/run_bench.sh --duration 30 --mode synthetic   (headless, no phone needed)
 
 set -e
 
@@ -48,12 +49,20 @@ fi
 echo "📊 Resetting metrics..."
 curl -s -X POST http://localhost:${PORT}/api/metrics/reset > /dev/null
 
-echo "⏱️  Running benchmark for ${DURATION} seconds..."
-echo "📱 Please use your phone to connect and stream video during this time"
-echo "🎯 Move colored objects in front of the camera for detection"
+if [ "${MODE}" = "synthetic" ]; then
+    # Headless: synthetic frames from bench/load_gen.py instead of a phone
+    echo "⏱️  Running synthetic load for ${DURATION} seconds..."
+    python "$(dirname "$0")/load_gen.py" --url http://localhost:${PORT} --duration ${DURATION} \
+        --output load_report.json > /dev/null
+    python "$(dirname "$0")/parser.py" load_report.json
+else
+    echo "⏱️  Running benchmark for ${DURATION} seconds..."
+    echo "📱 Please use your phone to connect and stream video during this time"
+    echo "🎯 Move colored objects in front of the camera for detection"
 
-# Wait for benchmark duration
-sleep ${DURATION}
+    # Wait for benchmark duration
+    sleep ${DURATION}
+fi
 
 # Collect metrics
 echo "📈 Collecting metrics..."
@@ -1,7 +1,33 @@
 import React, { useEffect, useRef, useState } from "react";
-import { startLocalCamera, stopLocalCamera, captureFrame } from "./webrtc.js";
+import { startLocalCamera, stopLocalCamera, captureFrameBlob } from "./webrtc.js";
 import { useFpsMeter } from "./metrics.jsx";
 
+// Signaling room shared by this PC and the phone that scans its QR code.
+// The phone gets it from the ?room= in the QR link; the PC keeps one per tab.
+const getRoomId = () => {
+  const params = new URLSearchParams(window.location.search);
+  let room = params.get("room") || sessionStorage.getItem("signalingRoom");
+  if (!room) {
+    room = Array.from(crypto.getRandomValues(new Uint8Array(8)), (b) => b.toString(16).padStart(2, "0")).join("");
+  }
+  sessionStorage.setItem("signalingRoom", room);
+  return room;
+};
+
+// Capture settings until the server sends its first "control" hint
+const DEFAULT_CAPTURE = { intervalMs: 200, width: 224, height: 224, quality: 0.7 };
+
+// Apply a server capture hint ({interval_ms, width, height, quality}), ignoring missing fields
+const applyCaptureHint = (current, hint) => {
+  if (!hint || typeof hint !== "object") return current;
+  return {
+    intervalMs: Number.isFinite(hint.interval_ms) ? hint.interval_ms : current.intervalMs,
+    width: Number.isFinite(hint.width) ? hint.width : current.width,
+    height: Number.isFinite(hint.height) ? hint.height : current.height,
+    quality: Number.isFinite(hint.quality) ? hint.quality : current.quality,
+  };
+};
+
 export default function App() {
   // Local and Remote video + canvases
   const localVideoRef = useRef(null);
@@ -23,6 +49,8 @@ export default function App() {
   const detectionWsRef = useRef(null);
   const peerRef = useRef(null);
   const inFlightRef = useRef(false);
+  const captureRef = useRef(DEFAULT_CAPTURE);
+  const roomIdRef = useRef(getRoomId());
 
   // Helper: resolve WS base for same-origin WebSocket
   const wsBase = `${window.location.protocol === 'https:' ? 'wss' : 'ws'}://${window.location.host}`;
@@ -30,7 +58,7 @@ export default function App() {
   // Fetch QR (server returns HTML with <img src='data:...'>)
   const fetchQr = async () => {
     try {
-      const res = await fetch(`/api/qr`, {
+      const res = await fetch(`/api/qr?room=${encodeURIComponent(roomIdRef.current)}`, {
         headers: { 'ngrok-skip-browser-warning': 'true' }
       });
       if (!res.ok) return;
@@ -182,7 +210,7 @@ export default function App() {
     };
 
     // Connect to signaling server
-    signalingRef.current = new WebSocket(`${wsBase}/ws`);
+    signalingRef.current = new WebSocket(`${wsBase}/ws?room=${encodeURIComponent(roomIdRef.current)}`);
     
     const send = (message) => {
       if (signalingRef.current.readyState === WebSocket.OPEN) {
@@ -296,24 +324,29 @@ export default function App() {
       // Frame capture loop - detect only on remote camera
       const tickDetect = async () => {
         if (!inFlightRef.current && remoteVideoRef.current && remoteVideoRef.current.readyState >= 2 && connectionStatus === 'connected') {
-          const frame = captureFrame(remoteVideoRef.current, 224, 224);
-          if (frame) {
-            inFlightRef.current = true;
-            fetch(`/api/detect`, {
+          inFlightRef.current = true;
+          const captureTs = Date.now();
+          const { width, height, quality } = captureRef.current;
+          captureFrameBlob(remoteVideoRef.current, width, height, quality).then((frame) => {
+            if (!frame) return;
+            // Raw JPEG body; metadata travels in headers
+            return fetch(`/api/detect`, {
               method: "POST",
-              headers: { 
-                "Content-Type": "application/json",
+              headers: {
+                "Content-Type": "application/octet-stream",
+                "X-Frame-Id": String(captureTs),
+                "X-Capture-Ts": String(captureTs),
+                "X-Session-Id": roomIdRef.current,
                 "ngrok-skip-browser-warning": "true"
               },
-              body: JSON.stringify({ 
-                image: frame, 
-                frame_id: String(Date.now()), 
-                capture_ts: Date.now()
-              })
-            }).finally(() => { inFlightRef.current = false; });
-          }
+              body: frame
+            });
+          }).then((res) => (res && res.ok ? res.json() : null)).then((data) => {
+            // Server-recommended interval / size / quality for the next frames
+            if (data && data.control) captureRef.current = applyCaptureHint(captureRef.current, data.control);
+          }).catch(() => {}).finally(() => { inFlightRef.current = false; });
         }
-        loopId = window.setTimeout(tickDetect, 200);
+        loopId = window.setTimeout(tickDetect, captureRef.current.intervalMs);
       };
       tickDetect();
     }
@@ -55,29 +55,45 @@ export function stopLocalCamera(videoEl) {
   }
 }
 
-export function captureFrame(videoEl, targetW, targetH) {
-  try {
-    if (!videoEl) return null;
+function drawToCaptureCanvas(videoEl, targetW, targetH) {
+  if (!videoEl) return null;
 
-    const vw = videoEl.videoWidth || 0;
-    const vh = videoEl.videoHeight || 0;
-    const w = targetW && targetH ? targetW : vw;
-    const h = targetW && targetH ? targetH : vh;
-    if (!w || !h) return null;
+  const vw = videoEl.videoWidth || 0;
+  const vh = videoEl.videoHeight || 0;
+  const w = targetW && targetH ? targetW : vw;
+  const h = targetW && targetH ? targetH : vh;
+  if (!w || !h) return null;
 
-    // Reuse canvas to avoid memory allocation overhead
-    if (!captureCanvas) {
-      captureCanvas = document.createElement('canvas');
-    }
-    captureCanvas.width = w;
-    captureCanvas.height = h;
+  // Reuse canvas to avoid memory allocation overhead
+  if (!captureCanvas) {
+    captureCanvas = document.createElement('canvas');
+  }
+  if (captureCanvas.width !== w) captureCanvas.width = w;
+  if (captureCanvas.height !== h) captureCanvas.height = h;
 
-    const ctx = captureCanvas.getContext('2d');
-    ctx.drawImage(videoEl, 0, 0, w, h);
+  const ctx = captureCanvas.getContext('2d');
+  ctx.drawImage(videoEl, 0, 0, w, h);
+  return captureCanvas;
+}
 
-    return captureCanvas.toDataURL('image/jpeg', 0.7);
+export function captureFrame(videoEl, targetW, targetH) {
+  try {
+    const canvas = drawToCaptureCanvas(videoEl, targetW, targetH);
+    return canvas ? canvas.toDataURL('image/jpeg', 0.7) : null;
   } catch (error) {
     console.error('Frame capture failed:', error);
     return null;
   }
 }
+
+// Binary variant: resolves to a JPEG Blob (no base64 inflation), or null
+export function captureFrameBlob(videoEl, targetW, targetH, quality = 0.7) {
+  try {
+    const canvas = drawToCaptureCanvas(videoEl, targetW, targetH);
+    if (!canvas) return Promise.resolve(null);
+    return new Promise((resolve) => canvas.toBlob(resolve, 'image/jpeg', quality));
+  } catch (error) {
+    console.error('Frame capture failed:', error);
+    return Promise.resolve(null);
+  }
+}
@@ -1,21 +1,34 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Body, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-import qrcode
-import io
+import asyncio
 import base64
-import requests
 import os
-import cv2
-import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Mapping, Optional
 import json
 from pathlib import Path
 import time
-
-# Import the VLM detector (absolute import to avoid missing top-level 'utils')
-from server.utils.vlm_detector import VLMDetector, draw_detections
+import html
+from urllib.parse import urlencode
+
+# Absolute imports to avoid missing top-level 'utils'
+from server.utils.scheduler import InferenceScheduler
+from server.utils.temporal import TemporalGate
+from server.utils.tiling import RoiPlanner
+from server.utils.frame_codec import append_json_fields, decode_binary_frame, encode_json
+from server.utils.broadcast import DetectionBroadcaster
+from server.utils.signaling import DEFAULT_ROOM, SignalingRooms
+from server.utils.onnx_session import session_config_from_env
+from server.utils.metrics import MetricsRegistry, MetricsPersister
+from server.utils.instrumentation import Instrumentation, SamplingProfiler
+from server.utils.shared_state import create_backend
+from server.utils.rate_control import RateController
+from server.utils.discovery import QrCache, UrlDiscovery
+from server.utils.model_registry import COLOR_MODEL, ModelCatalog
+from server.utils.recorder import FrameRecorder
+from server.utils.preview import MJPEG_BOUNDARY, PreviewHub
+from server.utils.video import VideoFrameReader, VideoJobStats, detect_video, resolve_video_path, spool_to_file
 
 app = FastAPI()
 
@@ -23,8 +36,6 @@ app = FastAPI()
 BASE_DIR = Path(__file__).resolve().parent
 CLIENT_DIST = (BASE_DIR.parent / "client" / "dist").resolve()
 
-from fastapi.responses import FileResponse
-
 # Check if we should serve built files or proxy to dev server
 SERVE_BUILT = os.getenv("SERVE_BUILT", "false").lower() == "true"
 
@@ -49,42 +60,114 @@ async def bypass_page():
             return FileResponse(str(bypass_file))
     return FileResponse(str(BASE_DIR.parent / "client" / "public" / "bypass.html"))
 
-# Initialize the VLM detector
-detector = VLMDetector()
+# Optional motion gating: full detection only on keyframes, tracked boxes in between
+TEMPORAL_MODE = os.getenv("TEMPORAL_MODE", "false").lower() == "true"
+temporal_gate = TemporalGate(
+    keyframe_interval=int(os.getenv("TEMPORAL_KEYFRAME_INTERVAL", "10")),
+    static_fraction=float(os.getenv("TEMPORAL_STATIC_FRACTION", "0.002")),
+    scene_change_fraction=float(os.getenv("TEMPORAL_SCENE_CHANGE_FRACTION", "0.3")),
+) if TEMPORAL_MODE else None
+
+# Optional region-of-interest detection: between full-frame sweeps only the
+# areas around each session's previous detections are searched
+ROI_MODE = os.getenv("ROI_MODE", "false").lower() == "true"
+roi_planner = RoiPlanner(
+    sweep_interval=int(os.getenv("ROI_SWEEP_INTERVAL", "10")),
+    margin=float(os.getenv("ROI_MARGIN", "0.5")),
+    max_coverage=float(os.getenv("ROI_MAX_COVERAGE", "0.5")),
+) if ROI_MODE else None
+
+# Large frames can go through the model as overlapping native-resolution tiles
+tiling_options = {
+    "tiling": os.getenv("TILING_ENABLED", "false").lower() == "true",
+    "tile_overlap": float(os.getenv("TILE_OVERLAP", "0.2")),
+    "tile_min_side": int(os.getenv("TILE_MIN_SIDE", "1280")),
+}
 
-def get_local_ip():
-    """Get the local network IP address."""
-    try:
-        import socket
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except Exception:
-        return "localhost"
-
-def get_tunnel_url():
-    """Check for active tunnel services."""
-    # Check ngrok API for single tunnel
-    try:
-        resp = requests.get("http://127.0.0.1:4040/api/tunnels", timeout=2).json()
-        for tunnel in resp["tunnels"]:
-            if ":8000" in tunnel["config"]["addr"] or ":5173" in tunnel["config"]["addr"]:
-                public_url = tunnel["public_url"]
-                return public_url, public_url  # Same URL for both frontend and backend
-    except:
-        pass
-    
-    # Fallback to local IP
-    local_ip = get_local_ip()
-    serve_built = os.getenv("SERVE_BUILT", "false").lower() == "true"
-    if serve_built:
-        return f"http://{local_ip}:8000", f"http://{local_ip}:8000"
-    else:
-        return f"http://{local_ip}:5173", f"http://{local_ip}:5173"
+# Extra ONNX models (<name>.onnx) selectable per request with ?model=<name>
+MODELS_DIR = os.getenv("MODELS_DIR") or str(BASE_DIR.parent / "models")
+model_catalog = ModelCatalog(MODELS_DIR)
+
+# Inference runs on a worker pool (one VLMDetector per worker) so the event loop stays free
+scheduler = InferenceScheduler(
+    workers=int(os.getenv("INFERENCE_WORKERS", "2")),
+    executor=os.getenv("INFERENCE_EXECUTOR", "thread"),
+    queue_size=int(os.getenv("INFERENCE_QUEUE_SIZE", "1")),
+    model_path=os.getenv("VLM_MODEL_PATH") or None,
+    batch_max_size=int(os.getenv("BATCH_MAX_SIZE", "1")),
+    batch_max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", "5")),
+    detector_options={
+        "mask_scale": float(os.getenv("COLOR_MASK_SCALE", "1.0")),
+        "letterbox": os.getenv("MODEL_LETTERBOX", "false").lower() == "true",
+        "session_config": session_config_from_env(),
+        "warmup_runs": int(os.getenv("MODEL_WARMUP_RUNS", "1")),
+        **tiling_options,
+    },
+    temporal=temporal_gate,
+    registry_config={
+        "models_dir": MODELS_DIR,
+        "memory_budget_mb": float(os.getenv("MODEL_MEMORY_BUDGET_MB", "1024")),
+        "session_config": session_config_from_env(),
+        "warmup_runs": int(os.getenv("MODEL_WARMUP_RUNS", "1")),
+        "detector_options": {
+            "mask_scale": float(os.getenv("COLOR_MASK_SCALE", "1.0")),
+            "letterbox": os.getenv("MODEL_LETTERBOX", "false").lower() == "true",
+            **tiling_options,
+        },
+    },
+    roi=roi_planner,
+)
+
+@app.on_event("shutdown")
+async def shutdown_scheduler():
+    await broadcaster.close()
+    await state.close()
+    await discovery.close()
+    if recorder is not None:
+        await asyncio.to_thread(recorder.close)
+    scheduler.shutdown()
+
+def parse_detect_options(*sources: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Collect per-request detection thresholds (conf_threshold, iou_threshold, top_k).
+
+    Later sources override earlier ones, e.g. query params then body fields.
+    """
+    options: Dict[str, Any] = {}
+    for source in sources:
+        for key, cast in (("conf_threshold", float), ("iou_threshold", float), ("top_k", int)):
+            value = source.get(key)
+            if value is not None and value != "":
+                options[key] = cast(value)
+    return options
+
+def parse_model(*sources: Mapping[str, Any]) -> Optional[str]:
+    """Requested model name (model query/body field or X-Model header), first source wins."""
+    for source in sources:
+        for key in ("model", "X-Model"):
+            value = source.get(key)
+            if value:
+                return str(value)
+    return None
+
+def get_session_id(request: Request, frame_data: Dict[str, Any]) -> str:
+    """Identify the streaming session a frame belongs to."""
+    session_id = request.headers.get("X-Session-Id") or frame_data.get("session_id")
+    if session_id:
+        return str(session_id)
+    return request.client.host if request.client else "default"
+
+# Tunnel / LAN URL for the QR code, refreshed off the event loop
+discovery = UrlDiscovery(
+    serve_built=SERVE_BUILT,
+    ttl_s=float(os.getenv("URL_DISCOVERY_TTL_S", "30")),
+)
+qr_cache = QrCache()
+
+@app.on_event("startup")
+async def start_discovery():
+    await discovery.start()
 
-# Removed ngrok function - using local IP only
 
 # Allow all origins for development (less secure but more flexible)
 app.add_middleware(
@@ -95,73 +178,181 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-peers = []
-detection_clients = []
+# Signaling peers, indexed by room (one phone/PC pair per room)
+rooms = SignalingRooms(max_peers_per_room=int(os.getenv("SIGNALING_MAX_PEERS", "2")))
+
+# Metrics: fixed-memory histograms updated per frame; metrics.json writes are rate-limited
+metrics = MetricsRegistry(
+    windows=(10, 60),
+    max_sessions=int(os.getenv("METRICS_MAX_SESSIONS", "64")),
+)
+metrics_persister = MetricsPersister(
+    (BASE_DIR.parent / "metrics.json").resolve(),
+    min_interval_s=float(os.getenv("METRICS_PERSIST_INTERVAL_S", "5")),
+)
+
+# Shared state between uvicorn workers: "memory" for one worker, "unix" for
+# several on one host (signaling, detection fan-out and metrics are relayed)
+state = create_backend(os.getenv("STATE_BACKEND", "memory"), os.getenv("STATE_SOCKET_PATH") or None)
 
-# Metrics state
-metrics_state = {
-    "frames": [],  # list of {frame_id, capture_ts, recv_ts, inference_ts, overlay_display_ts}
-    "uplink_bytes": 0,
-    "downlink_bytes": 0,
-    "start_ts": None,
+_METRIC_EVENTS = {
+    "reset": metrics.reset,
+    "frame": metrics.record_frame,
+    "uplink": metrics.record_uplink,
+    "downlink": metrics.record_downlink,
 }
 
+
+def record_metric(event: str, *args) -> None:
+    """Apply a metrics event to this worker's registry and replicate it to the others."""
+    _METRIC_EVENTS[event](*args)
+    state.publish("metrics", [event, *args])
+
+
+def _apply_remote_metric(message: List[Any]) -> None:
+    event, *args = message
+    _METRIC_EVENTS[event](*args)
+
+# Per-stage hot-path timings and counters, exposed in Prometheus text format
+instrumentation = Instrumentation()
+
+
+def _count_downlink(nbytes: int, session_id: Optional[str]) -> None:
+    record_metric("downlink", session_id, nbytes)
+    instrumentation.inc("bytes_out_total", nbytes, "Detection result bytes broadcast")
+
+
+# Each /ws/detection viewer gets its own bounded queue and sender task
+broadcaster = DetectionBroadcaster(
+    queue_size=int(os.getenv("BROADCAST_QUEUE_SIZE", "2")),
+    send_timeout_s=float(os.getenv("BROADCAST_SEND_TIMEOUT_S", "5")),
+    on_sent=_count_downlink,
+)
+
+instrumentation.gauge("detection_clients", "Connected /ws/detection clients", lambda: len(broadcaster))
+instrumentation.gauge("signaling_peers", "Connected /ws signaling peers", lambda: len(rooms))
+instrumentation.gauge("inference_queue_depth", "Frames waiting for a worker", lambda: scheduler.stats()["queue_depth"])
+instrumentation.gauge("inference_in_flight", "Frames being decoded or inferred", lambda: scheduler.stats()["in_flight"])
+
+# Capture hints (interval, size, JPEG quality) returned to each client under "control"
+RATE_CONTROL = os.getenv("RATE_CONTROL", "false").lower() == "true"
+rate_controller = RateController(
+    min_interval_ms=float(os.getenv("RATE_MIN_INTERVAL_MS", "33")),
+    max_interval_ms=float(os.getenv("RATE_MAX_INTERVAL_MS", "1000")),
+    target_interval_ms=float(os.getenv("RATE_TARGET_INTERVAL_MS", "66")),
+    wait_budget_ms=float(os.getenv("RATE_WAIT_BUDGET_MS", "30")),
+) if RATE_CONTROL else None
+
+# Opt-in: POST /api/debug/profile captures a sampled CPU profile of the detect path
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+profiler = SamplingProfiler()
+
+# Server-rendered annotated preview (/api/preview.mjpg); frames are only drawn while watched
+PREVIEW_ENABLED = os.getenv("PREVIEW_ENABLED", "true").lower() == "true"
+preview_hub = PreviewHub(
+    max_fps=float(os.getenv("PREVIEW_MAX_FPS", "10")),
+    max_width=int(os.getenv("PREVIEW_MAX_WIDTH", "640")),
+    max_height=int(os.getenv("PREVIEW_MAX_HEIGHT", "480")),
+    quality=int(os.getenv("PREVIEW_QUALITY", "70")),
+) if PREVIEW_ENABLED else None
+
+# Opt-in recording of received frames + results for offline replay (bench/replay.py)
+RECORD_DIR = os.getenv("RECORD_DIR") or None
+recorder = FrameRecorder(
+    RECORD_DIR,
+    segment_bytes=int(float(os.getenv("RECORD_SEGMENT_MB", "64")) * 2**20),
+    max_bytes=int(float(os.getenv("RECORD_MAX_MB", "1024")) * 2**20),
+    queue_size=int(os.getenv("RECORD_QUEUE_SIZE", "256")),
+) if RECORD_DIR else None
+
+@app.on_event("startup")
+async def start_recorder():
+    if recorder is not None:
+        recorder.start()
+
+@app.on_event("startup")
+async def start_shared_state():
+    # Events from other workers: apply to local replicas and local sockets only
+    state.subscribe("metrics", _apply_remote_metric)
+    state.subscribe("detections", lambda message: broadcaster.publish(
+        broadcaster.encode_json_payload(message["result"].encode("utf-8")), message["session_id"]))
+    state.subscribe("signaling", lambda message: rooms.relay(message["room"], None, message["data"]))
+    await state.start()
+
 @app.websocket("/ws")
 @app.websocket("/api/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """
+    Signaling relay. Peers join the room given by ?room= (the id carried in the
+    QR code link); messages only reach the other peer(s) of that room.
+    """
+    room_id = websocket.query_params.get("room") or DEFAULT_ROOM
     await websocket.accept()
-    peers.append(websocket)
+    peer_id = rooms.join(room_id, websocket)
+    if peer_id is None:
+        await websocket.send_text(json.dumps({"error": "Room is full"}))
+        await websocket.close()
+        return
     try:
         while True:
             data = await websocket.receive_text()
-            # Relay to all other peers
-            for peer in peers[:]:
-                if peer != websocket:
-                    try:
-                        await peer.send_text(data)
-                    except:
-                        peers.remove(peer)
+            # The counterpart may be connected to another worker
+            state.publish("signaling", {"room": room_id, "data": data})
+            await rooms.relay(room_id, peer_id, data)
     except WebSocketDisconnect:
-        if websocket in peers:
-            peers.remove(websocket)
+        pass
+    finally:
+        rooms.leave(room_id, peer_id)
 
 @app.websocket("/ws/detection")
 @app.websocket("/api/ws/detection")
 async def detection_websocket(websocket: WebSocket):
-    """WebSocket endpoint for real-time detection results."""
+    """
+    WebSocket endpoint for real-time detection results.
+
+    JSON text messages by default; ?encoding=binary sends the compact binary
+    layout from server/utils/frame_codec.py instead.
+    """
+    encoding = websocket.query_params.get("encoding", "json")
     await websocket.accept()
-    detection_clients.append(websocket)
+    try:
+        subscriber = broadcaster.register(websocket, encoding)
+    except ValueError as e:
+        await websocket.send_text(json.dumps({"error": str(e)}))
+        await websocket.close()
+        return
     try:
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
     except WebSocketDisconnect:
-        if websocket in detection_clients:
-            detection_clients.remove(websocket)
+        pass
+    finally:
+        broadcaster.unregister(subscriber)
 
 @app.post("/metrics/reset")
 @app.post("/api/metrics/reset")
 async def metrics_reset():
-    metrics_state["frames"] = []
-    metrics_state["uplink_bytes"] = 0
-    metrics_state["downlink_bytes"] = 0
-    metrics_state["start_ts"] = int(time.time() * 1000)
+    record_metric("reset")
     return {"ok": True}
 
 @app.post("/metrics/frame")
 @app.post("/api/metrics/frame")
-async def metrics_frame(data: Dict[str, Any] = Body(...)):
-    # Expect: frame_id, capture_ts, recv_ts, inference_ts, overlay_display_ts
+async def metrics_frame(request: Request, data: Dict[str, Any] = Body(...)):
+    # Expect: frame_id, capture_ts, recv_ts, inference_ts, overlay_display_ts (optional session_id)
     try:
         required = ["frame_id", "capture_ts", "recv_ts", "inference_ts", "overlay_display_ts"]
         if not all(k in data for k in required):
             return {"error": "missing required fields"}
-        metrics_state["frames"].append({
-            "frame_id": data["frame_id"],
-            "capture_ts": int(data["capture_ts"]),
-            "recv_ts": int(data["recv_ts"]),
-            "inference_ts": int(data["inference_ts"]),
-            "overlay_display_ts": int(data["overlay_display_ts"]),
-        })
+        record_metric(
+            "frame",
+            get_session_id(request, data),
+            int(data["capture_ts"]),
+            int(data["recv_ts"]),
+            int(data["inference_ts"]),
+            int(data["overlay_display_ts"]),
+        )
         return {"ok": True}
     except Exception as e:
         return {"error": str(e)}
@@ -169,70 +360,250 @@ async def metrics_frame(data: Dict[str, Any] = Body(...)):
 @app.get("/metrics")
 @app.get("/api/metrics")
 async def metrics_get():
-    # Compute metrics over collected frames
-    import statistics
-    frames = metrics_state["frames"]
-    if len(frames) == 0:
-        result = {
-            "count_frames": 0,
-            "median_e2e_ms": None,
-            "p95_e2e_ms": None,
-            "server_latency_median_ms": None,
-            "network_latency_median_ms": None,
-            "processed_fps": 0,
-            "uplink_kbps": 0,
-            "downlink_kbps": 0,
-        }
-    else:
-        e2e = [(f["overlay_display_ts"] - f["capture_ts"]) for f in frames if f["overlay_display_ts"] >= f["capture_ts"]]
-        server_lat = [(f["inference_ts"] - f["recv_ts"]) for f in frames if f["inference_ts"] >= f["recv_ts"]]
-        net_lat = [(f["recv_ts"] - f["capture_ts"]) for f in frames if f["recv_ts"] >= f["capture_ts"]]
-        duration_ms = (
-            (max(f["overlay_display_ts"] for f in frames) - metrics_state["start_ts"]) if metrics_state["start_ts"] else (max(f["overlay_display_ts"] for f in frames) - min(f["capture_ts"] for f in frames))
-        )
-        duration_s = max(1e-3, duration_ms / 1000.0)
-        processed_fps = len(frames) / duration_s
-        uplink_kbps = (metrics_state["uplink_bytes"] * 8) / duration_s / 1000.0
-        downlink_kbps = (metrics_state["downlink_bytes"] * 8) / duration_s / 1000.0
-
-        def p95(vals):
-            if not vals:
-                return None
-            vals_sorted = sorted(vals)
-            idx = int(0.95 * (len(vals_sorted) - 1))
-            return vals_sorted[idx]
-
-        result = {
-            "count_frames": len(frames),
-            "median_e2e_ms": statistics.median(e2e) if e2e else None,
-            "p95_e2e_ms": p95(e2e),
-            "server_latency_median_ms": statistics.median(server_lat) if server_lat else None,
-            "network_latency_median_ms": statistics.median(net_lat) if net_lat else None,
-            "processed_fps": processed_fps,
-            "uplink_kbps": uplink_kbps,
-            "downlink_kbps": downlink_kbps,
-        }
-
-    # Persist metrics.json at repo root
+    # Totals since reset keep the original keys; windows/sessions are added alongside
+    result = metrics.snapshot()
+    result["scheduler"] = scheduler.stats()
+    result["stages"] = instrumentation.stage_summary()
+    result["broadcast"] = broadcaster.stats()
+    result["signaling"] = rooms.stats()
+    result["state"] = state.stats()
+    if rate_controller is not None:
+        result["rate_control"] = rate_controller.stats()
+    if recorder is not None:
+        result["recorder"] = recorder.stats()
+    if preview_hub is not None:
+        result["preview"] = preview_hub.stats()
+
+    # Persist metrics.json at repo root, off the event loop
+    metrics_persister.maybe_persist(asyncio.get_running_loop(), result)
+
+    return result
+
+@app.get("/metrics/prometheus")
+@app.get("/api/metrics/prometheus")
+async def metrics_prometheus():
+    """Stage histograms, counters and gauges in the Prometheus text exposition format."""
+    return PlainTextResponse(instrumentation.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/models")
+@app.get("/api/models")
+async def models_get():
+    """Selectable models, per-model frame counts/latency and (thread executor) what is loaded."""
+    result = model_catalog.stats()
+    result["registry"] = scheduler.model_stats()
+    return result
+
+@app.post("/models/{name}/reload")
+@app.post("/api/models/{name}/reload")
+async def models_reload(name: str):
+    """
+    Hot-swap a model after its .onnx file was replaced (or make a newly
+    added file selectable).
+
+    With the thread executor the new version is loaded and warmed up before
+    requests switch to it; process workers reload it on their next frame.
+    Frames already running finish on the old version.
+    """
+    if name == COLOR_MODEL:
+        return JSONResponse({"error": "The color detector has nothing to reload"}, status_code=400)
+    await asyncio.to_thread(model_catalog.refresh)
+    try:
+        model_catalog.resolve(name)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+    generation = model_catalog.next_generation(name)
     try:
-        metrics_path = (BASE_DIR.parent / "metrics.json").resolve()
-        with open(metrics_path, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2)
+        loaded = await scheduler.preload_model(name, generation)
     except Exception as e:
-        print(f"Failed to write metrics.json: {e}")
+        return JSONResponse({"error": f"Failed to load model {name}: {e}"}, status_code=500)
+    model_catalog.activate(name, generation)
+    return {"ok": True, "model": name, "generation": generation, "load": loaded}
 
-    return result
+@app.post("/debug/profile")
+@app.post("/api/debug/profile")
+async def debug_profile(seconds: float = 5.0, interval_ms: float = 5.0, format: str = "collapsed"):
+    """
+    Sample the detect path for a few seconds (requires PROFILER_ENABLED=true).
+
+    Returns collapsed stacks as text (format=collapsed, for flamegraph tools)
+    or the raw sample counts as JSON (format=json).
+    """
+    if not PROFILER_ENABLED:
+        return JSONResponse({"error": "Profiler disabled; set PROFILER_ENABLED=true"}, status_code=404)
+    seconds = min(max(seconds, 0.1), 60.0)
+    result = await asyncio.to_thread(profiler.profile, seconds, interval_ms)
+    if format == "json" or "error" in result:
+        return result
+    return PlainTextResponse(SamplingProfiler.collapsed(result))
+
+def rate_hint(
+    session_id: str,
+    nbytes: int,
+    capture_ts: Any,
+    arrived_ms: float,
+    job: Optional[Dict[str, Any]],
+) -> Optional[Dict[str, Any]]:
+    """
+    Feed one frame's timings to the rate controller and return the client's
+    next capture hint (None when RATE_CONTROL is off).
+
+    Args:
+        session_id: Streaming session the frame belongs to
+        nbytes: Encoded image size
+        capture_ts: Client capture timestamp in ms
+        arrived_ms: Server time in ms once the image was fully received
+        job: Scheduler result, or None if the frame was dropped
+    """
+    if rate_controller is None:
+        return None
+    try:
+        upload_ms: Optional[float] = arrived_ms - int(capture_ts)
+    except (TypeError, ValueError):
+        upload_ms = None
+    if upload_ms is not None and not 0 <= upload_ms <= 10000:
+        upload_ms = None  # client and server clocks aren't comparable
+    compute_ms = wait_ms = None
+    if job is not None:
+        compute_ms = sum(job.get("timings", {}).values()) * 1000.0
+        wait_ms = time.time() * 1000 - arrived_ms - compute_ms
+    return rate_controller.observe(session_id, nbytes, upload_ms, compute_ms, wait_ms, job is None, scheduler.load())
+
+def record_frame(
+    session_id: str,
+    image_bytes: bytes,
+    offset: int,
+    frame_id: Any,
+    capture_ts: Any,
+    recv_ts: int,
+    options: Optional[Dict[str, Any]],
+    model: Optional[str],
+    outcome: Dict[str, Any],
+) -> None:
+    """Queue a frame and its outcome for the recorder (no-op unless RECORD_DIR is set)."""
+    if recorder is None:
+        return
+    meta = {"session_id": session_id, "frame_id": frame_id, "options": options or {}, "model": model, **outcome}
+    recorder.record(memoryview(image_bytes)[offset:], recv_ts, capture_ts, meta)
+
+async def process_frame(
+    session_id: str,
+    image_bytes: bytes,
+    frame_id: Any,
+    capture_ts: Any,
+    recv_ts: int,
+    offset: int = 0,
+    options: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+) -> bytes:
+    """
+    Run detection on an encoded frame, broadcast the result and return it.
+
+    The result is serialized once; the returned JSON bytes are the same
+    payload the detection viewers receive, plus this client's capture hint
+    under "control" when rate control is on.
+
+    Args:
+        session_id: Streaming session the frame belongs to
+        image_bytes: Buffer holding the encoded image (decoded in place)
+        frame_id: Client frame identifier
+        capture_ts: Client capture timestamp in ms
+        recv_ts: Server receive timestamp in ms
+        offset: Byte offset of the image within image_bytes
+        options: Per-request detection thresholds (see parse_detect_options)
+        model: Registry model name or "color"; None uses the server default
+    """
+    try:
+        model_spec = model_catalog.resolve(model)
+    except ValueError as e:
+        return encode_json({"error": str(e)})
+
+    arrived_ms = time.time() * 1000
+    # Track uplink bytes (actual image bytes)
+    record_metric("uplink", session_id, len(image_bytes) - offset)
+    instrumentation.inc("bytes_in_total", len(image_bytes) - offset, "Encoded image bytes received")
+
+    # Decode + detect on the worker pool; stale frames are dropped in favor of newer ones
+    preview = preview_hub.render_options(session_id) if preview_hub is not None else None
+    job = await scheduler.submit(session_id, image_bytes, offset, options, model_spec, preview)
+    if job is None:
+        instrumentation.inc("frames_dropped_total", 1, "Frames superseded by a newer frame before inference")
+        record_frame(session_id, image_bytes, offset, frame_id, capture_ts, recv_ts, options, model, {"dropped": True})
+        dropped = {"frame_id": frame_id if frame_id is not None else "unknown", "dropped": True}
+        hint = rate_hint(session_id, len(image_bytes) - offset, capture_ts, arrived_ms, None)
+        if hint is not None:
+            dropped["control"] = hint
+        return encode_json(dropped)
+    if model_spec is not None:
+        model_catalog.record(model_spec[0], job)
+    if "error" in job:
+        instrumentation.inc("frames_failed_total", 1, "Frames that failed to decode or detect")
+        record_frame(session_id, image_bytes, offset, frame_id, capture_ts, recv_ts, options, model, {"error": job["error"]})
+        return encode_json({"error": job["error"]})
+    instrumentation.inc("frames_processed_total", 1, "Frames run through detection")
+    instrumentation.observe_many(job.get("timings"))
+    if "preview" in job:
+        preview_hub.publish(session_id, job.pop("preview"))
+
+    # Workers already return normalized, clamped contract detections
+    detections_contract = job["detections"]
+    inference_ts = int(time.time() * 1000)
+
+    result = {
+        "frame_id": frame_id if frame_id is not None else "unknown",
+        "capture_ts": int(capture_ts) if capture_ts is not None else None,
+        "recv_ts": recv_ts,
+        "inference_ts": inference_ts,
+        "detections": detections_contract,
+    }
+    if "mode" in job:
+        # keyframe (full detection), flow (tracked boxes) or static (cached)
+        result["temporal"] = job["mode"]
+    if "roi" in job:
+        # sweep (whole frame) or roi (regions around the previous detections)
+        result["roi"] = job["roi"]
+    if model_spec is not None:
+        result["model"] = model_spec[0]
+    record_frame(session_id, image_bytes, offset, frame_id, capture_ts, recv_ts, options, model, {
+        "detections": detections_contract,
+        "width": job.get("width"),
+        "height": job.get("height"),
+        "timings": job.get("timings"),
+        "temporal": job.get("mode"),
+        "roi": job.get("roi"),
+        "inference_ts": inference_ts,
+    })
+
+    # Serialize once per encoding, then hand off to the per-viewer senders;
+    # slow viewers never hold up this frame's response
+    with instrumentation.time("serialize"):
+        payloads = broadcaster.encode(result)
+    with instrumentation.time("broadcast"):
+        broadcaster.publish(payloads, session_id)
+        state.publish("detections", {"session_id": session_id, "result": payloads["json"].decode("utf-8")})
+
+    hint = rate_hint(session_id, len(image_bytes) - offset, capture_ts, arrived_ms, job)
+    if hint is None:
+        return payloads["json"]
+    return append_json_fields(payloads["json"], {"control": hint})
 
 @app.post("/detect")
 @app.post("/api/detect")
-async def detect_objects(request: Request, frame_data: Dict[str, Any] = Body(...)):
+async def detect_objects(request: Request):
     """
     Process a frame and return detection results following the specified contract.
 
-    Expects JSON body with:
-      - image: base64 data URL or base64 string
-      - frame_id: optional string/int
-      - capture_ts: optional ms timestamp from client
+    Accepts one of:
+      - application/octet-stream (or image/*) body with the raw encoded image;
+        metadata in X-Frame-Id / X-Capture-Ts headers
+      - multipart/form-data with an "image" file part and optional
+        frame_id / capture_ts fields
+      - JSON body (fallback) with:
+          - image: base64 data URL or base64 string
+          - frame_id: optional string/int
+          - capture_ts: optional ms timestamp from client
+
+    Optional conf_threshold / iou_threshold / top_k may be given as query
+    parameters (any format) or as JSON/form fields.
     """
     try:
         # Basic CSRF protection (skip for ngrok)
@@ -240,86 +611,239 @@ async def detect_objects(request: Request, frame_data: Dict[str, Any] = Body(...
             return {"error": "Invalid request"}
             
         recv_ts = int(time.time() * 1000)
-
-        # Extract metadata
-        frame_id = frame_data.get("frame_id")
-        capture_ts = frame_data.get("capture_ts")
-
-        # Extract image data from base64
-        image_data = frame_data.get("image", "")
-        if not image_data:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+        if content_type == "application/octet-stream" or content_type.startswith("image/"):
+            image_bytes = await request.body()
+            frame_id = request.headers.get("X-Frame-Id")
+            capture_ts = request.headers.get("X-Capture-Ts")
+            frame_data: Dict[str, Any] = {}
+        elif content_type == "multipart/form-data":
+            form = await request.form()
+            upload = form.get("image")
+            image_bytes = await upload.read() if hasattr(upload, "read") else b""
+            frame_id = form.get("frame_id")
+            capture_ts = form.get("capture_ts")
+            frame_data = dict(form)
+            frame_data.pop("image", None)
+        else:
+            frame_data = await request.json()
+            frame_id = frame_data.get("frame_id")
+            capture_ts = frame_data.get("capture_ts")
+
+            # Extract image data from base64
+            image_data = frame_data.get("image", "")
+            if not image_data:
+                return {"error": "No image data provided"}
+
+            # Remove data URL prefix if present
+            if image_data.startswith("data:image"):
+                image_data = image_data.split(",")[1]
+
+            with instrumentation.time("base64_decode"):
+                image_bytes = base64.b64decode(image_data)
+
+        if not image_bytes:
             return {"error": "No image data provided"}
 
-        # Remove data URL prefix if present
-        if image_data.startswith("data:image"):
-            image_data = image_data.split(",")[1]
-
-        # Decode base64 image
-        # Track uplink bytes (approx actual image bytes)
-        image_bytes = base64.b64decode(image_data)
-        metrics_state["uplink_bytes"] += len(image_bytes)
-        image_array = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-
-        if frame is None:
-            return {"error": "Failed to decode image"}
-
-        h, w = frame.shape[:2]
-
-        # Run detection and mark inference completion time
-        detections_raw = detector.detect_objects(frame)
-        inference_ts = int(time.time() * 1000)
-
-        # Convert to normalized contract format
-        detections_contract = []
-        for det in detections_raw:
-            # det: {bbox: [x1,y1,x2,y2], confidence, label}
-            bbox = det.get("bbox", [0, 0, 0, 0])
-            x1, y1, x2, y2 = bbox
-            xmin = max(0.0, min(1.0, float(x1) / max(1, w)))
-            ymin = max(0.0, min(1.0, float(y1) / max(1, h)))
-            xmax = max(0.0, min(1.0, float(x2) / max(1, w)))
-            ymax = max(0.0, min(1.0, float(y2) / max(1, h)))
-            detections_contract.append({
-                "label": det.get("label", "object"),
-                "score": float(det.get("confidence", 0.0)),
-                "xmin": xmin,
-                "ymin": ymin,
-                "xmax": xmax,
-                "ymax": ymax,
-            })
-
-        result = {
-            "frame_id": frame_id if frame_id is not None else "unknown",
-            "capture_ts": int(capture_ts) if capture_ts is not None else None,
-            "recv_ts": recv_ts,
-            "inference_ts": inference_ts,
-            "detections": detections_contract,
-        }
-
-        # Broadcast to detection clients
-        payload = json.dumps(result)
-        # Count bytes once per client to estimate total downlink
-        for client in detection_clients[:]:
-            try:
-                await client.send_text(payload)
-                metrics_state["downlink_bytes"] += len(payload)
-            except (WebSocketDisconnect, ConnectionResetError, RuntimeError):
-                detection_clients.remove(client)
-            except Exception as e:
-                print(f"Error sending to detection client: {e}")
-                detection_clients.remove(client)
-
-        return result
+        options = parse_detect_options(request.query_params, frame_data)
+        model = parse_model(request.query_params, request.headers, frame_data)
+        payload = await process_frame(
+            get_session_id(request, frame_data), image_bytes, frame_id, capture_ts, recv_ts,
+            options=options, model=model,
+        )
+        return Response(payload, media_type="application/json")
     except Exception as e:
         print(f"Error in detect_objects: {e}")
         return {"error": str(e)}
 
+# Offline video detection (/api/video/detect)
+VIDEO_DIR = os.getenv("VIDEO_DIR") or None
+VIDEO_MAX_UPLOAD_BYTES = int(float(os.getenv("VIDEO_MAX_UPLOAD_MB", "512")) * 2**20)
+VIDEO_MAX_INFLIGHT = int(os.getenv("VIDEO_MAX_INFLIGHT", "0")) or scheduler.workers
+VIDEO_QUEUE_SIZE = int(os.getenv("VIDEO_QUEUE_SIZE", "8"))
+
+class _CleanupStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that always runs `cleanup` once the response is over:
+    after the last chunk, when the client disconnects, and also when the body
+    generator never started (its own finally would not run then).
+    """
+
+    def __init__(self, content, cleanup, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.cleanup()
+
+async def _upload_chunks(upload, chunk_size: int = 1 << 20):
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+@app.post("/video/detect")
+@app.post("/api/video/detect")
+async def detect_video_file(request: Request):
+    """
+    Run detection over a whole video and stream the results as NDJSON.
+
+    The video is either the request body (video/* or application/octet-stream),
+    a multipart "video" file part, or ?path= relative to VIDEO_DIR. Options
+    (query parameters, or form fields for multipart): stride (every Nth frame),
+    max_fps (frames per second of video), max_frames, model and the usual
+    conf_threshold / iou_threshold / top_k.
+
+    Lines: {"type": "info", ...video properties}, then one
+    {"type": "frame", "index", "ts_ms", "detections", ...} per sampled frame
+    in order, then {"type": "summary", ...}. Frames are decoded, detected and
+    serialized concurrently while earlier lines are already being sent.
+    """
+    if not request.headers.get("X-Requested-With") and not request.headers.get("ngrok-skip-browser-warning"):
+        return {"error": "Invalid request"}
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fields: Dict[str, Any] = {}
+    temp_path: Optional[str] = None
+    reader: Optional[VideoFrameReader] = None
+    cleaned_up = False
+
+    async def cleanup() -> None:
+        nonlocal cleaned_up
+        if cleaned_up:
+            return
+        cleaned_up = True
+        if reader is not None:
+            await reader.close()
+        if temp_path is not None:
+            await asyncio.to_thread(os.remove, temp_path)
+
+    response = None
+    try:
+        try:
+            if content_type == "multipart/form-data":
+                form = await request.form()
+                upload = form.get("video")
+                fields = {k: v for k, v in form.items() if k != "video"}
+                if not hasattr(upload, "read"):
+                    raise ValueError("No video data provided")
+                temp_path = await spool_to_file(_upload_chunks(upload), VIDEO_MAX_UPLOAD_BYTES)
+            elif content_type == "application/octet-stream" or content_type.startswith("video/"):
+                temp_path = await spool_to_file(request.stream(), VIDEO_MAX_UPLOAD_BYTES)
+            elif request.query_params.get("path"):
+                pass
+            else:
+                raise ValueError("No video data provided")
+            path = temp_path or resolve_video_path(VIDEO_DIR, request.query_params["path"])
+
+            params = dict(fields, **request.query_params)
+            options = parse_detect_options(params)
+            model_spec = model_catalog.resolve(parse_model(params, request.headers))
+            reader = VideoFrameReader(
+                path,
+                stride=int(params.get("stride") or 1),
+                max_fps=float(params.get("max_fps") or 0),
+                max_frames=int(params.get("max_frames") or 0),
+                queue_size=VIDEO_QUEUE_SIZE,
+            )
+            info = await asyncio.to_thread(reader.open)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        async def lines():
+            stats = VideoJobStats()
+            reader.start()
+            yield encode_json({"type": "info", **info}) + b"\n"
+            async for entry in detect_video(scheduler, reader, options, model_spec, VIDEO_MAX_INFLIGHT):
+                stats.add(entry)
+                instrumentation.inc("video_frames_total", 1, "Video file frames run through detection")
+                yield encode_json({"type": "frame", **entry}) + b"\n"
+            yield encode_json({"type": "summary", **stats.summary(reader)}) + b"\n"
+
+        response = _CleanupStreamingResponse(lines(), cleanup, media_type="application/x-ndjson")
+        return response
+    finally:
+        # Not handed to a response (error, or cancelled before returning)
+        if response is None:
+            await cleanup()
+
+@app.websocket("/ws/detect")
+@app.websocket("/api/ws/detect")
+async def detect_websocket(websocket: WebSocket):
+    """
+    Binary frame ingest channel.
+
+    Each binary message is a frame (see server/utils/frame_codec.py); the
+    detection result is sent back as a JSON text message. Frames are handed
+    to the scheduler without waiting for the previous one, so a newer frame
+    supersedes a stale pending one just like on the HTTP path.
+    """
+    await websocket.accept()
+    session_id = websocket.query_params.get("session_id") or (
+        f"{websocket.client.host}:{websocket.client.port}" if websocket.client else "default"
+    )
+    pending = set()
+
+    async def handle(message: bytes, recv_ts: int):
+        try:
+            header, offset = decode_binary_frame(message)
+            if offset >= len(message):
+                raise ValueError("No image data provided")
+        except ValueError as e:
+            await websocket.send_text(json.dumps({"error": str(e)}))
+            return
+        payload = await process_frame(
+            session_id, message, header.get("frame_id"), header.get("capture_ts"), recv_ts, offset,
+            parse_detect_options(websocket.query_params, header),
+            parse_model(header, websocket.query_params),
+        )
+        await websocket.send_text(payload.decode("utf-8"))
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes")
+            if data is None:
+                await websocket.send_text(json.dumps({"error": "Expected a binary frame message"}))
+                continue
+            task = asyncio.create_task(handle(data, int(time.time() * 1000)))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in list(pending):
+            task.cancel()
+
+@app.get("/preview.mjpg")
+@app.get("/api/preview.mjpg")
+async def preview_stream(session: Optional[str] = None):
+    """
+    Annotated frames as multipart MJPEG (usable as an <img> src).
+
+    Shows one session's frames with ?session=<id> (the X-Session-Id / session_id
+    of the stream), otherwise the latest frames of every session.
+    """
+    if preview_hub is None:
+        return JSONResponse({"error": "Preview is disabled"}, status_code=404)
+    return StreamingResponse(
+        preview_hub.stream(session),
+        media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+        headers={"Cache-Control": "no-cache, no-store"},
+    )
+
 @app.get("/backend-url")
 @app.get("/api/backend-url")
 async def get_backend_url():
     """Return the current frontend and backend URLs for frontend to use."""
-    frontend_url, backend_url = get_tunnel_url()
+    frontend_url, backend_url = discovery.current()
     return {
         "frontend_url": frontend_url,
         "backend_url": backend_url
@@ -327,29 +851,34 @@ async def get_backend_url():
 
 @app.get("/qr")
 @app.get("/api/qr")
-async def get_qr():
-    """Generate QR code with the correct frontend URL."""
-    frontend_url, _ = get_tunnel_url()
-    
+async def get_qr(room: Optional[str] = None):
+    """
+    Generate QR code with the correct frontend URL.
+
+    The link carries the signaling room id (?room=) so the phone pairs only
+    with the PC that showed the code; without one it points at the shared
+    default room, like signaling clients that don't pass a room.
+    """
+    frontend_url, _ = discovery.current()
+    room = room or DEFAULT_ROOM
+    query = urlencode({"peer": 1, "room": room})
+
     # Use bypass page for ngrok to avoid browser warning
     if 'ngrok' in frontend_url:
-        url = f"{frontend_url}/bypass.html?peer=1"
+        url = f"{frontend_url}/bypass.html?{query}"
     else:
-        url = f"{frontend_url}/?peer=1"
+        url = f"{frontend_url}/?{query}"
     
-    qr = qrcode.make(url)
-    buf = io.BytesIO()
-    qr.save(buf, "PNG")
-    img_str = base64.b64encode(buf.getvalue()).decode()
+    img_str = await qr_cache.png_base64(url)
     
     is_local = 'localhost' in url or '192.168.' in url or '10.' in url
     network_msg = "Make sure both devices are on same WiFi" if is_local else "Works from anywhere with internet"
     
     return HTMLResponse(f"""
-    <div style="text-align: center; font-family: Arial;">
+    <div style="text-align: center; font-family: Arial;" data-room="{html.escape(room, quote=True)}">
         <img src='data:image/png;base64,{img_str}' style='width: 200px; height: 200px;' />
         <p><strong>Scan with phone:</strong></p>
-        <p style="font-size: 14px; color: #666;">{url}</p>
+        <p style="font-size: 14px; color: #666;">{html.escape(url)}</p>
         <p style="font-size: 12px; color: #999;">{network_msg}</p>
     </div>
     """)
@@ -0,0 +1,205 @@
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from server.utils.onnx_session import create_session, warm_up
+
+
+class _BatchItem:
+    __slots__ = ("tensor", "enqueued", "event", "result", "error")
+
+    def __init__(self, tensor: np.ndarray):
+        self.tensor = tensor
+        self.enqueued = time.perf_counter()
+        self.event = threading.Event()
+        self.result: Optional[List[np.ndarray]] = None
+        self.error: Optional[BaseException] = None
+
+
+class BatchingEngine:
+    """
+    Dynamic micro-batcher in front of an ONNX Runtime session.
+
+    Callers on different worker threads submit single-frame tensors; a
+    dedicated thread collects them until either max_batch_size frames are
+    waiting or the oldest one has waited max_wait_ms, runs one batched
+    session.run and hands each caller its slice of the outputs.
+    """
+
+    def __init__(self, session, max_batch_size: int = 8, max_wait_ms: float = 5.0):
+        """
+        Args:
+            session: onnxruntime.InferenceSession whose first input is NCHW
+            max_batch_size: Upper bound on frames per session.run
+            max_wait_ms: Longest time the first frame of a batch waits for company
+        """
+        self.session = session
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+
+        # Models exported with a fixed batch dimension can't take larger
+        # batches; smaller ones are zero-padded up to that size.
+        batch_dim = model_input.shape[0] if model_input.shape else None
+        self.fixed_batch = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+        if self.fixed_batch is not None:
+            max_batch_size = min(max_batch_size, self.fixed_batch)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: "queue.Queue[Optional[_BatchItem]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._frames = 0
+        self._size_hist: Dict[int, int] = {}
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._run_total_ms = 0.0
+
+        self._thread = threading.Thread(target=self._loop, name="onnx-batcher", daemon=True)
+        self._thread.start()
+
+    def infer(self, tensor: np.ndarray) -> List[np.ndarray]:
+        """
+        Run one frame through the model as part of a batch. Blocks until done.
+
+        Args:
+            tensor: Model input with a leading batch dimension of 1
+
+        Returns:
+            Session outputs for this frame, each keeping a batch dimension of 1
+        """
+        item = _BatchItem(tensor)
+        self._queue.put(item)
+        item.event.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stop = False
+            deadline = first.enqueued + self.max_wait_s
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch: List[_BatchItem]) -> None:
+        dispatched = time.perf_counter()
+        try:
+            inputs = np.concatenate([item.tensor for item in batch], axis=0)
+            if self.fixed_batch is not None and len(batch) < self.fixed_batch:
+                pad = np.zeros((self.fixed_batch - len(batch),) + inputs.shape[1:], dtype=inputs.dtype)
+                inputs = np.concatenate([inputs, pad], axis=0)
+            outputs = [np.asarray(out) for out in self.session.run(None, {self.input_name: inputs})]
+            for i, item in enumerate(batch):
+                item.result = [out[i:i + 1] for out in outputs]
+        except Exception as e:
+            for item in batch:
+                item.error = e
+        finished = time.perf_counter()
+
+        with self._stats_lock:
+            self._batches += 1
+            self._frames += len(batch)
+            self._size_hist[len(batch)] = self._size_hist.get(len(batch), 0) + 1
+            for item in batch:
+                wait_ms = (dispatched - item.enqueued) * 1000.0
+                self._wait_total_ms += wait_ms
+                self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+            self._run_total_ms += (finished - dispatched) * 1000.0
+
+        for item in batch:
+            item.event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch-size and queue-wait statistics for tuning max_batch_size / max_wait_ms."""
+        with self._stats_lock:
+            batches, frames = self._batches, self._frames
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_s * 1000.0,
+                "batches": batches,
+                "frames": frames,
+                "avg_batch_size": frames / batches if batches else None,
+                "batch_size_hist": dict(sorted(self._size_hist.items())),
+                "avg_wait_ms": self._wait_total_ms / frames if frames else None,
+                "max_wait_observed_ms": self._wait_max_ms,
+                "avg_run_ms": self._run_total_ms / batches if batches else None,
+            }
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=1.0)
+
+
+# One engine per model path per process, shared by all worker threads
+_engines: Dict[str, BatchingEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_shared_engine(
+    model_path: str,
+    max_batch_size: int = 8,
+    max_wait_ms: float = 5.0,
+    session_config: Optional[Dict[str, Any]] = None,
+    warmup_runs: int = 1,
+) -> Optional[BatchingEngine]:
+    """
+    Get (or create) the process-wide batching engine for a model.
+
+    Args:
+        model_path: ONNX model path
+        max_batch_size: Upper bound on frames per session.run
+        max_wait_ms: Longest time the first frame of a batch waits for company
+        session_config: create_session keyword arguments
+        warmup_runs: Dummy inferences run before the engine is shared
+
+    Returns:
+        The engine, or None if the model could not be loaded
+    """
+    with _engines_lock:
+        engine = _engines.get(model_path)
+        if engine is None:
+            if not os.path.exists(model_path):
+                print(f"Model not found for batching: {model_path}")
+                return None
+            try:
+                session = create_session(model_path, **(session_config or {}))
+                warm_up(session, runs=warmup_runs)
+            except Exception as e:
+                print(f"Failed to load model for batching: {e}")
+                return None
+            engine = BatchingEngine(session, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+            _engines[model_path] = engine
+        return engine
+
+
+def engines_stats() -> Dict[str, Any]:
+    """Stats of every batching engine in this process, keyed by model path."""
+    with _engines_lock:
+        return {path: engine.stats() for path, engine in _engines.items()}
+
+
+def close_engines() -> None:
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.close()
+        _engines.clear()
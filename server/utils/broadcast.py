@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+import json
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from server.utils.frame_codec import encode_binary_detections, encode_json
+
+ENCODINGS = ("json", "binary")
+
+
+class _Subscriber:
+    """One detection viewer: its bounded outgoing queue and sender task."""
+
+    def __init__(self, sid: int, websocket, encoding: str, queue_size: int):
+        self.id = sid
+        self.websocket = websocket
+        self.encoding = encoding
+        # (payload, session the result belongs to)
+        self.queue: Deque[Tuple[bytes, Optional[str]]] = deque(maxlen=queue_size)
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.coalesced = 0
+        self.bytes_sent = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "encoding": self.encoding,
+            "queue_depth": len(self.queue),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+class DetectionBroadcaster:
+    """
+    Fan-out of detection results to /ws/detection viewers without blocking the
+    frame path.
+
+    publish() only appends the already-serialized payload to each viewer's
+    bounded queue and returns. A per-viewer sender task drains the queue; when
+    a viewer falls behind, its oldest queued results are discarded in favor of
+    newer ones (results are full snapshots, so only the latest matters). A
+    viewer whose send stalls past send_timeout_s is disconnected.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 2,
+        send_timeout_s: float = 5.0,
+        on_sent: Optional[Callable[[int, Optional[str]], None]] = None,
+    ):
+        """
+        Args:
+            queue_size: Results buffered per viewer before the oldest is dropped
+            send_timeout_s: Longest a single send may take before the viewer is dropped
+            on_sent: Called with the byte count of every payload actually sent and
+                     the session whose result it was
+        """
+        self.queue_size = max(1, queue_size)
+        self.send_timeout_s = send_timeout_s
+        self.on_sent = on_sent
+        self._subscribers: Dict[int, _Subscriber] = {}
+        self._ids = itertools.count(1)
+        self._retired = {"sent": 0, "coalesced": 0, "bytes_sent": 0}
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def register(self, websocket, encoding: str = "json") -> _Subscriber:
+        """Start delivering results to an accepted WebSocket."""
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding: {encoding}")
+        sub = _Subscriber(next(self._ids), websocket, encoding, self.queue_size)
+        self._subscribers[sub.id] = sub
+        sub.task = asyncio.create_task(self._sender(sub))
+        return sub
+
+    def unregister(self, sub: _Subscriber) -> None:
+        if self._subscribers.pop(sub.id, None) is None:
+            return
+        for key in self._retired:
+            self._retired[key] += getattr(sub, key)
+        if sub.task is not None and sub.task is not asyncio.current_task():
+            sub.task.cancel()
+
+    def encode(self, result: Dict[str, Any]) -> Dict[str, bytes]:
+        """
+        Serialize a result once per encoding that currently has viewers.
+
+        Returns:
+            {encoding: payload}; "json" is always present since the frame's own
+            response reuses it
+        """
+        payloads = {"json": encode_json(result)}
+        if any(sub.encoding == "binary" for sub in self._subscribers.values()):
+            payloads["binary"] = encode_binary_detections(result)
+        return payloads
+
+    def encode_json_payload(self, payload: bytes) -> Dict[str, bytes]:
+        """Like encode(), for a result that arrives already serialized as JSON."""
+        payloads = {"json": payload}
+        if any(sub.encoding == "binary" for sub in self._subscribers.values()):
+            payloads["binary"] = encode_binary_detections(json.loads(payload))
+        return payloads
+
+    def publish(self, payloads: Dict[str, bytes], session_id: Optional[str] = None) -> None:
+        """Queue pre-encoded payloads of a session's result for every viewer. Never awaits."""
+        # Snapshot: viewers may unregister while we go
+        for sub in tuple(self._subscribers.values()):
+            payload = payloads.get(sub.encoding)
+            if payload is None:
+                continue
+            if len(sub.queue) == sub.queue.maxlen:
+                sub.coalesced += 1
+            sub.queue.append((payload, session_id))
+            sub.ready.set()
+
+    async def _sender(self, sub: _Subscriber) -> None:
+        ws = sub.websocket
+        try:
+            while True:
+                await sub.ready.wait()
+                sub.ready.clear()
+                while sub.queue:
+                    payload, session_id = sub.queue.popleft()
+                    if sub.encoding == "binary":
+                        send = ws.send_bytes(payload)
+                    else:
+                        send = ws.send_text(payload.decode("utf-8"))
+                    await asyncio.wait_for(send, self.send_timeout_s)
+                    sub.sent += 1
+                    sub.bytes_sent += len(payload)
+                    if self.on_sent is not None:
+                        self.on_sent(len(payload), session_id)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            print(f"Detection client {sub.id} stalled; disconnecting")
+            self.unregister(sub)
+            try:
+                await ws.close()
+            except Exception:
+                pass
+        except Exception as e:
+            print(f"Error sending to detection client: {e}")
+            self.unregister(sub)
+
+    def stats(self) -> Dict[str, Any]:
+        subs = {str(sid): sub.stats() for sid, sub in self._subscribers.items()}
+        return {
+            "clients": len(subs),
+            "sent": self._retired["sent"] + sum(s["sent"] for s in subs.values()),
+            "coalesced": self._retired["coalesced"] + sum(s["coalesced"] for s in subs.values()),
+            "bytes_sent": self._retired["bytes_sent"] + sum(s["bytes_sent"] for s in subs.values()),
+            "per_client": subs,
+        }
+
+    async def close(self) -> None:
+        for sub in tuple(self._subscribers.values()):
+            self.unregister(sub)
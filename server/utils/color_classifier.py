@@ -0,0 +1,171 @@
+import bisect
+
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Sequence, Tuple
+
+HSVRange = Tuple[Tuple[int, int, int], Tuple[int, int, int]]
+
+# Same HSV ranges (and class order) as the original per-color detector.
+DEFAULT_COLOR_RANGES: List[Tuple[str, List[HSVRange]]] = [
+    ('red', [((0, 50, 50), (10, 255, 255)), ((170, 50, 50), (180, 255, 255))]),
+    ('blue', [((100, 50, 50), (130, 255, 255))]),
+    ('green', [((40, 50, 50), (80, 255, 255))]),
+    ('yellow', [((20, 50, 50), (40, 255, 255))]),
+]
+
+
+def _morph3x3(bits: np.ndarray, op, border: int) -> np.ndarray:
+    """
+    3x3 erosion (op=cv2.bitwise_and, border=255) or dilation (cv2.bitwise_or,
+    border=0) of every bit plane of a packed image at once: a pixel keeps bit
+    i if all (any) of its neighbours have it. The border value matches
+    OpenCV's default for that operation, so each plane comes out exactly as
+    cv2.erode / cv2.dilate would make it. Separable: rows, then columns.
+    """
+    padded = cv2.copyMakeBorder(bits, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=border)
+    rows = op(padded[:, :-2], padded[:, 2:])
+    op(rows, padded[:, 1:-1], dst=rows)
+    out = op(rows[:-2], rows[2:])
+    return op(out, rows[1:-1], dst=out)
+
+
+class ColorClassifier:
+    """
+    Single-pass color classifier for the simple (no model) detection path.
+
+    Every HSV range gets one bit. Per-channel lookup tables map each H, S and V
+    value to the set of ranges it falls in; ANDing the three channels gives the
+    ranges every pixel satisfies, from one HSV conversion, and a 256-entry
+    table turns that into a packed image with one bit per class. Open/close
+    runs once on the packed image, bitwise on all classes together, so every
+    class mask is cleaned exactly like the original per-color inRange loop and
+    a pixel may belong to two classes. One connectedComponentsWithStats call
+    over the class masks (each cropped to its extent and stacked) then gives
+    the boxes of all classes.
+
+    Blob areas are pixel counts (the original used contour area, which leaves
+    out half of the boundary), and a blob inside a hole of a same-color blob
+    is reported too.
+    """
+
+    def __init__(
+        self,
+        color_ranges: Sequence[Tuple[str, Sequence[HSVRange]]] = DEFAULT_COLOR_RANGES,
+        min_area: float = 300,
+        mask_scale: float = 1.0,
+    ):
+        """
+        Args:
+            color_ranges: (label, [(hsv_low, hsv_high), ...]) in class-id order
+            min_area: Minimum blob area in full-resolution pixels
+            mask_scale: < 1.0 builds the class masks on a downscaled frame and maps
+                        boxes and areas back to full resolution
+        """
+        self.labels = [name for name, _ in color_ranges]
+        self.min_area = min_area
+        self.mask_scale = mask_scale
+
+        ranges = [(class_id, lo, hi) for class_id, (_, rs) in enumerate(color_ranges) for lo, hi in rs]
+        if len(ranges) > 8:
+            raise ValueError("ColorClassifier supports at most 8 HSV ranges")
+
+        # value -> bit set of ranges containing it, per H/S/V channel
+        channel_luts = np.zeros((3, 256), np.uint8)
+        values = np.arange(256)
+        for bit, (class_id, lo, hi) in enumerate(ranges):
+            for c in range(3):
+                channel_luts[c, (values >= lo[c]) & (values <= hi[c])] |= np.uint8(1 << bit)
+        self._h_lut, self._s_lut, self._v_lut = (np.ascontiguousarray(lut) for lut in channel_luts)
+
+        # bit set of satisfied ranges -> bit set of classes (bit class_id).
+        # Classes are independent: a pixel inside two colors' ranges counts for both
+        bit_sets = np.arange(256)
+        self._class_lut = np.zeros(256, np.uint8)
+        for bit, (class_id, _, _) in enumerate(ranges):
+            self._class_lut[(bit_sets & (1 << bit)) != 0] |= np.uint8(1 << class_id)
+
+    def range_bits(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Bit set of the HSV ranges each pixel falls in.
+
+        Args:
+            frame: BGR image
+
+        Returns:
+            uint8 image, bit i set where the pixel satisfies range i
+        """
+        h, s, v = cv2.split(cv2.cvtColor(frame, cv2.COLOR_BGR2HSV))
+        ranges = cv2.bitwise_and(cv2.LUT(h, self._h_lut), cv2.LUT(s, self._s_lut))
+        return cv2.bitwise_and(ranges, cv2.LUT(v, self._v_lut), dst=ranges)
+
+    def class_bits(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Cleaned (open, then close) class masks of a frame, packed.
+
+        Args:
+            frame: BGR image
+
+        Returns:
+            uint8 image, bit class_id set where the pixel belongs to that class
+        """
+        bits = cv2.LUT(self.range_bits(frame), self._class_lut)
+        bits = _morph3x3(_morph3x3(bits, cv2.bitwise_and, 255), cv2.bitwise_or, 0)
+        return _morph3x3(_morph3x3(bits, cv2.bitwise_or, 0), cv2.bitwise_and, 255)
+
+    def detect(self, frame: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        Detect colored blobs.
+
+        Args:
+            frame: Input frame as numpy array (BGR format)
+
+        Returns:
+            Detections in the VLMDetector format
+        """
+        scale = self.mask_scale
+        if 0 < scale < 1.0:
+            work = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            scale = 1.0
+            work = frame
+        bits = self.class_bits(work)
+
+        # Crop each class mask to its extent and stack the crops, one
+        # background row apart, so one labelling pass covers every class
+        crops = []
+        top = width = 0
+        for class_id in range(len(self.labels)):
+            x, y, w, h = cv2.boundingRect(cv2.bitwise_and(bits, 1 << class_id))
+            if w and h:
+                crops.append((top, class_id, x, y, w, h))
+                top += h + 1
+                width = max(width, w)
+        if not crops:
+            return []
+        stacked = np.zeros((top, width), np.uint8)
+        for row, class_id, x, y, w, h in crops:
+            np.bitwise_and(bits[y:y + h, x:x + w], 1 << class_id, out=stacked[row:row + h, :w])
+
+        _, _, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(stacked, 8, cv2.CV_32S, cv2.CCL_GRANA)
+
+        # Filter all components at once; only survivors reach Python
+        w, h, area = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+        # Filter out very thin or very wide rectangles
+        aspect = w / np.maximum(h, 1)
+        keep = np.flatnonzero((area > self.min_area * scale * scale) & (aspect > 0.2) & (aspect < 5.0)) + 1
+
+        inv = 1.0 / scale
+        rows = [crop[0] for crop in crops]
+        detections = []
+        for k in keep:
+            x, y, w, h, area = (int(v) for v in stats[k])
+            row, class_id, crop_x, crop_y, _, _ = crops[bisect.bisect_right(rows, y) - 1]
+            x, y = x + crop_x, y - row + crop_y
+            detections.append({
+                'bbox': [int(x * inv), int(y * inv), int(round((x + w) * inv)), int(round((y + h) * inv))],
+                'confidence': min(0.95, area * inv * inv / 8000),
+                'class_id': class_id,
+                'label': self.labels[class_id],
+            })
+        return detections
@@ -0,0 +1,140 @@
+import asyncio
+import base64
+import io
+import socket
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+NGROK_API_URL = "http://127.0.0.1:4040/api/tunnels"
+
+# (frontend URL, backend URL)
+Urls = Tuple[str, str]
+
+
+def get_local_ip() -> str:
+    """Get the local network IP address (no packets are sent)."""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+        finally:
+            s.close()
+    except Exception:
+        return "localhost"
+
+
+def local_urls(serve_built: bool) -> Urls:
+    """URLs on the LAN: the server itself when it serves the build, else the Vite dev server."""
+    port = 8000 if serve_built else 5173
+    url = f"http://{get_local_ip()}:{port}"
+    return url, url
+
+
+def probe_urls(serve_built: bool, ngrok_api_url: str = NGROK_API_URL, timeout_s: float = 2.0) -> Urls:
+    """
+    Check for an active ngrok tunnel to the backend or dev server, falling back
+    to the local IP. Blocking; run it off the event loop.
+    """
+    try:
+        import requests
+
+        resp = requests.get(ngrok_api_url, timeout=timeout_s).json()
+        for tunnel in resp["tunnels"]:
+            if ":8000" in tunnel["config"]["addr"] or ":5173" in tunnel["config"]["addr"]:
+                public_url = tunnel["public_url"]
+                return public_url, public_url  # Same URL for both frontend and backend
+    except Exception:
+        pass
+    return local_urls(serve_built)
+
+
+class UrlDiscovery:
+    """
+    Frontend/backend URLs refreshed in the background.
+
+    Request handlers read the cached value with current(); the ngrok API call
+    and the local IP lookup run on a worker thread every ttl_s seconds, and
+    start() seeds the local URLs (also on a thread) before the first probe.
+    """
+
+    def __init__(self, serve_built: bool = False, ttl_s: float = 30.0,
+                 ngrok_api_url: str = NGROK_API_URL, timeout_s: float = 2.0):
+        """
+        Args:
+            serve_built: The server serves the client build (port 8000 instead of 5173)
+            ttl_s: Seconds between refreshes
+            ngrok_api_url: ngrok local API endpoint listing tunnels
+            timeout_s: Timeout of the ngrok API request
+        """
+        self.serve_built = serve_built
+        self.ttl_s = ttl_s
+        self.ngrok_api_url = ngrok_api_url
+        self.timeout_s = timeout_s
+        self._urls: Optional[Urls] = None
+        self._refreshed_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def current(self) -> Urls:
+        """Latest discovered URLs; a localhost placeholder before start() has run."""
+        if self._urls is None:
+            url = f"http://localhost:{8000 if self.serve_built else 5173}"
+            return url, url
+        return self._urls
+
+    async def refresh(self) -> Urls:
+        self._urls = await asyncio.to_thread(probe_urls, self.serve_built, self.ngrok_api_url, self.timeout_s)
+        self._refreshed_at = time.time()
+        return self._urls
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"URL discovery failed: {e}")
+            await asyncio.sleep(self.ttl_s)
+
+    async def start(self) -> None:
+        if self._task is None:
+            # Local URLs right away; the ngrok probe can take up to timeout_s
+            self._urls = await asyncio.to_thread(local_urls, self.serve_built)
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class QrCache:
+    """Base64 PNG QR codes keyed by URL, least recently used evicted first."""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._images: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def render(url: str) -> str:
+        import qrcode
+
+        buf = io.BytesIO()
+        qrcode.make(url).save(buf, "PNG")
+        return base64.b64encode(buf.getvalue()).decode()
+
+    async def png_base64(self, url: str) -> str:
+        """Cached QR image for url; misses are rendered on a worker thread."""
+        image = self._images.get(url)
+        if image is not None:
+            self.hits += 1
+            self._images.move_to_end(url)
+            return image
+        self.misses += 1
+        image = await asyncio.to_thread(self.render, url)
+        self._images[url] = image
+        while len(self._images) > self.max_entries:
+            self._images.popitem(last=False)
+        return image
@@ -0,0 +1,157 @@
+import json
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional: faster serialization of detection results
+    orjson = None
+
+# Binary frame message layout (WebSocket detect channel):
+#
+#   uint16 big-endian  header length N
+#   N bytes            UTF-8 JSON header, e.g. {"frame_id": "42", "capture_ts": 1690000000000}
+#   remaining bytes    encoded image (JPEG/PNG)
+#
+# The image is never copied out of the message: callers get the original
+# buffer plus the offset at which the image starts.
+HEADER_LEN = struct.Struct(">H")
+
+
+def encode_binary_frame(image_bytes: bytes, frame_id: Any = None, capture_ts: Optional[int] = None) -> bytes:
+    """
+    Build a binary frame message for the WebSocket detect channel.
+
+    Args:
+        image_bytes: Encoded image
+        frame_id: Optional frame identifier
+        capture_ts: Optional capture timestamp in ms
+
+    Returns:
+        Message bytes ready to send over the WebSocket
+    """
+    header = {}
+    if frame_id is not None:
+        header["frame_id"] = frame_id
+    if capture_ts is not None:
+        header["capture_ts"] = int(capture_ts)
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return HEADER_LEN.pack(len(header_bytes)) + header_bytes + image_bytes
+
+
+def decode_binary_frame(message: bytes) -> Tuple[Dict[str, Any], int]:
+    """
+    Parse the header of a binary frame message.
+
+    Args:
+        message: Raw WebSocket message
+
+    Returns:
+        (header dict, offset of the image bytes within message)
+
+    Raises:
+        ValueError: If the message is truncated or the header is not valid JSON
+    """
+    if len(message) < HEADER_LEN.size:
+        raise ValueError("Frame message too short")
+    (header_len,) = HEADER_LEN.unpack_from(message, 0)
+    offset = HEADER_LEN.size + header_len
+    if offset > len(message):
+        raise ValueError("Frame header length exceeds message size")
+
+    header: Dict[str, Any] = {}
+    if header_len:
+        try:
+            header = json.loads(bytes(memoryview(message)[HEADER_LEN.size:offset]))
+        except ValueError as e:
+            raise ValueError(f"Invalid frame header: {e}")
+        if not isinstance(header, dict):
+            raise ValueError("Frame header must be a JSON object")
+    return header, offset
+
+
+def encode_json(payload: Dict[str, Any]) -> bytes:
+    """Compact UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def append_json_fields(payload: bytes, fields: Dict[str, Any]) -> bytes:
+    """
+    Add top-level fields to an already serialized JSON object without
+    re-encoding it (e.g. per-client fields on a shared result payload).
+    """
+    if not fields:
+        return payload
+    extra = encode_json(fields)
+    if payload.rstrip() == b"{}":
+        return extra
+    return payload.rstrip()[:-1] + b"," + extra[1:]
+
+
+# Binary detection result layout (/ws/detection?encoding=binary):
+#
+#   uint16 big-endian  header length N
+#   N bytes            UTF-8 JSON header: the result minus "detections", plus
+#                      "labels" (distinct labels) and "count"
+#   count * 24 bytes   little-endian float32 rows of
+#                      [xmin, ymin, xmax, ymax, score, label index]
+DETECTION_ROW = np.dtype("<f4")
+
+
+def encode_binary_detections(result: Dict[str, Any]) -> bytes:
+    """
+    Pack a detection result into the compact binary layout above.
+
+    Args:
+        result: Contract result with a "detections" list
+
+    Returns:
+        Message bytes
+    """
+    detections = result.get("detections") or []
+    labels: List[str] = []
+    label_index: Dict[str, int] = {}
+    rows = np.empty((len(detections), 6), DETECTION_ROW)
+    for i, det in enumerate(detections):
+        label = det.get("label", "object")
+        if label not in label_index:
+            label_index[label] = len(labels)
+            labels.append(label)
+        rows[i] = (det["xmin"], det["ymin"], det["xmax"], det["ymax"], det["score"], label_index[label])
+
+    header = {k: v for k, v in result.items() if k != "detections"}
+    header["labels"] = labels
+    header["count"] = len(detections)
+    header_bytes = encode_json(header)
+    return HEADER_LEN.pack(len(header_bytes)) + header_bytes + rows.tobytes()
+
+
+def decode_binary_detections(message: bytes) -> Dict[str, Any]:
+    """
+    Inverse of encode_binary_detections.
+
+    Raises:
+        ValueError: If the message is truncated or malformed
+    """
+    header, offset = decode_binary_frame(message)
+    count = int(header.pop("count", 0))
+    labels = header.pop("labels", [])
+    if len(message) - offset != count * 6 * DETECTION_ROW.itemsize:
+        raise ValueError("Detection payload size does not match count")
+    rows = np.frombuffer(message, DETECTION_ROW, count * 6, offset).reshape(count, 6)
+    header["detections"] = [
+        {
+            "label": labels[int(label)],
+            "score": score,
+            "xmin": xmin,
+            "ymin": ymin,
+            "xmax": xmax,
+            "ymax": ymax,
+        }
+        for xmin, ymin, xmax, ymax, score, label in rows.tolist()
+    ]
+    return header
@@ -0,0 +1,230 @@
+import bisect
+import collections
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+# Hot-path stages timed on every frame, in pipeline order
+STAGES = ("base64_decode", "imdecode", "inference", "contract", "serialize", "broadcast")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class StageHistogram:
+    """Fixed-bucket histogram in the Prometheus cumulative-bucket layout."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Iterable[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Instrumentation:
+    """
+    Per-stage timings and byte/frame counters for the detect path.
+
+    Updates are plain attribute increments guarded by one lock, cheap enough to
+    run on every frame. Gauges are callbacks evaluated only at scrape time.
+    """
+
+    def __init__(self, namespace: str = "vlm"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._stages: Dict[str, StageHistogram] = {name: StageHistogram() for name in STAGES}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = collections.OrderedDict()
+        self._help: Dict[str, str] = {}
+        self._gauges: List[Tuple[str, str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = []
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            hist = self._stages.get(stage)
+            if hist is None:
+                hist = self._stages[stage] = StageHistogram()
+            hist.observe(seconds)
+
+    def observe_many(self, timings: Optional[Dict[str, float]]) -> None:
+        """Record stage timings measured elsewhere (e.g. in a pool worker)."""
+        if not timings:
+            return
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    def time(self, stage: str) -> "_StageTimer":
+        """Context manager timing a block with the monotonic perf_counter clock."""
+        return _StageTimer(self, stage)
+
+    def inc(self, name: str, value: float = 1, help_text: str = "", **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            if name not in self._help:
+                self._help[name] = help_text
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> None:
+        """Register an unlabeled gauge read at scrape time."""
+        self.labeled_gauge(name, help_text, lambda: {(): read()})
+
+    def labeled_gauge(
+        self, name: str, help_text: str, read: Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]
+    ) -> None:
+        """Register a gauge whose callback returns {sorted label tuple: value}."""
+        self._gauges.append((name, help_text, read))
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """Count and mean (ms) per stage, for the JSON metrics endpoint."""
+        with self._lock:
+            return {
+                stage: {
+                    "count": h.count,
+                    "mean_ms": (h.sum / h.count * 1000.0) if h.count else None,
+                }
+                for stage, h in self._stages.items()
+            }
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        ns = self.namespace
+        lines: List[str] = []
+        with self._lock:
+            stage_name = f"{ns}_stage_duration_seconds"
+            lines.append(f"# HELP {stage_name} Time spent in each detect-path stage")
+            lines.append(f"# TYPE {stage_name} histogram")
+            for stage, h in self._stages.items():
+                cumulative = 0
+                for bound, count in zip(h.bounds + (float("inf"),), h.counts):
+                    cumulative += count
+                    labels = _format_labels({"stage": stage, "le": _format_value(bound)})
+                    lines.append(f"{stage_name}_bucket{labels} {cumulative}")
+                labels = _format_labels({"stage": stage})
+                lines.append(f"{stage_name}_sum{labels} {_format_value(h.sum)}")
+                lines.append(f"{stage_name}_count{labels} {h.count}")
+
+            emitted = set()
+            for (name, labels), value in self._counters.items():
+                full = f"{ns}_{name}"
+                if name not in emitted:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                    lines.append(f"# TYPE {full} counter")
+                    emitted.add(name)
+                lines.append(f"{full}{_format_labels(dict(labels))} {_format_value(value)}")
+
+        for name, help_text, read in self._gauges:
+            full = f"{ns}_{name}"
+            try:
+                values = read()
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+                continue
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} gauge")
+            for labels, value in values.items():
+                lines.append(f"{full}{_format_labels(dict(labels))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _StageTimer:
+    __slots__ = ("_inst", "_stage", "_start")
+
+    def __init__(self, inst: Instrumentation, stage: str):
+        self._inst = inst
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._inst.observe(self._stage, time.perf_counter() - self._start)
+        return False
+
+
+class SamplingProfiler:
+    """
+    Statistical CPU profiler: samples the Python stacks of all threads at a
+    fixed interval and aggregates them in collapsed-stack format (one
+    "frame;frame;frame count" line per stack, ready for flamegraph tools).
+
+    Only stacks passing through one of the detect-path entry points are kept,
+    so idle pool threads and the event loop's select() don't drown the profile.
+    Worker processes (INFERENCE_EXECUTOR=process) are not visible to it.
+    """
+
+    def __init__(self, entry_points: Iterable[str] = ("run_detection", "run_frame_detection", "_run_batch",
+                                                      "process_frame", "detect_objects", "detect_video")):
+        self.entry_points = frozenset(entry_points)
+        self._lock = threading.Lock()
+
+    def profile(self, duration_s: float = 5.0, interval_ms: float = 5.0) -> Dict[str, object]:
+        """
+        Sample for duration_s seconds. Blocks; run it off the event loop.
+
+        Returns:
+            {samples, duration_s, interval_ms, stacks: [(collapsed_stack, count), ...]}
+            sorted by count, or an error entry if a profile is already running
+        """
+        if not self._lock.acquire(blocking=False):
+            return {"error": "profile already running"}
+        try:
+            own = threading.get_ident()
+            stacks: Dict[str, int] = collections.Counter()
+            samples = 0
+            interval = max(0.001, interval_ms / 1000.0)
+            deadline = time.perf_counter() + duration_s
+            while time.perf_counter() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    names = []
+                    relevant = False
+                    while frame is not None:
+                        code = frame.f_code
+                        relevant = relevant or code.co_name in self.entry_points
+                        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    if relevant:
+                        stacks[";".join(reversed(names))] += 1
+                        samples += 1
+                time.sleep(interval)
+            return {
+                "samples": samples,
+                "duration_s": duration_s,
+                "interval_ms": interval_ms,
+                "stacks": stacks.most_common(),
+            }
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def collapsed(result: Dict[str, object]) -> str:
+        """Render profile() output as collapsed-stack text."""
+        return "".join(f"{stack} {count}\n" for stack, count in result.get("stacks", []))
@@ -0,0 +1,307 @@
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+# Histogram buckets: exact 1 ms resolution below LINEAR_LIMIT_MS, then
+# geometric buckets LOG_GROWTH apart (<= 2.5% error) above it.
+LINEAR_LIMIT_MS = 1000
+LOG_GROWTH = 1.05
+_LOG_BASE = math.log(LOG_GROWTH)
+
+
+def _bucket(value_ms: float) -> int:
+    if value_ms < LINEAR_LIMIT_MS:
+        return int(value_ms)
+    return LINEAR_LIMIT_MS + int(math.log(value_ms / LINEAR_LIMIT_MS) / _LOG_BASE)
+
+
+def _bucket_value(bucket: int) -> float:
+    if bucket < LINEAR_LIMIT_MS:
+        return float(bucket)
+    lo = LINEAR_LIMIT_MS * LOG_GROWTH ** (bucket - LINEAR_LIMIT_MS)
+    return lo * (1 + LOG_GROWTH) / 2
+
+
+class Histogram:
+    """
+    Sparse, mergeable latency histogram. Adds are O(1) and memory is bounded
+    by the number of distinct buckets (~1.1k), not the number of samples.
+    """
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+
+    def add(self, value_ms: float) -> None:
+        b = _bucket(value_ms)
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.total += 1
+
+    def merge(self, other: "Histogram") -> None:
+        for b, c in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + c
+        self.total += other.total
+
+    def _rank_values(self, ranks: Iterable[int]) -> List[float]:
+        """Values of the given 0-based ranks (ascending) in sorted sample order."""
+        values = []
+        pending = iter(ranks)
+        rank = next(pending, None)
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            while rank is not None and seen > rank:
+                values.append(_bucket_value(b))
+                rank = next(pending, None)
+            if rank is None:
+                break
+        return values
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0..1): the lower rank, like the old sorted-list p95."""
+        if self.total == 0:
+            return None
+        return self._rank_values([int(q * (self.total - 1))])[0]
+
+    def median(self) -> Optional[float]:
+        """Median like statistics.median: the mean of the middle two for an even count."""
+        if self.total == 0:
+            return None
+        lo, hi = self._rank_values([(self.total - 1) // 2, self.total // 2])
+        return (lo + hi) / 2
+
+
+class _Slot:
+    """Counters for one wall-clock second."""
+
+    __slots__ = ("second", "frames", "e2e", "server", "network", "uplink_bytes", "downlink_bytes")
+
+    def __init__(self, second: int):
+        self.second = second
+        self.frames = 0
+        self.e2e = Histogram()
+        self.server = Histogram()
+        self.network = Histogram()
+        self.uplink_bytes = 0
+        self.downlink_bytes = 0
+
+
+class FrameMetrics:
+    """
+    Fixed-memory frame latency aggregation.
+
+    Keeps one cumulative set of histograms since the last reset plus a ring of
+    per-second slots, so sliding windows up to ring_seconds long are answered
+    by merging at most ring_seconds small slots.
+    """
+
+    def __init__(self, ring_seconds: int = 60):
+        self.ring_seconds = ring_seconds
+        self.reset()
+
+    def reset(self, start_ts: Optional[int] = None) -> None:
+        self.start_ts = start_ts
+        self.frames = 0
+        self.e2e = Histogram()
+        self.server = Histogram()
+        self.network = Histogram()
+        self.uplink_bytes = 0
+        self.downlink_bytes = 0
+        self.first_capture_ts: Optional[int] = None
+        self.last_overlay_ts: Optional[int] = None
+        self._ring: list = [None] * self.ring_seconds
+
+    def _slot(self, now: float) -> _Slot:
+        second = int(now)
+        idx = second % self.ring_seconds
+        slot = self._ring[idx]
+        if slot is None or slot.second != second:
+            slot = _Slot(second)
+            self._ring[idx] = slot
+        return slot
+
+    def record_frame(self, capture_ts: int, recv_ts: int, inference_ts: int, overlay_display_ts: int,
+                     now: Optional[float] = None) -> None:
+        slot = self._slot(time.time() if now is None else now)
+        self.frames += 1
+        slot.frames += 1
+        if overlay_display_ts >= capture_ts:
+            self.e2e.add(overlay_display_ts - capture_ts)
+            slot.e2e.add(overlay_display_ts - capture_ts)
+        if inference_ts >= recv_ts:
+            self.server.add(inference_ts - recv_ts)
+            slot.server.add(inference_ts - recv_ts)
+        if recv_ts >= capture_ts:
+            self.network.add(recv_ts - capture_ts)
+            slot.network.add(recv_ts - capture_ts)
+        if self.first_capture_ts is None or capture_ts < self.first_capture_ts:
+            self.first_capture_ts = capture_ts
+        if self.last_overlay_ts is None or overlay_display_ts > self.last_overlay_ts:
+            self.last_overlay_ts = overlay_display_ts
+
+    def record_uplink(self, nbytes: int, now: Optional[float] = None) -> None:
+        self.uplink_bytes += nbytes
+        self._slot(time.time() if now is None else now).uplink_bytes += nbytes
+
+    def record_downlink(self, nbytes: int, now: Optional[float] = None) -> None:
+        self.downlink_bytes += nbytes
+        self._slot(time.time() if now is None else now).downlink_bytes += nbytes
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals since the last reset, in the /api/metrics format."""
+        if self.frames == 0:
+            return _summarize(0, self.e2e, self.server, self.network, 0, 0, None)
+        if self.start_ts:
+            duration_ms = self.last_overlay_ts - self.start_ts
+        else:
+            duration_ms = self.last_overlay_ts - self.first_capture_ts
+        return _summarize(self.frames, self.e2e, self.server, self.network,
+                          self.uplink_bytes, self.downlink_bytes, duration_ms / 1000.0)
+
+    def window(self, seconds: int, now: Optional[float] = None) -> Dict[str, Any]:
+        """Summary over the last `seconds` seconds (at most ring_seconds)."""
+        now = time.time() if now is None else now
+        seconds = min(seconds, self.ring_seconds)
+        oldest = int(now) - seconds + 1
+        frames, up, down = 0, 0, 0
+        e2e, server, network = Histogram(), Histogram(), Histogram()
+        for slot in self._ring:
+            if slot is None or slot.second < oldest:
+                continue
+            frames += slot.frames
+            up += slot.uplink_bytes
+            down += slot.downlink_bytes
+            e2e.merge(slot.e2e)
+            server.merge(slot.server)
+            network.merge(slot.network)
+        # A window that started before the last reset only covers the time since it
+        duration_s = float(seconds)
+        if self.start_ts:
+            duration_s = min(duration_s, now - self.start_ts / 1000.0)
+        return _summarize(frames, e2e, server, network, up, down, duration_s)
+
+
+def _summarize(frames: int, e2e: Histogram, server: Histogram, network: Histogram,
+               uplink_bytes: int, downlink_bytes: int, duration_s: Optional[float]) -> Dict[str, Any]:
+    if frames == 0 or duration_s is None:
+        return {
+            "count_frames": frames,
+            "median_e2e_ms": e2e.median(),
+            "p95_e2e_ms": e2e.quantile(0.95),
+            "server_latency_median_ms": server.median(),
+            "network_latency_median_ms": network.median(),
+            "processed_fps": 0,
+            "uplink_kbps": 0,
+            "downlink_kbps": 0,
+        }
+    duration_s = max(1e-3, duration_s)
+    return {
+        "count_frames": frames,
+        "median_e2e_ms": e2e.median(),
+        "p95_e2e_ms": e2e.quantile(0.95),
+        "server_latency_median_ms": server.median(),
+        "network_latency_median_ms": network.median(),
+        "processed_fps": frames / duration_s,
+        "uplink_kbps": (uplink_bytes * 8) / duration_s / 1000.0,
+        "downlink_kbps": (downlink_bytes * 8) / duration_s / 1000.0,
+    }
+
+
+class MetricsRegistry:
+    """Global frame metrics plus a bounded set of per-session breakdowns."""
+
+    def __init__(self, windows: Iterable[int] = (10, 60), max_sessions: int = 64):
+        """
+        Args:
+            windows: Sliding window lengths in seconds reported alongside the totals
+            max_sessions: Least recently active sessions beyond this are evicted
+        """
+        self.windows = tuple(windows)
+        self.max_sessions = max_sessions
+        ring = max(self.windows) if self.windows else 60
+        self._ring = ring
+        self.total = FrameMetrics(ring)
+        self.sessions: "OrderedDict[str, FrameMetrics]" = OrderedDict()
+
+    def _session(self, session_id: Optional[str]) -> Optional[FrameMetrics]:
+        if not session_id:
+            return None
+        metrics = self.sessions.get(session_id)
+        if metrics is None:
+            metrics = FrameMetrics(self._ring)
+            metrics.start_ts = self.total.start_ts
+            self.sessions[session_id] = metrics
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+        return metrics
+
+    def reset(self) -> None:
+        self.total.reset(int(time.time() * 1000))
+        self.sessions.clear()
+
+    def record_frame(self, session_id: Optional[str], capture_ts: int, recv_ts: int, inference_ts: int,
+                     overlay_display_ts: int) -> None:
+        now = time.time()
+        self.total.record_frame(capture_ts, recv_ts, inference_ts, overlay_display_ts, now)
+        session = self._session(session_id)
+        if session is not None:
+            session.record_frame(capture_ts, recv_ts, inference_ts, overlay_display_ts, now)
+
+    def record_uplink(self, session_id: Optional[str], nbytes: int) -> None:
+        now = time.time()
+        self.total.record_uplink(nbytes, now)
+        session = self._session(session_id)
+        if session is not None:
+            session.record_uplink(nbytes, now)
+
+    def record_downlink(self, session_id: Optional[str], nbytes: int) -> None:
+        now = time.time()
+        self.total.record_downlink(nbytes, now)
+        session = self._session(session_id)
+        if session is not None:
+            session.record_downlink(nbytes, now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Totals since reset (top-level keys), sliding windows and per-session breakdowns."""
+        now = time.time()
+        result = self.total.summary()
+        result["windows"] = {f"{w}s": self.total.window(w, now) for w in self.windows}
+        result["sessions"] = {
+            sid: dict(m.summary(), windows={f"{w}s": m.window(w, now) for w in self.windows})
+            for sid, m in self.sessions.items()
+        }
+        return result
+
+
+class MetricsPersister:
+    """Rate-limited metrics.json writer; the write itself runs on a worker thread."""
+
+    def __init__(self, path, min_interval_s: float = 5.0):
+        self.path = path
+        self.min_interval_s = min_interval_s
+        self._last_write = 0.0
+        self._writing = False
+
+    def maybe_persist(self, loop, result: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        if self._writing or now - self._last_write < self.min_interval_s:
+            return
+        self._last_write = now
+        self._writing = True
+        future = loop.run_in_executor(None, self._write, json.dumps(result, indent=2))
+        future.add_done_callback(self._done)
+
+    def _write(self, payload: str) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(payload)
+
+    def _done(self, future) -> None:
+        self._writing = False
+        if future.exception() is not None:
+            print(f"Failed to write metrics.json: {future.exception()}")
@@ -0,0 +1,321 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from server.utils.metrics import Histogram
+from server.utils.onnx_session import create_session, model_optimized_path, warm_up
+from server.utils.vlm_detector import VLMDetector
+
+# Pseudo-model: the OpenCV color detector, always available
+COLOR_MODEL = "color"
+
+# (model name, generation); a newer generation makes workers reload the model
+ModelSpec = Tuple[str, int]
+
+
+def list_models(models_dir: Optional[str]) -> Dict[str, str]:
+    """ONNX files in models_dir by name (file name without .onnx)."""
+    if not models_dir or not os.path.isdir(models_dir):
+        return {}
+    return {
+        name[:-5]: os.path.join(models_dir, name)
+        for name in sorted(os.listdir(models_dir))
+        if name.endswith(".onnx")
+    }
+
+
+def model_path(models_dir: Optional[str], name: str) -> Optional[str]:
+    """Path of <name>.onnx in models_dir if it exists (one stat, no directory listing)."""
+    if not models_dir or os.path.basename(name) != name:
+        return None
+    path = os.path.join(models_dir, name + ".onnx")
+    return path if os.path.isfile(path) else None
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class _ModelEntry:
+    """One loaded model: a shared session plus a detector wrapper per worker thread."""
+
+    def __init__(self, name: str, generation: int, session, detector_options: Dict[str, Any]):
+        self.name = name
+        self.generation = generation
+        self.session = session
+        self.detector_options = detector_options
+        self.load_time_s = 0.0
+        self.memory_bytes = 0
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self._local = threading.local()
+
+    def detector(self) -> VLMDetector:
+        # Preprocessor buffers aren't thread-safe; the session is
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = VLMDetector(session=self.session, **self.detector_options)
+            self._local.detector = detector
+        return detector
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "generation": self.generation,
+            "load_time_ms": round(self.load_time_s * 1000, 2),
+            "memory_mb": round(self.memory_bytes / 2**20, 2),
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ModelRegistry:
+    """
+    Lazily loaded ONNX models for the inference workers of one process.
+
+    Models are loaded from models_dir on first use and warmed up. Loaded
+    sessions are kept in LRU order; when their estimated memory exceeds
+    memory_budget_mb, the least recently used ones are dropped (requests
+    still running on them finish first). load() with a newer generation
+    builds and warms the replacement before swapping it in atomically, so
+    in-flight requests keep the old session and new ones get the new one.
+    """
+
+    def __init__(
+        self,
+        models_dir: Optional[str],
+        memory_budget_mb: float = 1024.0,
+        session_config: Optional[Dict[str, Any]] = None,
+        warmup_runs: int = 1,
+        detector_options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Args:
+            models_dir: Directory of <name>.onnx files
+            memory_budget_mb: Estimated memory allowed for loaded models; the most
+                              recently used model is always kept
+            session_config: create_session keyword arguments
+            warmup_runs: Dummy inferences per model load
+            detector_options: Extra VLMDetector keyword arguments (mask_scale, letterbox, tiling, ...)
+        """
+        self.models_dir = models_dir
+        self.memory_budget_bytes = memory_budget_mb * 2**20
+        self.session_config = dict(session_config or {})
+        self.warmup_runs = warmup_runs
+        self.detector_options = dict(detector_options or {})
+        self._entries: "OrderedDict[str, _ModelEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        # Generation each model's optimized graph was last written for
+        self._optimized_generation: Dict[str, int] = {}
+        self._color_local = threading.local()
+        self._counters = {"loads": 0, "swaps": 0, "evictions": 0, "load_errors": 0}
+
+    def detector(self, spec: ModelSpec) -> Tuple[VLMDetector, Optional[Dict[str, Any]]]:
+        """
+        Detector for a model, loading it if needed.
+
+        Returns:
+            (detector for the calling thread, load info if this call loaded the model)
+        """
+        name, generation = spec
+        if name == COLOR_MODEL:
+            detector = getattr(self._color_local, "detector", None)
+            if detector is None:
+                detector = VLMDetector(mask_scale=self.detector_options.get("mask_scale", 1.0))
+                self._color_local.detector = detector
+            return detector, None
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.generation >= generation:
+                self._entries.move_to_end(name)
+                entry.last_used = time.monotonic()
+                return entry.detector(), None
+        entry, loaded = self._load(name, generation)
+        return entry.detector(), loaded
+
+    def load(self, name: str, generation: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        Load (or replace) a model unless that generation is already live.
+
+        Returns:
+            Load info, or None if nothing had to be loaded
+        """
+        return self._load(name, generation)[1]
+
+    def _load(self, name: str, generation: int) -> Tuple[_ModelEntry, Optional[Dict[str, Any]]]:
+        path = model_path(self.models_dir, name)
+        if path is None:
+            raise KeyError(f"Unknown model: {name}")
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            with self._lock:
+                current = self._entries.get(name)
+                if current is not None and current.generation >= generation:
+                    return current, None
+
+            # RSS growth is the estimate (skewed if other models load at the same
+            # time); the file size is the floor
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            # Each model caches its own optimized graph; a newer generation
+            # rebuilds it, since a swapped-in file need not be newer than the cache
+            session_config = dict(
+                self.session_config,
+                optimized_model_path=model_optimized_path(self.session_config.get("optimized_model_path"), name),
+                reuse_optimized=self._optimized_generation.get(name, 0) >= generation,
+            )
+            try:
+                session = create_session(path, **session_config)
+                warm_up(session, runs=self.warmup_runs)
+            except Exception:
+                with self._lock:
+                    self._counters["load_errors"] += 1
+                raise
+            self._optimized_generation[name] = generation
+            entry = _ModelEntry(name, generation, session, self.detector_options)
+            entry.load_time_s = time.perf_counter() - start
+            rss_after = _rss_bytes()
+            rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else 0
+            entry.memory_bytes = max(rss_delta, os.path.getsize(path))
+
+            with self._lock:
+                previous = self._entries.pop(name, None)
+                self._entries[name] = entry
+                self._counters["loads"] += 1
+                if previous is not None:
+                    self._counters["swaps"] += 1
+                self._evict()
+            print(f"Loaded model {name} (generation {generation}) in {entry.load_time_s * 1000:.0f} ms")
+            return entry, dict(entry.info(), swapped=previous is not None)
+
+    def _evict(self) -> None:
+        """Drop least recently used models over the memory budget. Caller holds the lock."""
+        while len(self._entries) > 1 and self.memory_bytes() > self.memory_budget_bytes:
+            name, _ = self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+            print(f"Evicted model {name} (memory budget)")
+
+    def memory_bytes(self) -> int:
+        return sum(entry.memory_bytes for entry in self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = {name: entry.info() for name, entry in self._entries.items()}
+            memory = self.memory_bytes()
+        return {
+            "loaded": loaded,
+            "memory_mb": round(memory / 2**20, 2),
+            "memory_budget_mb": round(self.memory_budget_bytes / 2**20, 2),
+            **self._counters,
+        }
+
+
+# Process-wide registry, created by the inference worker initializer
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def configure_registry(config: Optional[Dict[str, Any]]) -> Optional[ModelRegistry]:
+    """Create this process's registry (once) from ModelRegistry keyword arguments."""
+    global _registry
+    with _registry_lock:
+        if _registry is None and config is not None:
+            _registry = ModelRegistry(**config)
+        return _registry
+
+
+def get_registry() -> Optional[ModelRegistry]:
+    return _registry
+
+
+class ModelCatalog:
+    """
+    Event-loop side of per-request model selection.
+
+    Validates requested names, hands out the current generation of each model
+    (bumped on reload) and keeps per-model frame counts and latency, fed from
+    job results so it covers thread and process executors alike. The model
+    directory is listed once and cached; refresh() (blocking, run it off the
+    event loop) picks up added or removed files.
+    """
+
+    def __init__(self, models_dir: Optional[str]):
+        self.models_dir = models_dir
+        self._models = list_models(models_dir)
+        self._generations: Dict[str, int] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def refresh(self) -> Dict[str, str]:
+        """List the model directory again. Blocking."""
+        self._models = list_models(self.models_dir)
+        return self._models
+
+    def available(self) -> Dict[str, str]:
+        return self._models
+
+    def resolve(self, name: Optional[str]) -> Optional[ModelSpec]:
+        """
+        Returns:
+            (name, generation) for a requested model, or None for the server default
+
+        Raises:
+            ValueError: Unknown model name
+        """
+        if not name:
+            return None
+        if name != COLOR_MODEL and name not in self.available():
+            raise ValueError(f"Unknown model: {name}")
+        return name, self._generations.get(name, 0)
+
+    def next_generation(self, name: str) -> int:
+        return self._generations.get(name, 0) + 1
+
+    def activate(self, name: str, generation: int) -> None:
+        """Make new requests use this generation of a model."""
+        self._generations[name] = max(generation, self._generations.get(name, 0))
+
+    def _model_stats(self, name: str) -> Dict[str, Any]:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {
+                "frames": 0, "errors": 0, "latency": Histogram(), "inference": Histogram(), "last_load": None,
+            }
+        return stats
+
+    def record(self, name: str, job: Dict[str, Any]) -> None:
+        """Account one job that ran on a requested model."""
+        stats = self._model_stats(name)
+        if "error" in job:
+            stats["errors"] += 1
+            return
+        stats["frames"] += 1
+        timings = job.get("timings") or {}
+        stats["latency"].add(sum(timings.values()) * 1000.0)
+        if "inference" in timings:
+            stats["inference"].add(timings["inference"] * 1000.0)
+        if job.get("model_load"):
+            stats["last_load"] = job["model_load"]
+
+    def stats(self) -> Dict[str, Any]:
+        models = {}
+        for name, stats in self._stats.items():
+            models[name] = {
+                "generation": self._generations.get(name, 0),
+                "frames": stats["frames"],
+                "errors": stats["errors"],
+                "latency_p50_ms": stats["latency"].median(),
+                "latency_p95_ms": stats["latency"].quantile(0.95),
+                "inference_p50_ms": stats["inference"].median(),
+                "inference_p95_ms": stats["inference"].quantile(0.95),
+                "last_load": stats["last_load"],
+            }
+        return {"available": [COLOR_MODEL, *self.available()], "models": models}
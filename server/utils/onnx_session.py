@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from server.utils.quantization import quantized_variant, variant_path
+
+# Serializes sessions that write the optimized model file
+_optimize_lock = threading.Lock()
+
+_OPT_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+def create_session(
+    model_path: str,
+    intra_op_threads: int = 0,
+    inter_op_threads: int = 0,
+    graph_optimization: str = "all",
+    optimized_model_path: Optional[str] = None,
+    precision: str = "fp32",
+    reuse_optimized: bool = True,
+):
+    """
+    Build an ONNX Runtime session with explicit threading and graph optimization.
+
+    If optimized_model_path is given, the graph optimized on first startup is
+    written there; later startups load that file directly (skipping the
+    optimization passes) as long as it is newer than model_path.
+
+    Args:
+        model_path: Source ONNX model
+        intra_op_threads: Threads inside one operator (0 = ORT default)
+        inter_op_threads: Threads across independent operators (0 = ORT default)
+        graph_optimization: "disable", "basic", "extended" or "all"
+        optimized_model_path: Where to persist / reuse the optimized graph
+        precision: "fp32", or load the INT8 variant written by bench/quantize.py
+                   next to model_path when present ("int8", "int8-static",
+                   "int8-dynamic"; see server/utils/quantization.py)
+        reuse_optimized: False re-optimizes and overwrites optimized_model_path
+                         even if it looks current (e.g. after a hot swap)
+
+    Returns:
+        onnxruntime.InferenceSession
+    """
+    import onnxruntime as ort
+
+    if graph_optimization not in _OPT_LEVELS:
+        raise ValueError(f"Unknown graph optimization level: {graph_optimization}")
+
+    mode = quantized_variant(model_path, precision)
+    if mode is not None:
+        model_path = variant_path(model_path, mode)
+        print(f"Using quantized model {model_path}")
+        if optimized_model_path:
+            # Keep the optimized graphs of the float and INT8 models apart
+            optimized_model_path = variant_path(optimized_model_path, mode)
+
+    options = ort.SessionOptions()
+    if intra_op_threads > 0:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads > 0:
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+    load_path = model_path
+    if optimized_model_path:
+        cached = reuse_optimized and os.path.exists(optimized_model_path) and (
+            os.path.getmtime(optimized_model_path) >= os.path.getmtime(model_path)
+        )
+        if cached:
+            # Already optimized offline; don't pay for the passes again
+            load_path = optimized_model_path
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        else:
+            options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, _OPT_LEVELS[graph_optimization])
+            options.optimized_model_filepath = optimized_model_path
+    else:
+        options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, _OPT_LEVELS[graph_optimization])
+
+    if options.optimized_model_filepath:
+        with _optimize_lock:
+            return ort.InferenceSession(load_path, sess_options=options, providers=["CPUExecutionProvider"])
+    return ort.InferenceSession(load_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def model_optimized_path(optimized_model_path: Optional[str], name: str) -> Optional[str]:
+    """Per-model optimized graph path: model.opt.onnx -> model.opt.<name>.onnx"""
+    if not optimized_model_path:
+        return None
+    root, ext = os.path.splitext(optimized_model_path)
+    return f"{root}.{name}{ext or '.onnx'}"
+
+
+def session_config_from_env() -> Dict[str, Any]:
+    """Session settings from ORT_INTRA_OP_THREADS / ORT_INTER_OP_THREADS / ORT_GRAPH_OPT / ORT_OPTIMIZED_MODEL / MODEL_PRECISION."""
+    return {
+        "intra_op_threads": int(os.getenv("ORT_INTRA_OP_THREADS", "0")),
+        "inter_op_threads": int(os.getenv("ORT_INTER_OP_THREADS", "0")),
+        "graph_optimization": os.getenv("ORT_GRAPH_OPT", "all"),
+        "optimized_model_path": os.getenv("ORT_OPTIMIZED_MODEL") or None,
+        "precision": os.getenv("MODEL_PRECISION", "fp32"),
+    }
+
+
+def warm_up(session, input_size=(640, 640), runs: int = 1) -> float:
+    """
+    Run dummy inferences so the first real frame doesn't pay for lazy
+    allocations and kernel selection.
+
+    Args:
+        session: onnxruntime.InferenceSession
+        input_size: (width, height) used for dynamic spatial dimensions
+        runs: Number of warm-up inferences
+
+    Returns:
+        Total warm-up time in ms
+    """
+    if runs <= 0:
+        return 0.0
+    model_input = session.get_inputs()[0]
+    w, h = input_size
+    # Fill dynamic dimensions: batch 1, channels 3, then height, width
+    defaults = [1, 3, h, w]
+    shape = [
+        dim if isinstance(dim, int) and dim > 0 else defaults[i] if i < len(defaults) else 1
+        for i, dim in enumerate(model_input.shape)
+    ]
+    dummy = np.zeros(shape, np.float32)
+    start = time.perf_counter()
+    for _ in range(runs):
+        session.run(None, {model_input.name: dummy})
+    return (time.perf_counter() - start) * 1000.0
@@ -0,0 +1,190 @@
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+# Defaults for the ONNX path; each can be overridden per request
+DEFAULT_CONF_THRESHOLD = 0.5
+DEFAULT_IOU_THRESHOLD = 0.45
+DEFAULT_TOP_K = 100
+# Candidates above the confidence threshold that enter NMS (highest scores first)
+MAX_NMS_CANDIDATES = 1000
+
+Arrays = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class BoxTransform:
+    """
+    Maps model-input pixel boxes to normalized frame coordinates:
+    normalized = (box - offset) * gain, per x1, y1, x2, y2.
+    """
+
+    __slots__ = ("offset", "gain")
+
+    def __init__(self, offset: np.ndarray, gain: np.ndarray):
+        self.offset = offset
+        self.gain = gain
+
+    @classmethod
+    def stretch(cls, input_size: Tuple[int, int]) -> "BoxTransform":
+        """Frame was resized to input_size ignoring aspect ratio."""
+        in_w, in_h = input_size
+        return cls(np.zeros(4, np.float32), np.array([1 / in_w, 1 / in_h, 1 / in_w, 1 / in_h], np.float32))
+
+    @classmethod
+    def letterbox(cls, ratio: float, pad_x: int, pad_y: int, frame_w: int, frame_h: int) -> "BoxTransform":
+        """Frame was scaled by ratio and placed at (pad_x, pad_y) inside the model input."""
+        gx, gy = 1 / (ratio * frame_w), 1 / (ratio * frame_h)
+        return cls(np.array([pad_x, pad_y, pad_x, pad_y], np.float32), np.array([gx, gy, gx, gy], np.float32))
+
+    def apply(self, boxes: np.ndarray) -> np.ndarray:
+        return (boxes - self.offset) * self.gain
+
+
+def empty_arrays() -> Arrays:
+    return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64)
+
+
+def nms(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float,
+    class_ids: Optional[np.ndarray] = None,
+    top_k: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Greedy non-maximum suppression, vectorized over the remaining boxes.
+
+    Args:
+        boxes: (N, 4) array of x1, y1, x2, y2
+        scores: (N,) confidence scores
+        iou_threshold: Boxes overlapping a kept box by more than this are dropped
+        class_ids: If given, suppression only happens within the same class
+        top_k: Stop after this many boxes are kept
+
+    Returns:
+        Indices of kept boxes, highest score first
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, np.int64)
+
+    if class_ids is not None:
+        # Shift each class into its own disjoint coordinate range so one
+        # pass never suppresses across classes
+        offset = (class_ids.astype(np.float32) * (float(boxes.max()) + 1.0))[:, None]
+        boxes = boxes + offset
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    order = np.argsort(-scores, kind="stable")
+    limit = top_k if top_k is not None and top_k > 0 else len(order)
+
+    keep = []
+    while order.size and len(keep) < limit:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, np.int64)
+
+
+def postprocess_model_output(
+    output: np.ndarray,
+    transform: BoxTransform,
+    conf_threshold: float = DEFAULT_CONF_THRESHOLD,
+    iou_threshold: float = DEFAULT_IOU_THRESHOLD,
+    top_k: int = DEFAULT_TOP_K,
+) -> Arrays:
+    """
+    Threshold, class-aware NMS and top-k over raw model rows, all in NumPy.
+
+    Args:
+        output: (K, 6) or (1, K, 6) rows of [x1, y1, x2, y2, confidence, class_id]
+                in model-input pixel coordinates
+        transform: Mapping from model-input pixels to normalized frame coordinates
+        conf_threshold: Rows with confidence <= this are dropped
+        iou_threshold: Same-class overlap above this is suppressed
+        top_k: Maximum detections returned
+
+    Returns:
+        (boxes, scores, class_ids) with boxes normalized to [0, 1] and clamped
+    """
+    rows = np.asarray(output, dtype=np.float32)
+    if rows.ndim == 3:
+        rows = rows[0]
+    if rows.size == 0:
+        return empty_arrays()
+    rows = rows.reshape(-1, rows.shape[-1])
+
+    rows = rows[rows[:, 4] > conf_threshold]
+    if len(rows) == 0:
+        return empty_arrays()
+    if len(rows) > MAX_NMS_CANDIDATES:
+        rows = rows[np.argpartition(-rows[:, 4], MAX_NMS_CANDIDATES)[:MAX_NMS_CANDIDATES]]
+
+    boxes = transform.apply(rows[:, :4])
+    np.clip(boxes, 0.0, 1.0, out=boxes)
+    scores = rows[:, 4]
+    class_ids = rows[:, 5].astype(np.int64)
+
+    keep = nms(boxes, scores, iou_threshold, class_ids, top_k)
+    return boxes[keep], scores[keep], class_ids[keep]
+
+
+def arrays_to_contract(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray, labels=None) -> List[Dict[str, Any]]:
+    """
+    Build contract dicts for the surviving boxes only.
+
+    Args:
+        boxes: (N, 4) normalized x1, y1, x2, y2
+        scores: (N,) scores
+        class_ids: (N,) class ids
+        labels: Optional sequence mapping class id -> label
+
+    Returns:
+        List of {label, score, xmin, ymin, xmax, ymax}
+    """
+    detections = []
+    for (xmin, ymin, xmax, ymax), score, class_id in zip(boxes.tolist(), scores.tolist(), class_ids.tolist()):
+        if labels is not None and 0 <= class_id < len(labels):
+            label = labels[class_id]
+        else:
+            label = f'object_{class_id}'
+        detections.append({
+            "label": label,
+            "score": score,
+            "xmin": xmin,
+            "ymin": ymin,
+            "xmax": xmax,
+            "ymax": ymax,
+        })
+    return detections
+
+
+def normalize_detections(detections: List[Dict[str, Any]], width: int, height: int) -> List[Dict[str, Any]]:
+    """
+    Convert pixel-space VLMDetector detections into the normalized contract format.
+
+    Args:
+        detections: [{bbox: [x1, y1, x2, y2], confidence, label}, ...]
+        width: Frame width in pixels
+        height: Frame height in pixels
+    """
+    if not detections:
+        return []
+    boxes = np.array([det.get("bbox", [0, 0, 0, 0]) for det in detections], np.float64)
+    boxes /= np.array([max(1, width), max(1, height), max(1, width), max(1, height)], np.float64)
+    np.clip(boxes, 0.0, 1.0, out=boxes)
+    contract = []
+    for det, (xmin, ymin, xmax, ymax) in zip(detections, boxes.tolist()):
+        contract.append({
+            "label": det.get("label", "object"),
+            "score": float(det.get("confidence", 0.0)),
+            "xmin": xmin,
+            "ymin": ymin,
+            "xmax": xmax,
+            "ymax": ymax,
+        })
+    return contract
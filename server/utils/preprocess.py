@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+from typing import Sequence, Tuple
+
+from server.utils.postprocess import BoxTransform
+from server.utils.tiling import Placement, Region
+
+# Padding value used by the common YOLO-style letterbox
+LETTERBOX_FILL = 114
+
+
+class Preprocessor:
+    """
+    Frame -> NCHW float32 model input, using buffers allocated once.
+
+    The frame is resized straight into a persistent uint8 canvas (optionally
+    letterboxed, keeping the aspect ratio), then a single NumPy pass does the
+    BGR->RGB swap, 1/255 scaling and HWC->CHW transpose into a persistent
+    float32 tensor. Not thread-safe: use one instance per worker, and don't
+    hold on to the returned tensor across calls.
+    """
+
+    def __init__(self, input_size: Tuple[int, int] = (640, 640), letterbox: bool = False):
+        """
+        Args:
+            input_size: Model input (width, height)
+            letterbox: Keep the aspect ratio and pad instead of stretching
+        """
+        self.input_size = input_size
+        self.letterbox = letterbox
+        w, h = input_size
+        self._canvas = np.full((h, w, 3), LETTERBOX_FILL, np.uint8)
+        self._tensor = np.empty((1, 3, h, w), np.float32)
+        self._geometry = None
+        self._roi = self._canvas
+        self._transform = BoxTransform.stretch(input_size)
+
+    def _update_geometry(self, frame_w: int, frame_h: int) -> None:
+        in_w, in_h = self.input_size
+        if not self.letterbox:
+            self._roi = self._canvas
+            self._transform = BoxTransform.stretch(self.input_size)
+            return
+        ratio = min(in_w / frame_w, in_h / frame_h)
+        new_w, new_h = max(1, round(frame_w * ratio)), max(1, round(frame_h * ratio))
+        pad_x, pad_y = (in_w - new_w) // 2, (in_h - new_h) // 2
+        # Only the padding changes between geometries; refill it once here
+        self._canvas[:] = LETTERBOX_FILL
+        self._roi = self._canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w]
+        self._transform = BoxTransform.letterbox(ratio, pad_x, pad_y, frame_w, frame_h)
+
+    def __call__(self, frame: np.ndarray) -> Tuple[np.ndarray, BoxTransform]:
+        """
+        Args:
+            frame: BGR image
+
+        Returns:
+            (1x3xHxW float32 tensor, transform mapping model-input boxes back to
+            normalized frame coordinates)
+        """
+        return self._tensor, self.into(frame, self._tensor[0])
+
+    def into(self, frame: np.ndarray, out: np.ndarray) -> BoxTransform:
+        """
+        Pre-process a frame into a caller-owned 3xHxW float32 slot, e.g. one
+        entry of a batch tensor.
+
+        Returns:
+            Transform mapping model-input boxes back to normalized frame coordinates
+        """
+        frame_h, frame_w = frame.shape[:2]
+        if self._geometry != (frame_w, frame_h):
+            self._update_geometry(frame_w, frame_h)
+            self._geometry = (frame_w, frame_h)
+
+        roi_h, roi_w = self._roi.shape[:2]
+        if (frame_w, frame_h) == (roi_w, roi_h):
+            self._roi[:] = frame
+        else:
+            cv2.resize(frame, (roi_w, roi_h), dst=self._roi, interpolation=cv2.INTER_LINEAR)
+
+        # Channel reversal (BGR->RGB), HWC->CHW and scaling fused in one pass
+        np.multiply(self._canvas.transpose(2, 0, 1)[::-1], np.float32(1.0 / 255.0), out=out)
+        return self._transform
+
+    def mosaic(self, frame: np.ndarray, regions: Sequence[Region], placements: Sequence[Placement]) -> np.ndarray:
+        """
+        Pack several crops of a frame into one model input (see tiling.pack_regions).
+
+        Args:
+            frame: BGR image
+            regions: Pixel rectangles x0, y0, x1, y1 of frame to copy
+            placements: x, y, width, height of each crop in the model input;
+                        crops are resized when the sizes differ
+
+        Returns:
+            1x3xHxW float32 tensor (padding between crops is LETTERBOX_FILL)
+        """
+        self._canvas[:] = LETTERBOX_FILL
+        # The next __call__ has to redraw its padding too
+        self._geometry = None
+        for (x0, y0, x1, y1), (px, py, pw, ph) in zip(regions, placements):
+            crop = frame[y0:y1, x0:x1]
+            dst = self._canvas[py:py + ph, px:px + pw]
+            if (pw, ph) == (x1 - x0, y1 - y0):
+                dst[:] = crop
+            else:
+                cv2.resize(crop, (pw, ph), dst=dst, interpolation=cv2.INTER_AREA)
+        np.multiply(self._canvas.transpose(2, 0, 1)[::-1], np.float32(1.0 / 255.0), out=self._tensor[0])
+        return self._tensor
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import cv2
+import numpy as np
+
+from server.utils.vlm_detector import draw_detections
+
+MJPEG_BOUNDARY = "frame"
+
+
+def render_preview(
+    frame: np.ndarray,
+    detections,
+    max_width: int = 640,
+    max_height: int = 480,
+    quality: int = 70,
+) -> Optional[bytes]:
+    """
+    Annotated JPEG of a frame the caller is done with. Runs in the pool worker.
+
+    The frame is downscaled first when larger than max_width x max_height
+    (drawing then happens on the smaller copy); otherwise the boxes are drawn
+    on the frame itself, so no full-size copy is made either way.
+
+    Args:
+        frame: Decoded BGR frame (modified in place when not downscaled)
+        detections: Contract-format detections (normalized coordinates)
+        max_width: Preview width limit
+        max_height: Preview height limit
+        quality: JPEG quality 1-100
+
+    Returns:
+        JPEG bytes, or None if encoding failed
+    """
+    h, w = frame.shape[:2]
+    scale = min(max_width / w if max_width else 1.0, max_height / h if max_height else 1.0)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    draw_detections(frame, detections, in_place=True)
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return buf.tobytes() if ok else None
+
+
+def mjpeg_part(jpeg: bytes) -> bytes:
+    """One multipart/x-mixed-replace part carrying a JPEG."""
+    header = f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n"
+    return header.encode("ascii") + jpeg + b"\r\n"
+
+
+class _Channel:
+    """Latest preview part for the viewers of one session (or of all sessions)."""
+
+    __slots__ = ("viewers", "part", "seq", "last_publish", "event")
+
+    def __init__(self):
+        self.viewers = 0
+        self.part: Optional[bytes] = None
+        self.seq = 0
+        self.last_publish = 0.0
+        self.event = asyncio.Event()
+
+
+class PreviewHub:
+    """
+    Annotated MJPEG preview with encode-once fan-out.
+
+    Viewers watch one session or every session (key None). Frames are only
+    rendered while somebody watches and a watched channel is due under
+    max_fps; each rendered frame is framed as a multipart part once and the
+    same bytes object goes to all of its viewers. Viewers always get the
+    latest part, so a slow one skips frames instead of building a backlog.
+    """
+
+    def __init__(self, max_fps: float = 10.0, max_width: int = 640, max_height: int = 480, quality: int = 70):
+        """
+        Args:
+            max_fps: Preview frames per second per channel
+            max_width: Preview width limit (frames are downscaled, never upscaled)
+            max_height: Preview height limit
+            quality: JPEG quality 1-100
+        """
+        self.min_interval_s = 1.0 / max_fps if max_fps > 0 else 0.0
+        # Passed to render_preview in the workers
+        self.render_config: Dict[str, Any] = {"max_width": max_width, "max_height": max_height, "quality": quality}
+        self._channels: Dict[Optional[str], _Channel] = {}
+        self.rendered = 0
+        self.published = 0
+        self.bytes_sent = 0
+
+    def _due(self, session_id: str, now: float):
+        for key in (session_id, None):
+            channel = self._channels.get(key)
+            if channel is not None and channel.viewers and now - channel.last_publish >= self.min_interval_s:
+                yield channel
+
+    def render_options(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """render_preview arguments if this session's next frame should be rendered, else None."""
+        if not self._channels:
+            return None
+        for _ in self._due(session_id, time.monotonic()):
+            return self.render_config
+        return None
+
+    def publish(self, session_id: str, jpeg: Optional[bytes]) -> None:
+        """Hand a rendered frame to the channels that are due for one."""
+        if not jpeg:
+            return
+        self.rendered += 1
+        now = time.monotonic()
+        part = None
+        for channel in self._due(session_id, now):
+            part = part or mjpeg_part(jpeg)
+            channel.part = part
+            channel.seq += 1
+            channel.last_publish = now
+            event, channel.event = channel.event, asyncio.Event()
+            event.set()
+            self.published += 1
+
+    async def stream(self, session_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Multipart parts for one viewer until it disconnects."""
+        channel = self._channels.get(session_id)
+        if channel is None:
+            channel = self._channels[session_id] = _Channel()
+        channel.viewers += 1
+        seq = 0
+        try:
+            while True:
+                if channel.seq == seq:
+                    await channel.event.wait()
+                seq = channel.seq
+                part = channel.part
+                self.bytes_sent += len(part)
+                yield part
+        finally:
+            channel.viewers -= 1
+            if channel.viewers == 0 and self._channels.get(session_id) is channel:
+                del self._channels[session_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "viewers": sum(channel.viewers for channel in self._channels.values()),
+            "channels": len(self._channels),
+            "rendered": self.rendered,
+            "published": self.published,
+            "bytes_sent": self.bytes_sent,
+        }
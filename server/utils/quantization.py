@@ -0,0 +1,156 @@
+import os
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from server.utils.preprocess import Preprocessor
+
+# MODEL_PRECISION values: fp32 model as is, or an INT8 variant next to it
+# ("int8" prefers the static variant, then the dynamic one)
+PRECISIONS = ("fp32", "int8", "int8-static", "int8-dynamic")
+QUANT_MODES = ("static", "dynamic")
+
+# Only the compute-heavy ops are quantized. Detection heads concatenate box
+# coordinates (0..640) and scores (0..1) into one tensor; a single INT8 scale
+# over both would flatten the scores, so the head stays in float.
+DEFAULT_OP_TYPES = ("Conv", "MatMul")
+
+
+def variant_path(model_path: str, mode: str) -> str:
+    """model.onnx -> model.int8-<mode>.onnx"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.int8-{mode}{ext or '.onnx'}"
+
+
+def quantized_variant(model_path: str, precision: str = "fp32") -> Optional[str]:
+    """
+    Quantization mode ("static" / "dynamic") of the variant to load for a
+    precision, or None to load model_path itself. A variant is used when it
+    exists next to model_path and is not older than it.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown model precision: {precision}")
+    if precision == "fp32":
+        return None
+    modes = QUANT_MODES if precision == "int8" else (precision.split("-", 1)[1],)
+    for mode in modes:
+        candidate = variant_path(model_path, mode)
+        if os.path.exists(candidate) and os.path.getmtime(candidate) >= os.path.getmtime(model_path):
+            return mode
+    return None
+
+
+class FrameCalibrationReader:
+    """
+    Calibration data for onnxruntime.quantization.quantize_static: BGR frames
+    run through the same Preprocessor the detector uses, one batch-1 tensor
+    per get_next() call.
+    """
+
+    def __init__(self, frames: Iterable[np.ndarray], input_name: str,
+                 input_size: Tuple[int, int] = (640, 640), letterbox: bool = False):
+        preprocessor = Preprocessor(input_size, letterbox=letterbox)
+        # The preprocessor reuses its output buffer, so keep copies
+        self._tensors: List[np.ndarray] = [preprocessor(frame)[0].copy() for frame in frames]
+        self.input_name = input_name
+        self._iter: Optional[Iterator[np.ndarray]] = None
+        self.rewind()
+
+    def __len__(self) -> int:
+        return len(self._tensors)
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        tensor = next(self._iter, None)
+        return None if tensor is None else {self.input_name: tensor}
+
+    def rewind(self) -> None:
+        self._iter = iter(self._tensors)
+
+
+def _preprocessed(model_path: str, workdir: str) -> str:
+    """Shape inference + graph cleanup recommended before quantization; the original on failure."""
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    output_path = os.path.join(workdir, "preprocessed.onnx")
+    try:
+        quant_pre_process(model_path, output_path)
+        return output_path
+    except Exception as e:
+        print(f"Quantization pre-processing skipped: {e}")
+        return model_path
+
+
+def quantize_dynamic_model(
+    model_path: str,
+    output_path: Optional[str] = None,
+    op_types: Tuple[str, ...] = DEFAULT_OP_TYPES,
+) -> str:
+    """
+    Weights to INT8 ahead of time, activations quantized on the fly per run.
+    Needs no calibration data.
+
+    Returns:
+        Path of the written model
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_path = output_path or variant_path(model_path, "dynamic")
+    with tempfile.TemporaryDirectory() as workdir:
+        # ConvInteger on the CPU provider takes unsigned 8-bit weights
+        quantize_dynamic(_preprocessed(model_path, workdir), output_path,
+                         op_types_to_quantize=list(op_types), weight_type=QuantType.QUInt8)
+    return output_path
+
+
+def quantize_static_model(
+    model_path: str,
+    frames: Iterable[np.ndarray],
+    output_path: Optional[str] = None,
+    letterbox: bool = False,
+    per_channel: bool = True,
+    op_types: Tuple[str, ...] = DEFAULT_OP_TYPES,
+) -> str:
+    """
+    Weights and activations to INT8 (QDQ format), with activation ranges
+    calibrated on representative frames.
+
+    Args:
+        model_path: Float32 ONNX model
+        frames: BGR calibration frames (a few dozen from the target scene is plenty)
+        output_path: Defaults to variant_path(model_path, "static")
+        letterbox: Preprocess like MODEL_LETTERBOX=true
+        per_channel: Per-output-channel weight scales (better accuracy for convs)
+        op_types: Operator types to quantize
+
+    Returns:
+        Path of the written model
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    output_path = output_path or variant_path(model_path, "static")
+    session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    dims = model_input.shape
+    # Fixed spatial dimensions win over the detector default
+    h = dims[2] if len(dims) == 4 and isinstance(dims[2], int) else 640
+    w = dims[3] if len(dims) == 4 and isinstance(dims[3], int) else 640
+    del session
+
+    reader = FrameCalibrationReader(frames, model_input.name, (w, h), letterbox)
+    if not len(reader):
+        raise ValueError("Static quantization needs at least one calibration frame")
+    with tempfile.TemporaryDirectory() as workdir:
+        quantize_static(
+            _preprocessed(model_path, workdir),
+            output_path,
+            reader,
+            quant_format=QuantFormat.QDQ,
+            op_types_to_quantize=list(op_types),
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=per_channel,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    return output_path
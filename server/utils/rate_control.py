@@ -0,0 +1,203 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# (square capture size, JPEG quality), cheapest first; DEFAULT_LEVEL is what
+# the client captured before hints existed
+QUALITY_LEVELS: Tuple[Tuple[int, float], ...] = (
+    (160, 0.5), (192, 0.6), (224, 0.7), (320, 0.7), (416, 0.75), (512, 0.8), (640, 0.8),
+)
+DEFAULT_LEVEL = 2
+
+
+def _ewma(prev: Optional[float], value: float, alpha: float) -> float:
+    return value if prev is None else prev + alpha * (value - prev)
+
+
+class _ClientRate:
+    """Smoothed observations and the current hint for one session."""
+
+    __slots__ = ("interval_ms", "level", "compute_ms", "wait_ms", "upload_ms", "frame_bytes",
+                 "last_level_change", "frames", "drops", "backoffs")
+
+    def __init__(self, interval_ms: float, level: int, now: float):
+        self.interval_ms = interval_ms
+        self.level = level
+        self.compute_ms: Optional[float] = None
+        self.wait_ms: Optional[float] = None
+        self.upload_ms: Optional[float] = None
+        self.frame_bytes: Optional[float] = None
+        self.last_level_change = now
+        self.frames = 0
+        self.drops = 0
+        self.backoffs = 0
+
+
+class RateController:
+    """
+    Per-client capture hints: next frame interval, capture size and JPEG quality.
+
+    Driven by what the server sees for each frame:
+
+    - Interval (AIMD). The floor is the client's fair share of the worker
+      pool (compute time x active sessions / workers) or its upload time,
+      whichever is larger, times headroom. A dropped frame, or a queue wait
+      above wait_budget_ms, multiplies the interval by backoff. Otherwise it
+      shrinks by step_ms toward the floor.
+    - Size/quality, one level at a time and at most once per hold_s:
+      - Down when the upload (capture to receive) takes more than
+        upload_budget of the interval, or when still overloaded at
+        max_interval_ms.
+      - Up when the client is at its floor, uploads and waits are well under
+        budget, and the floor leaves room under target_interval_ms.
+    """
+
+    def __init__(
+        self,
+        min_interval_ms: float = 33.0,
+        max_interval_ms: float = 1000.0,
+        target_interval_ms: float = 66.0,
+        initial_interval_ms: float = 200.0,
+        wait_budget_ms: float = 30.0,
+        upload_budget: float = 0.5,
+        headroom: float = 1.2,
+        backoff: float = 1.5,
+        step_ms: float = 10.0,
+        hold_s: float = 2.0,
+        alpha: float = 0.2,
+        levels: Sequence[Tuple[int, float]] = QUALITY_LEVELS,
+        max_sessions: int = 256,
+    ):
+        """
+        Args:
+            min_interval_ms: Fastest interval ever suggested
+            max_interval_ms: Slowest interval ever suggested
+            target_interval_ms: Frame rate worth keeping before spending capacity on quality
+            initial_interval_ms: Interval for a client's first hint
+            wait_budget_ms: Queue wait (receive to result, minus compute) treated as overload
+            upload_budget: Fraction of the interval an upload may take before quality drops
+            headroom: Slack over the measured compute share / upload time
+            backoff: Interval multiplier on overload
+            step_ms: Interval decrease per healthy frame
+            hold_s: Minimum time between size/quality changes
+            alpha: EWMA weight of the newest observation
+            levels: (size, quality) ladder, cheapest first
+            max_sessions: Clients tracked; least recently seen are evicted
+        """
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max(min_interval_ms, max_interval_ms)
+        self.target_interval_ms = target_interval_ms
+        self.initial_interval_ms = initial_interval_ms
+        self.wait_budget_ms = wait_budget_ms
+        self.upload_budget = upload_budget
+        self.headroom = headroom
+        self.backoff = backoff
+        self.step_ms = step_ms
+        self.hold_s = hold_s
+        self.alpha = alpha
+        self.levels = tuple(levels)
+        self.max_sessions = max_sessions
+        self._clients: "OrderedDict[str, _ClientRate]" = OrderedDict()
+
+    def _client(self, session_id: str, now: float) -> _ClientRate:
+        client = self._clients.get(session_id)
+        if client is None:
+            client = _ClientRate(self.initial_interval_ms, min(DEFAULT_LEVEL, len(self.levels) - 1), now)
+            self._clients[session_id] = client
+            while len(self._clients) > self.max_sessions:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(session_id)
+        return client
+
+    def _floor(self, client: _ClientRate, load: Dict[str, int]) -> float:
+        share = max(1, load.get("active_sessions", 1)) / max(1, load.get("workers", 1))
+        # Frames shouldn't be sent faster than they upload, either
+        floor = max((client.compute_ms or 0.0) * share, client.upload_ms or 0.0) * self.headroom
+        return min(self.max_interval_ms, max(self.min_interval_ms, floor))
+
+    def observe(
+        self,
+        session_id: str,
+        nbytes: int,
+        upload_ms: Optional[float],
+        compute_ms: Optional[float],
+        wait_ms: Optional[float],
+        dropped: bool,
+        load: Dict[str, int],
+        now: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Update a client's state with one frame and return its next hint.
+
+        Args:
+            session_id: Client session
+            nbytes: Encoded frame size
+            upload_ms: Capture-to-receive time, or None if the client clock is unusable
+            compute_ms: Decode + detection time (None for a dropped frame)
+            wait_ms: Time the frame spent queued (None for a dropped frame)
+            dropped: The frame was superseded before inference
+            load: Scheduler load: workers, active_sessions
+            now: Monotonic time in seconds (default: now)
+
+        Returns:
+            {"interval_ms", "width", "height", "quality"}
+        """
+        now = time.monotonic() if now is None else now
+        client = self._client(session_id, now)
+        client.frames += 1
+        client.frame_bytes = _ewma(client.frame_bytes, nbytes, self.alpha)
+        if upload_ms is not None:
+            client.upload_ms = _ewma(client.upload_ms, upload_ms, self.alpha)
+        if compute_ms is not None:
+            client.compute_ms = _ewma(client.compute_ms, compute_ms, self.alpha)
+        if wait_ms is not None:
+            client.wait_ms = _ewma(client.wait_ms, max(0.0, wait_ms), self.alpha)
+
+        overloaded = dropped or (client.wait_ms or 0.0) > self.wait_budget_ms
+        floor = self._floor(client, load)
+        if overloaded:
+            client.drops += int(dropped)
+            client.backoffs += 1
+            client.interval_ms = min(self.max_interval_ms, max(client.interval_ms, floor) * self.backoff)
+        else:
+            client.interval_ms = max(floor, client.interval_ms - self.step_ms)
+
+        if now - client.last_level_change >= self.hold_s:
+            upload = client.upload_ms or 0.0
+            budget = self.upload_budget * client.interval_ms
+            if upload > budget or (overloaded and client.interval_ms >= self.max_interval_ms):
+                self._change_level(client, -1, now)
+            elif (not overloaded and client.interval_ms <= floor and upload < 0.5 * budget
+                  and (client.wait_ms or 0.0) < 0.5 * self.wait_budget_ms
+                  and floor * 1.5 < self.target_interval_ms):
+                self._change_level(client, 1, now)
+        return self._hint(client)
+
+    def _change_level(self, client: _ClientRate, step: int, now: float) -> None:
+        level = min(max(client.level + step, 0), len(self.levels) - 1)
+        if level != client.level:
+            client.level = level
+            client.last_level_change = now
+
+    def _hint(self, client: _ClientRate) -> Dict[str, Any]:
+        size, quality = self.levels[client.level]
+        return {"interval_ms": round(client.interval_ms), "width": size, "height": size, "quality": quality}
+
+    def stats(self) -> Dict[str, Any]:
+        sessions = {}
+        for sid, client in self._clients.items():
+            kbps = None
+            if client.upload_ms and client.frame_bytes:
+                kbps = round(client.frame_bytes * 8 / client.upload_ms, 1)
+            sessions[sid] = {
+                **self._hint(client),
+                "compute_ms": client.compute_ms,
+                "wait_ms": client.wait_ms,
+                "upload_ms": client.upload_ms,
+                "uplink_kbps": kbps,
+                "frames": client.frames,
+                "drops": client.drops,
+                "backoffs": client.backoffs,
+            }
+        return {"clients": len(sessions), "sessions": sessions}
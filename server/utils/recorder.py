@@ -0,0 +1,343 @@
+import heapq
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from server.utils.frame_codec import encode_json
+
+# Recording layout: a directory of segments written by FrameRecorder, one
+# writer per server process. Each segment is a pair of files named
+# <created ms>-<pid>-<segment number>:
+#
+#   .rec  SEGMENT_MAGIC, then records back to back:
+#           RECORD header (little-endian)
+#             uint32   CRC-32 of everything after this field up to the record end
+#             uint64   sequence number within the writer
+#             float64  server receive time, ms since the epoch
+#             float64  client capture timestamp in ms (NaN when unknown)
+#             uint32   frame length F
+#             uint32   metadata length M
+#           F bytes    encoded image exactly as received
+#           M bytes    UTF-8 JSON metadata (session, options, detections, timings, ...)
+#   .idx  INDEX_MAGIC, then one INDEX_DTYPE entry per record: (seq, offset, recv_ms)
+#
+# Records are appended as they complete, so within a segment they are not
+# necessarily in receive order; readers sort them by recv_ms.
+#
+# The index is written after its record, so after a crash it can only lag;
+# readers recover unindexed records by scanning past the last indexed one
+# and stop at the first torn or corrupt record.
+SEGMENT_MAGIC = b"VLMREC1\0"
+INDEX_MAGIC = b"VLMIDX1\0"
+SEGMENT_EXT = ".rec"
+INDEX_EXT = ".idx"
+RECORD = struct.Struct("<IQddII")
+INDEX_DTYPE = np.dtype([("seq", "<u8"), ("offset", "<u8"), ("recv_ms", "<f8")])
+
+
+class Record(NamedTuple):
+    seq: int
+    recv_ms: float
+    capture_ts: Optional[float]
+    frame: memoryview  # view into the mapped segment, valid until the reader is closed
+    meta: Dict[str, Any]
+
+
+class FrameRecorder:
+    """
+    Append-only recording of received frames and their detection results.
+
+    record() only enqueues; a writer thread serializes the metadata and
+    appends to the current segment, so the event loop never touches the
+    disk. When the queue is full the frame is dropped and counted instead of
+    slowing down ingest. Segments roll over at segment_bytes; beyond
+    max_bytes, this writer's oldest segments are deleted.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 2**20,
+        max_bytes: int = 1024 * 2**20,
+        queue_size: int = 256,
+    ):
+        """
+        Args:
+            directory: Recording directory (created if missing)
+            segment_bytes: Segment size at which a new segment is started
+            max_bytes: Total size of this writer's segments (0 = unlimited)
+            queue_size: Frames waiting for the writer thread before new ones are dropped
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._segments: List[str] = []  # this writer's segment base paths, oldest first
+        self._rec = None
+        self._idx = None
+        self._size = 0
+        self._seq = 0
+        self._counters = {"frames": 0, "bytes": 0, "dropped": 0, "segments": 0, "deleted_segments": 0, "errors": 0}
+
+    def start(self) -> None:
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="frame-recorder", daemon=True)
+            self._thread.start()
+
+    def record(self, frame: Union[bytes, memoryview], recv_ms: float, capture_ts: Any,
+               meta: Dict[str, Any]) -> bool:
+        """
+        Queue one frame for writing.
+
+        Args:
+            frame: Encoded image (a memoryview avoids copying it out of the request buffer)
+            recv_ms: Server receive time in ms
+            capture_ts: Client capture timestamp in ms, or None
+            meta: JSON-serializable metadata, stored as is
+
+        Returns:
+            False if the frame was dropped because the writer is behind
+        """
+        try:
+            capture = float(capture_ts) if capture_ts is not None else float("nan")
+        except (TypeError, ValueError):
+            capture = float("nan")
+        try:
+            self._queue.put_nowait((frame, float(recv_ms), capture, meta))
+            return True
+        except queue.Full:
+            self._counters["dropped"] += 1
+            return False
+
+    def close(self) -> None:
+        """Write out queued frames and close the segment. Blocking; run it off the event loop."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                self._write(*item)
+                # Flush once the backlog is drained so readers see whole records
+                if self._queue.empty():
+                    self._flush()
+            except Exception as e:
+                self._counters["errors"] += 1
+                print(f"Frame recorder write failed: {e}")
+        self._close_segment()
+
+    def _write(self, frame, recv_ms: float, capture_ts: float, meta: Dict[str, Any]) -> None:
+        meta_bytes = encode_json(meta)
+        record_len = RECORD.size + len(frame) + len(meta_bytes)
+        if self._rec is None or (self._size + record_len > self.segment_bytes and self._size > len(SEGMENT_MAGIC)):
+            self._open_segment()
+        header = RECORD.pack(0, self._seq, recv_ms, capture_ts, len(frame), len(meta_bytes))
+        crc = zlib.crc32(meta_bytes, zlib.crc32(frame, zlib.crc32(header[4:])))
+        offset = self._size
+        self._rec.write(struct.pack("<I", crc) + header[4:])
+        self._rec.write(frame)
+        self._rec.write(meta_bytes)
+        self._idx.write(np.array([(self._seq, offset, recv_ms)], INDEX_DTYPE).tobytes())
+        self._size += record_len
+        self._seq += 1
+        self._counters["frames"] += 1
+        self._counters["bytes"] += record_len
+
+    def _flush(self) -> None:
+        if self._rec is not None:
+            self._rec.flush()
+            self._idx.flush()
+
+    def _open_segment(self) -> None:
+        self._close_segment()
+        name = f"{int(time.time() * 1000):013d}-{os.getpid()}-{self._counters['segments']:06d}"
+        base = os.path.join(self.directory, name)
+        self._rec = open(base + SEGMENT_EXT, "wb", buffering=1 << 20)
+        self._idx = open(base + INDEX_EXT, "wb", buffering=1 << 16)
+        self._rec.write(SEGMENT_MAGIC)
+        self._idx.write(INDEX_MAGIC)
+        self._size = len(SEGMENT_MAGIC)
+        self._segments.append(base)
+        self._counters["segments"] += 1
+        self._enforce_budget()
+
+    def _close_segment(self) -> None:
+        if self._rec is not None:
+            self._rec.close()
+            self._idx.close()
+            self._rec = self._idx = None
+
+    def _enforce_budget(self) -> None:
+        """Delete this writer's oldest closed segments beyond max_bytes."""
+        if self.max_bytes <= 0:
+            return
+        sizes = {}
+        for base in self._segments[:-1]:
+            try:
+                sizes[base] = os.path.getsize(base + SEGMENT_EXT)
+            except OSError:
+                sizes[base] = 0
+        total = sum(sizes.values())
+        while len(self._segments) > 1 and total + self.segment_bytes > self.max_bytes:
+            base = self._segments.pop(0)
+            total -= sizes.get(base, 0)
+            for ext in (SEGMENT_EXT, INDEX_EXT):
+                try:
+                    os.remove(base + ext)
+                except OSError:
+                    pass
+            self._counters["deleted_segments"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "queue_depth": self._queue.qsize(),
+            "current_segment": self._segments[-1] + SEGMENT_EXT if self._segments else None,
+            **self._counters,
+        }
+
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class SegmentReader:
+    """
+    Memory-mapped reader of one segment.
+
+    Records are located through the index (O(1) random access); records the
+    index is missing are recovered by scanning. Records are ordered by
+    receive time, not by their position in the file. Frames are views into
+    the mapping, so decoding one never copies it out of the file.
+    """
+
+    def __init__(self, path: str, verify: bool = True):
+        """
+        Args:
+            path: Segment .rec file (or its base path without extension)
+            verify: Check each record's CRC when it is read
+        """
+        base = path[:-len(SEGMENT_EXT)] if path.endswith(SEGMENT_EXT) else path
+        self.path = base + SEGMENT_EXT
+        self.verify = verify
+        self._mm = _map(self.path)
+        if self._mm is None or self._mm[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise ValueError(f"Not a recording segment: {self.path}")
+        self._offsets = self._load_offsets(base + INDEX_EXT)
+
+    def _load_offsets(self, index_path: str) -> List[int]:
+        offsets: List[int] = []
+        recv: List[float] = []
+        if os.path.exists(index_path):
+            idx = _map(index_path)
+            if idx is not None and idx[:len(INDEX_MAGIC)] == INDEX_MAGIC:
+                count = (len(idx) - len(INDEX_MAGIC)) // INDEX_DTYPE.itemsize
+                entries = np.frombuffer(idx, INDEX_DTYPE, count=count, offset=len(INDEX_MAGIC))
+                offsets = entries["offset"].tolist()
+                recv = entries["recv_ms"].tolist()
+                del entries
+            if idx is not None:
+                idx.close()
+        # Drop index entries past a torn tail, then pick up unindexed records
+        while offsets and self._record_end(offsets[-1]) is None:
+            offsets.pop()
+            recv.pop()
+        position = self._record_end(offsets[-1]) if offsets else len(SEGMENT_MAGIC)
+        while position is not None and position < len(self._mm):
+            end = self._record_end(position)
+            if end is None:
+                break
+            offsets.append(position)
+            recv.append(RECORD.unpack_from(self._mm, position)[2])
+            position = end
+        # Completion order is not receive order with several inference workers
+        order = sorted(range(len(offsets)), key=recv.__getitem__)
+        return [offsets[i] for i in order]
+
+    def _record_end(self, offset: int) -> Optional[int]:
+        """End offset of a complete, valid record at offset, else None."""
+        if offset + RECORD.size > len(self._mm):
+            return None
+        crc, _, _, _, frame_len, meta_len = RECORD.unpack_from(self._mm, offset)
+        end = offset + RECORD.size + frame_len + meta_len
+        if end > len(self._mm):
+            return None
+        if self.verify and zlib.crc32(memoryview(self._mm)[offset + 4:end]) != crc:
+            return None
+        return end
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, i: int) -> Record:
+        offset = self._offsets[i]
+        _, seq, recv_ms, capture_ts, frame_len, meta_len = RECORD.unpack_from(self._mm, offset)
+        start = offset + RECORD.size
+        view = memoryview(self._mm)
+        meta = json.loads(bytes(view[start + frame_len:start + frame_len + meta_len]))
+        return Record(seq, recv_ms, None if capture_ts != capture_ts else capture_ts,
+                      view[start:start + frame_len], meta)
+
+    def __iter__(self) -> Iterator[Record]:
+        for i in range(len(self._offsets)):
+            yield self[i]
+
+    def close(self) -> None:
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # frames are still referenced; the mapping goes away with them
+
+    def __enter__(self) -> "SegmentReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def list_segments(path: str) -> List[str]:
+    """Segment files of a recording directory in name (creation) order; a single segment as is."""
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(SEGMENT_EXT)]
+    return [path]
+
+
+class RecordingReader:
+    """All segments of a recording, iterated in receive-time order across writers."""
+
+    def __init__(self, path: str, verify: bool = True):
+        self.segments = [SegmentReader(segment, verify) for segment in list_segments(path)]
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    def __iter__(self) -> Iterator[Record]:
+        return heapq.merge(*self.segments, key=lambda record: record.recv_ms)
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+
+    def __enter__(self) -> "RecordingReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,492 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from server.utils.batching import close_engines, engines_stats, get_shared_engine
+from server.utils.model_registry import ModelSpec, configure_registry, get_registry
+from server.utils.preview import render_preview
+from server.utils.temporal import TemporalGate, TemporalState
+from server.utils.tiling import RoiPlanner, RoiState
+from server.utils.vlm_detector import VLMDetector
+
+# Each worker (thread or process) owns exactly one detector instance.
+_worker_state = threading.local()
+
+
+def _init_worker(
+    model_path: Optional[str],
+    batch_max_size: int = 1,
+    batch_max_wait_ms: float = 5.0,
+    detector_options: Optional[Dict[str, Any]] = None,
+    registry_config: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Executor initializer: build the detector for this worker up front."""
+    configure_registry(registry_config)
+    detector_options = detector_options or {}
+    batcher = None
+    if model_path and batch_max_size > 1:
+        batcher = get_shared_engine(
+            model_path,
+            batch_max_size,
+            batch_max_wait_ms,
+            session_config=detector_options.get("session_config"),
+            warmup_runs=detector_options.get("warmup_runs", 1),
+        )
+    _worker_state.detector = VLMDetector(model_path, batcher=batcher, **detector_options)
+
+
+def _get_worker_detector(model_path: Optional[str]) -> VLMDetector:
+    detector = getattr(_worker_state, "detector", None)
+    if detector is None:
+        detector = VLMDetector(model_path)
+        _worker_state.detector = detector
+    return detector
+
+
+def run_detection(
+    image_bytes: bytes,
+    model_path: Optional[str] = None,
+    offset: int = 0,
+    options: Optional[Dict[str, Any]] = None,
+    temporal: Optional[TemporalGate] = None,
+    temporal_state: Optional[TemporalState] = None,
+    model: Optional[ModelSpec] = None,
+    preview: Optional[Dict[str, Any]] = None,
+    roi: Optional[RoiPlanner] = None,
+    roi_state: Optional[RoiState] = None,
+) -> Dict[str, Any]:
+    """
+    Decode a JPEG/PNG buffer and run detection on it. Executed inside a pool worker.
+
+    Args:
+        image_bytes: Buffer holding the encoded image
+        model_path: Model path used to build this worker's detector
+        offset: Byte offset of the image within image_bytes (decoded in place, no copy)
+        options: Per-request conf_threshold / iou_threshold / top_k
+        temporal: If given, full detection only runs on keyframes (see TemporalGate)
+        temporal_state: The session's state from its previous frame
+        model: Registry model (name, generation) to use instead of this worker's
+               default detector
+        preview: render_preview arguments; adds the annotated JPEG as "preview"
+        roi: If given, full detections search only around the previous
+             detections between periodic sweeps (see RoiPlanner)
+        roi_state: The session's ROI state from its previous frame
+
+    Returns:
+        Dict with frame width/height, contract-format detections and per-stage
+        timings in seconds (imdecode, inference, contract, motion, roi, preview),
+        or an error entry. In temporal mode also the frame's mode and the new
+        temporal_state; in ROI mode "roi" (sweep / roi) and the new roi_state
+        whenever detection ran; with a registry model, "model_load" when this
+        frame loaded or swapped it.
+    """
+    start = time.perf_counter()
+    frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8, offset=offset), cv2.IMREAD_COLOR)
+    if frame is None:
+        return {"error": "Failed to decode image"}
+    timings = {"imdecode": time.perf_counter() - start}
+    return _detect_decoded(frame, timings, model_path, options, temporal, temporal_state, model, preview, roi,
+                           roi_state)
+
+
+def run_frame_detection(
+    frame: np.ndarray,
+    model_path: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    model: Optional[ModelSpec] = None,
+) -> Dict[str, Any]:
+    """
+    Run detection on an already decoded BGR frame (e.g. from a video file).
+    Executed inside a pool worker; same result as run_detection without the
+    imdecode timing.
+    """
+    return _detect_decoded(frame, {}, model_path, options, None, None, model, None, None, None)
+
+
+def _detect_decoded(
+    frame: np.ndarray,
+    timings: Dict[str, float],
+    model_path: Optional[str],
+    options: Optional[Dict[str, Any]],
+    temporal: Optional[TemporalGate],
+    temporal_state: Optional[TemporalState],
+    model: Optional[ModelSpec],
+    preview: Optional[Dict[str, Any]],
+    roi: Optional[RoiPlanner],
+    roi_state: Optional[RoiState],
+) -> Dict[str, Any]:
+    h, w = frame.shape[:2]
+    options = options or {}
+    extra: Dict[str, Any] = {}
+    if model is None:
+        detector = _get_worker_detector(model_path)
+    else:
+        registry = get_registry()
+        if registry is None:
+            return {"error": "Model registry is not configured"}
+        try:
+            detector, loaded = registry.detector(model)
+        except Exception as e:
+            return {"error": f"Failed to load model {model[0]}: {e}"}
+        if loaded:
+            extra["model_load"] = loaded
+
+    # A different model invalidates the session's tracks and regions like changed thresholds do
+    gate_options = dict(options, model=model[0]) if model is not None else options
+
+    def detect():
+        if roi is None:
+            return detector.detect_contract(frame, timings=timings, **options)
+        detections, extra["roi_state"], extra["roi"] = roi.step(
+            frame, roi_state, detector, options, timings, gate_options
+        )
+        return detections
+
+    if temporal is None:
+        detections = detect()
+        result = {"width": w, "height": h, "detections": detections, "timings": timings, **extra}
+    else:
+        detections, temporal_state, mode = temporal.step(frame, temporal_state, detect, gate_options, timings)
+        result = {
+            "width": w,
+            "height": h,
+            "detections": detections,
+            "timings": timings,
+            "mode": mode,
+            "temporal_state": temporal_state,
+            **extra,
+        }
+
+    if preview is not None:
+        # Detection is done with the frame (temporal state keeps its own thumbnail), so draw on it
+        start = time.perf_counter()
+        result["preview"] = render_preview(frame, detections, **preview)
+        timings["preview"] = time.perf_counter() - start
+    return result
+
+
+class _SessionQueue:
+    """Pending frames for one session plus its counters."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.pending: Deque[Tuple[bytes, int, Optional[Dict[str, Any]], Optional[ModelSpec], Optional[Dict[str, Any]],
+                                  asyncio.Future]] = deque()
+        self.running = False
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.last_active = time.monotonic()
+        # Temporal mode: state carried from frame to frame and frames per mode
+        self.temporal_state: Optional[TemporalState] = None
+        self.modes: Dict[str, int] = {}
+        # ROI mode: regions to search come from the previous detections
+        self.roi_state: Optional[RoiState] = None
+        self.roi_modes: Dict[str, int] = {}
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "queue_depth": len(self.pending),
+            "in_flight": 1 if self.running else 0,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
+        if self.modes:
+            stats["modes"] = dict(self.modes)
+        if self.roi_modes:
+            stats["roi_modes"] = dict(self.roi_modes)
+        return stats
+
+
+class InferenceScheduler:
+    """
+    Runs decode + inference off the event loop on a bounded worker pool.
+
+    Every session gets a small bounded queue and at most one frame in flight.
+    When a new frame arrives and the queue is full, the oldest pending frame is
+    dropped (latest-frame-wins), so latency stays flat under overload instead
+    of growing with the backlog.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        executor: str = "thread",
+        queue_size: int = 1,
+        model_path: Optional[str] = None,
+        session_ttl_s: float = 300.0,
+        batch_max_size: int = 1,
+        batch_max_wait_ms: float = 5.0,
+        detector_options: Optional[Dict[str, Any]] = None,
+        temporal: Optional[TemporalGate] = None,
+        registry_config: Optional[Dict[str, Any]] = None,
+        roi: Optional[RoiPlanner] = None,
+    ):
+        """
+        Args:
+            workers: Number of pool workers (one VLMDetector each)
+            executor: "thread" or "process"
+            queue_size: Max pending frames per session, excluding the one in flight
+            model_path: ONNX model path passed to each worker's VLMDetector
+            session_ttl_s: Idle sessions older than this are forgotten
+            batch_max_size: > 1 enables cross-session micro-batching of ONNX inference
+                            (thread executor only; needs workers >= batch_max_size to fill batches)
+            batch_max_wait_ms: Longest a frame waits for a batch to fill
+            detector_options: Extra VLMDetector keyword arguments (mask_scale, letterbox,
+                              session_config, warmup_runs, tiling, ...)
+            temporal: Enables motion-gated detection with per-session tracking
+            registry_config: ModelRegistry keyword arguments; enables per-request
+                             model selection (submit(model=...))
+            roi: Enables per-session region-of-interest detection between full-frame sweeps
+        """
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor type: {executor}")
+        self.workers = max(1, workers)
+        self.executor_kind = executor
+        self.queue_size = max(1, queue_size)
+        self.model_path = model_path
+        self.session_ttl_s = session_ttl_s
+        # Batches are formed across worker threads sharing one session, so a
+        # process pool (one thread per process) could never fill them.
+        if batch_max_size > 1 and executor == "process":
+            print("Micro-batching requires the thread executor; disabling it")
+            batch_max_size = 1
+        self.batch_max_size = max(1, batch_max_size)
+        self.batch_max_wait_ms = batch_max_wait_ms
+        self.detector_options = dict(detector_options or {})
+        self.temporal = temporal
+        self.roi = roi
+        self.registry_config = registry_config
+        self._executor: Optional[Executor] = None
+        self._sessions: Dict[str, _SessionQueue] = {}
+        # Counters of sessions that were pruned, so totals stay monotonic
+        self._retired = {"submitted": 0, "processed": 0, "dropped": 0}
+        self._retired_modes: Dict[str, int] = {}
+        self._retired_roi_modes: Dict[str, int] = {}
+        self._tasks = set()
+        # Decoded frames run through detect_frame (video jobs)
+        self._frames = {"submitted": 0, "completed": 0, "in_flight": 0}
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.model_path, 1, 0.0, self.detector_options, self.registry_config),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="inference",
+                    initializer=_init_worker,
+                    initargs=(self.model_path, self.batch_max_size, self.batch_max_wait_ms, self.detector_options,
+                              self.registry_config),
+                )
+        return self._executor
+
+    def _get_session(self, session_id: str) -> _SessionQueue:
+        session = self._sessions.get(session_id)
+        if session is None:
+            self._prune_sessions()
+            session = _SessionQueue(self.queue_size)
+            self._sessions[session_id] = session
+        return session
+
+    def _prune_sessions(self) -> None:
+        now = time.monotonic()
+        for sid, session in list(self._sessions.items()):
+            if not session.running and not session.pending and now - session.last_active > self.session_ttl_s:
+                for key in self._retired:
+                    self._retired[key] += getattr(session, key)
+                for mode, count in session.modes.items():
+                    self._retired_modes[mode] = self._retired_modes.get(mode, 0) + count
+                for mode, count in session.roi_modes.items():
+                    self._retired_roi_modes[mode] = self._retired_roi_modes.get(mode, 0) + count
+                del self._sessions[sid]
+
+    async def submit(
+        self,
+        session_id: str,
+        image_bytes: bytes,
+        offset: int = 0,
+        options: Optional[Dict[str, Any]] = None,
+        model: Optional[ModelSpec] = None,
+        preview: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Queue a frame for a session and wait for its result.
+
+        Args:
+            session_id: Session the frame belongs to
+            image_bytes: Buffer holding the encoded image
+            offset: Byte offset of the image within image_bytes
+            options: Per-request detection options passed to VLMDetector.detect_contract
+            model: Registry model (name, generation), or None for the default detector
+            preview: render_preview arguments when an annotated JPEG is wanted (see PreviewHub)
+
+        Returns:
+            The worker result, or None if the frame was superseded by a newer one
+        """
+        loop = asyncio.get_running_loop()
+        session = self._get_session(session_id)
+        session.submitted += 1
+        session.last_active = time.monotonic()
+
+        while len(session.pending) >= session.maxsize:
+            stale = session.pending.popleft()[-1]
+            session.dropped += 1
+            if not stale.done():
+                stale.set_result(None)
+
+        future = loop.create_future()
+        session.pending.append((image_bytes, offset, options, model, preview, future))
+
+        if not session.running:
+            session.running = True
+            task = loop.create_task(self._drain(session))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        return await future
+
+    async def _drain(self, session: _SessionQueue) -> None:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            while session.pending:
+                image_bytes, offset, options, model, preview, future = session.pending.popleft()
+                if future.done():
+                    # Caller went away before we got to it
+                    continue
+                try:
+                    result = await loop.run_in_executor(
+                        executor, run_detection, image_bytes, self.model_path, offset, options,
+                        self.temporal, session.temporal_state, model, preview, self.roi, session.roi_state,
+                    )
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                session.processed += 1
+                if "temporal_state" in result:
+                    session.temporal_state = result.pop("temporal_state")
+                    session.modes[result["mode"]] = session.modes.get(result["mode"], 0) + 1
+                if "roi_state" in result:
+                    session.roi_state = result.pop("roi_state")
+                    session.roi_modes[result["roi"]] = session.roi_modes.get(result["roi"], 0) + 1
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            session.running = False
+            session.last_active = time.monotonic()
+
+    async def detect_frame(
+        self,
+        frame: np.ndarray,
+        options: Optional[Dict[str, Any]] = None,
+        model: Optional[ModelSpec] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run detection on a decoded frame on the worker pool.
+
+        Unlike submit(), frames bypass the per-session queues and are never
+        dropped; callers bound their own in-flight frames (see
+        server/utils/video.py) so live sessions still get pool slots.
+
+        Args:
+            frame: BGR frame (pickled to the worker with the process executor)
+            options: Per-request detection options passed to VLMDetector.detect_contract
+            model: Registry model (name, generation), or None for the default detector
+
+        Returns:
+            The worker result (see run_detection)
+        """
+        loop = asyncio.get_running_loop()
+        self._frames["submitted"] += 1
+        self._frames["in_flight"] += 1
+        try:
+            return await loop.run_in_executor(
+                self._get_executor(), run_frame_detection, frame, self.model_path, options, model,
+            )
+        finally:
+            self._frames["in_flight"] -= 1
+            self._frames["completed"] += 1
+
+    async def preload_model(self, name: str, generation: int) -> Optional[Dict[str, Any]]:
+        """
+        Load a model generation ahead of the requests that will use it.
+
+        Only possible with the thread executor, whose workers share this
+        process's registry; process workers load it on first use instead.
+
+        Returns:
+            Load info, or None if nothing was loaded here
+        """
+        if self.executor_kind != "thread" or self.registry_config is None:
+            return None
+        registry = configure_registry(self.registry_config)
+        # Default executor: loading must not occupy an inference worker
+        return await asyncio.to_thread(registry.load, name, generation)
+
+    def model_stats(self) -> Optional[Dict[str, Any]]:
+        """Loaded models of this process's registry (thread executor only)."""
+        if self.executor_kind != "thread":
+            return None
+        registry = get_registry()
+        return registry.stats() if registry is not None else None
+
+    def load(self, active_window_s: float = 5.0) -> Dict[str, int]:
+        """
+        Cheap load summary for per-frame decisions (see RateController).
+
+        Args:
+            active_window_s: Sessions seen within this many seconds count as active
+        """
+        cutoff = time.monotonic() - active_window_s
+        sessions = self._sessions.values()
+        return {
+            "workers": self.workers,
+            "active_sessions": sum(1 for s in sessions if s.running or s.last_active >= cutoff),
+            "queue_depth": sum(len(s.pending) for s in sessions),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Aggregate and per-session queue depth, in-flight and drop counters."""
+        sessions = {sid: s.stats() for sid, s in self._sessions.items()}
+        modes = dict(self._retired_modes)
+        roi_modes = dict(self._retired_roi_modes)
+        for session in self._sessions.values():
+            for mode, count in session.modes.items():
+                modes[mode] = modes.get(mode, 0) + count
+            for mode, count in session.roi_modes.items():
+                roi_modes[mode] = roi_modes.get(mode, 0) + count
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queue_depth": sum(s["queue_depth"] for s in sessions.values()),
+            "in_flight": sum(s["in_flight"] for s in sessions.values()),
+            "submitted": self._retired["submitted"] + sum(s["submitted"] for s in sessions.values()),
+            "processed": self._retired["processed"] + sum(s["processed"] for s in sessions.values()),
+            "dropped": self._retired["dropped"] + sum(s["dropped"] for s in sessions.values()),
+            "sessions": sessions,
+            "batching": engines_stats() if self.batch_max_size > 1 else None,
+            "temporal_modes": modes if self.temporal is not None else None,
+            "roi_modes": roi_modes if self.roi is not None else None,
+            "decoded_frames": dict(self._frames),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self.batch_max_size > 1:
+            close_engines()
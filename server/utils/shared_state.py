@@ -0,0 +1,271 @@
+import asyncio
+import json
+import os
+import struct
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from server.utils.frame_codec import encode_json
+
+Handler = Callable[[Any], Optional[Awaitable[None]]]
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "vlm-state.sock")
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+# Wire format: >I length of the rest, then >BH payload kind + channel length,
+# the channel name and the payload (raw bytes or JSON)
+_LENGTH = struct.Struct(">I")
+_KIND = struct.Struct(">BH")
+_RAW, _JSON = 0, 1
+
+
+def pack_message(channel: str, message: Any) -> bytes:
+    name = channel.encode("utf-8")
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        kind, body = _RAW, bytes(message)
+    else:
+        kind, body = _JSON, encode_json(message)
+    size = _KIND.size + len(name) + len(body)
+    return _LENGTH.pack(size) + _KIND.pack(kind, len(name)) + name + body
+
+
+def unpack_message(frame: bytes) -> Tuple[str, Any]:
+    """Inverse of pack_message for a frame without its length prefix."""
+    kind, name_len = _KIND.unpack_from(frame)
+    start = _KIND.size + name_len
+    channel = frame[_KIND.size:start].decode("utf-8")
+    body = frame[start:]
+    return channel, (body if kind == _RAW else json.loads(body))
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    (size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"State message too large: {size} bytes")
+    return await reader.readexactly(size)
+
+
+class StateBackend:
+    """
+    State shared between server worker processes.
+
+    Each worker keeps its own sockets (signaling peers, detection viewers) and
+    its own replica of shared state such as metrics. A worker applies its own
+    events locally and publish()es them; the backend delivers them to the
+    handlers subscribe()d in every *other* worker. This base class is the
+    single-process backend: there are no other workers, so publish() is a no-op.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        """
+        Register how this worker applies a channel's messages from other workers.
+
+        Args:
+            channel: Channel name
+            handler: Called with the decoded message; may return a coroutine,
+                     which is run as a task
+        """
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, message: Any) -> None:
+        """
+        Send a message to the other workers. Never awaits.
+
+        Args:
+            channel: Channel name
+            message: bytes (sent as is) or a JSON-serializable value
+        """
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        for task in tuple(self._tasks):
+            task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "pid": os.getpid()}
+
+    def _dispatch(self, channel: str, message: Any) -> None:
+        for handler in self._handlers.get(channel, ()):
+            try:
+                outcome = handler(message)
+            except Exception as e:
+                print(f"Error handling '{channel}' state message: {e}")
+                continue
+            if asyncio.iscoroutine(outcome):
+                task = asyncio.create_task(outcome)
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+
+class InProcessBackend(StateBackend):
+    """Single worker: all state lives in this process."""
+
+
+class UnixSocketBackend(StateBackend):
+    """
+    Pub/sub between the workers of one host over a Unix-domain socket.
+
+    No outside service is needed: whichever worker holds an exclusive lock on
+    "<path>.lock" runs the broker inside its own event loop, and every worker
+    (the broker's own included) connects to it as a client. The broker forwards
+    each message to all clients except its sender. If the broker's worker
+    exits, the lock is released and the next worker to reconnect takes over.
+
+    Delivery is best effort: while disconnected, or when a peer's socket
+    buffer is over max_buffer_bytes, messages are dropped and counted.
+    """
+
+    name = "unix"
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH, max_buffer_bytes: int = 4 * 1024 * 1024,
+                 reconnect_s: float = 0.5):
+        """
+        Args:
+            path: Broker socket path; must be the same for all workers
+            max_buffer_bytes: Pending outgoing bytes per connection before messages are dropped
+            reconnect_s: Delay between connection attempts
+        """
+        super().__init__()
+        self.path = path
+        self.max_buffer_bytes = max_buffer_bytes
+        self.reconnect_s = reconnect_s
+        self._lock_file = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Set[asyncio.StreamWriter] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._counters = {"published": 0, "received": 0, "dropped": 0, "reconnects": 0, "broker_dropped": 0}
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=5.0)
+        except asyncio.TimeoutError:
+            print(f"State broker at {self.path} not reachable yet; retrying in the background")
+
+    def publish(self, channel: str, message: Any) -> None:
+        writer = self._writer
+        if writer is None or writer.transport.get_write_buffer_size() > self.max_buffer_bytes:
+            self._counters["dropped"] += 1
+            return
+        writer.write(pack_message(channel, message))
+        self._counters["published"] += 1
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await self._ensure_broker()
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(self.reconnect_s)
+                continue
+
+            self._writer = writer
+            self._connected.set()
+            try:
+                while True:
+                    channel, message = unpack_message(await _read_frame(reader))
+                    self._counters["received"] += 1
+                    self._dispatch(channel, message)
+            except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+                if not self._closing:
+                    print(f"Lost state broker connection: {e!r}")
+            finally:
+                self._writer = None
+                self._connected.clear()
+                writer.close()
+            if not self._closing:
+                self._counters["reconnects"] += 1
+                await asyncio.sleep(self.reconnect_s)
+
+    async def _ensure_broker(self) -> None:
+        """Start the broker in this worker if no other worker holds the lock."""
+        if self._server is not None:
+            return
+        import fcntl  # Unix only
+
+        if self._lock_file is None:
+            self._lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        # Holding the lock means any existing socket file is left over from a dead broker
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._serve_peer, path=self.path)
+        os.chmod(self.path, 0o600)
+        print(f"State broker listening on {self.path} (pid {os.getpid()})")
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._peers.add(writer)
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                prefix = _LENGTH.pack(len(frame))
+                for peer in tuple(self._peers):
+                    if peer is writer:
+                        continue
+                    if peer.transport.get_write_buffer_size() > self.max_buffer_bytes:
+                        self._counters["broker_dropped"] += 1
+                        continue
+                    peer.writelines((prefix, frame))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # Loop shutdown; returning normally keeps asyncio's stream callback
+            # from logging the cancelled handler as an error
+            pass
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        if self._server is not None:
+            self._server.close()
+            for peer in tuple(self._peers):
+                peer.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        if self._lock_file is not None:
+            self._lock_file.close()
+        await super().close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "broker": self._server is not None,
+            "broker_clients": len(self._peers) if self._server is not None else None,
+            "connected": self._writer is not None,
+            **self._counters,
+        }
+
+
+def create_backend(kind: str = "memory", socket_path: Optional[str] = None) -> StateBackend:
+    """
+    Args:
+        kind: "memory" (single worker) or "unix" (several workers on one host)
+        socket_path: Broker socket for "unix" (default: in the temp directory)
+    """
+    if kind == "memory":
+        return InProcessBackend()
+    if kind == "unix":
+        return UnixSocketBackend(socket_path or DEFAULT_SOCKET_PATH)
+    raise ValueError(f"Unknown state backend: {kind}")
@@ -0,0 +1,133 @@
+import asyncio
+import itertools
+from typing import Any, Dict, Optional
+
+DEFAULT_ROOM = "default"
+
+
+class _Room:
+    """Peers of one phone/PC session plus its relay counters."""
+
+    def __init__(self, room_id: str):
+        self.id = room_id
+        self.peers: Dict[int, Any] = {}
+        self.messages = 0
+        self.relayed = 0
+        self.bytes = 0
+        self.send_errors = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "peers": len(self.peers),
+            "messages": self.messages,
+            "relayed": self.relayed,
+            "bytes": self.bytes,
+            "send_errors": self.send_errors,
+        }
+
+
+class SignalingRooms:
+    """
+    Room-scoped registry for the /ws signaling relay.
+
+    Peers are indexed by room, so an SDP/ICE message is only sent to the other
+    peers of its own room (normally exactly one counterpart) instead of every
+    connected socket. Sends to the counterparts of one message run
+    concurrently.
+    """
+
+    def __init__(self, max_peers_per_room: int = 2):
+        """
+        Args:
+            max_peers_per_room: Further joins to a full room are refused (0 = unlimited)
+        """
+        self.max_peers_per_room = max_peers_per_room
+        self._rooms: Dict[str, _Room] = {}
+        self._ids = itertools.count(1)
+        self._closed = {"rooms": 0, "messages": 0, "relayed": 0, "bytes": 0, "send_errors": 0}
+
+    def __len__(self) -> int:
+        """Total connected peers across rooms."""
+        return sum(len(room.peers) for room in self._rooms.values())
+
+    def join(self, room_id: str, websocket) -> Optional[int]:
+        """
+        Add a peer to a room, creating the room on first join.
+
+        Returns:
+            Peer id, or None if the room is full
+        """
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms[room_id] = _Room(room_id)
+        if self.max_peers_per_room and len(room.peers) >= self.max_peers_per_room:
+            return None
+        peer_id = next(self._ids)
+        room.peers[peer_id] = websocket
+        return peer_id
+
+    def leave(self, room_id: str, peer_id: int) -> None:
+        room = self._rooms.get(room_id)
+        if room is None:
+            return
+        room.peers.pop(peer_id, None)
+        if not room.peers:
+            # Fold the finished room into the totals so stats stay bounded
+            del self._rooms[room_id]
+            self._closed["rooms"] += 1
+            for key in ("messages", "relayed", "bytes", "send_errors"):
+                self._closed[key] += getattr(room, key)
+
+    async def relay(self, room_id: str, sender_id: Optional[int], data: str) -> int:
+        """
+        Send a message to every other peer in the sender's room.
+
+        Peers whose send fails are removed after all sends complete.
+
+        Args:
+            room_id: Room the message belongs to
+            sender_id: Sending peer, or None for a message relayed from another
+                       worker (delivered to all local peers of the room)
+            data: Signaling message text
+
+        Returns:
+            Number of peers the message was delivered to
+        """
+        room = self._rooms.get(room_id)
+        if room is None:
+            return 0
+        if sender_id is not None:
+            room.messages += 1
+        targets = [(pid, ws) for pid, ws in room.peers.items() if pid != sender_id]
+        if not targets:
+            return 0
+        results = await asyncio.gather(*(ws.send_text(data) for _, ws in targets), return_exceptions=True)
+
+        failed = [pid for (pid, _), outcome in zip(targets, results) if isinstance(outcome, BaseException)]
+        delivered = len(targets) - len(failed)
+        # Count before pruning: leave() may close the room and fold its counters
+        # into the totals
+        if self._rooms.get(room_id) is room:
+            room.send_errors += len(failed)
+            room.relayed += delivered
+            room.bytes += delivered * len(data)
+        else:
+            # The room closed while the sends were awaited
+            self._closed["send_errors"] += len(failed)
+            self._closed["relayed"] += delivered
+            self._closed["bytes"] += delivered * len(data)
+        for pid in failed:
+            self.leave(room_id, pid)
+        return delivered
+
+    def stats(self) -> Dict[str, Any]:
+        rooms = {rid: room.stats() for rid, room in self._rooms.items()}
+        totals = {key: self._closed[key] + sum(r[key] for r in rooms.values())
+                  for key in ("messages", "relayed", "bytes", "send_errors")}
+        return {
+            "active_rooms": len(rooms),
+            "closed_rooms": self._closed["rooms"],
+            "peers": sum(r["peers"] for r in rooms.values()),
+            **totals,
+            "rooms": rooms,
+        }
@@ -0,0 +1,212 @@
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+Detections = List[Dict[str, Any]]
+
+# Modes reported per frame
+KEYFRAME, FLOW, STATIC = "keyframe", "flow", "static"
+
+
+class TemporalState:
+    """What one session remembers between frames (small and picklable)."""
+
+    __slots__ = ("thumb", "detections", "since_keyframe", "next_track_id", "options")
+
+    def __init__(self, thumb: np.ndarray, detections: Detections, next_track_id: int, options: Dict[str, Any]):
+        self.thumb = thumb
+        self.detections = detections
+        self.since_keyframe = 0
+        self.next_track_id = next_track_id
+        self.options = options
+
+
+class TemporalGate:
+    """
+    Motion-gated detection for a frame stream.
+
+    Each frame is reduced to a small grayscale thumbnail and compared with the
+    last processed one by the fraction of pixels that changed noticeably:
+
+    - nearly identical: the previous detections are returned as they are
+    - moderate change: previous boxes are shifted by the median sparse optical
+      flow (Lucas-Kanade) of corner features around each box
+    - scene change, every keyframe_interval frames, or no history: full
+      detection, with track ids carried over by IoU / centroid matching
+
+    Detections get a stable "track_id" on top of the usual contract fields.
+    """
+
+    def __init__(
+        self,
+        keyframe_interval: int = 10,
+        static_fraction: float = 0.002,
+        scene_change_fraction: float = 0.3,
+        pixel_threshold: int = 15,
+        thumb_width: int = 160,
+        match_iou: float = 0.3,
+    ):
+        """
+        Args:
+            keyframe_interval: Run full detection at least every this many frames
+            static_fraction: Changed-pixel fraction below which the frame counts as unchanged
+            scene_change_fraction: Changed-pixel fraction at or above which detection runs immediately
+            pixel_threshold: Gray-level difference for a thumbnail pixel to count as
+                             changed (keeps sensor noise out of the gate)
+            thumb_width: Width of the motion/flow thumbnail in pixels
+            match_iou: Minimum IoU to keep a track id across a keyframe
+        """
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.static_fraction = static_fraction
+        self.scene_change_fraction = scene_change_fraction
+        self.pixel_threshold = pixel_threshold
+        self.thumb_width = thumb_width
+        self.match_iou = match_iou
+
+    def thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        tw = min(self.thumb_width, w)
+        th = max(1, round(h * tw / w))
+        small = cv2.resize(frame, (tw, th), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def changed_fraction(self, prev: np.ndarray, cur: np.ndarray) -> float:
+        _, changed = cv2.threshold(cv2.absdiff(prev, cur), self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(changed) / changed.size
+
+    def step(
+        self,
+        frame: np.ndarray,
+        state: Optional[TemporalState],
+        detect: Callable[[], Detections],
+        options: Optional[Dict[str, Any]] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Tuple[Detections, TemporalState, str]:
+        """
+        Produce detections for the next frame of a session.
+
+        Args:
+            frame: BGR frame
+            state: State returned for the previous frame, or None
+            detect: Runs full detection on frame (contract-format detections)
+            options: Detection options; a change forces a keyframe
+            timings: If given, "motion" (gating + flow) time in seconds is added
+
+        Returns:
+            (detections with track_id, new state, mode)
+        """
+        options = options or {}
+        start = time.perf_counter()
+        thumb = self.thumbnail(frame)
+
+        mode = KEYFRAME
+        if state is not None and state.options == options and state.thumb.shape == thumb.shape:
+            changed = self.changed_fraction(state.thumb, thumb)
+            if state.since_keyframe + 1 < self.keyframe_interval and changed < self.scene_change_fraction:
+                mode = STATIC if changed < self.static_fraction else FLOW
+
+        if mode == STATIC:
+            # Keep comparing against the last processed thumbnail so slow drift
+            # still adds up to a visible change
+            state.since_keyframe += 1
+            detections = state.detections
+        elif mode == FLOW:
+            detections = self._propagate(state.thumb, thumb, state.detections)
+            state.thumb = thumb
+            state.detections = detections
+            state.since_keyframe += 1
+        if timings is not None:
+            timings["motion"] = time.perf_counter() - start
+        if mode != KEYFRAME:
+            return detections, state, mode
+
+        previous = state.detections if state is not None else []
+        next_id = state.next_track_id if state is not None else 1
+        detections, next_id = self._assign_ids(detect(), previous, next_id)
+        return detections, TemporalState(thumb, detections, next_id, options), KEYFRAME
+
+    def _propagate(self, prev: np.ndarray, cur: np.ndarray, detections: Detections) -> Detections:
+        """Shift each box by the median optical flow of features in and around it."""
+        if not detections:
+            return detections
+        th, tw = prev.shape
+        scale = np.array([tw, th, tw, th], np.float32)
+        boxes = np.array([[d["xmin"], d["ymin"], d["xmax"], d["ymax"]] for d in detections], np.float32) * scale
+
+        mask = np.zeros_like(prev)
+        points, owners = [], []
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            # Uniform blobs have no interior texture; their corners sit on the edge
+            mx, my = 0.15 * (x2 - x1) + 2, 0.15 * (y2 - y1) + 2
+            mask[:] = 0
+            mask[max(0, int(y1 - my)):int(y2 + my) + 1, max(0, int(x1 - mx)):int(x2 + mx) + 1] = 255
+            found = cv2.goodFeaturesToTrack(prev, maxCorners=16, qualityLevel=0.01, minDistance=2, mask=mask)
+            if found is not None:
+                points.append(found.reshape(-1, 2))
+                owners.append(np.full(len(found), i))
+        if not points:
+            return detections
+
+        p0 = np.concatenate(points).astype(np.float32)
+        owner = np.concatenate(owners)
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(prev, cur, p0.reshape(-1, 1, 2), None, winSize=(15, 15), maxLevel=2)
+        ok = status.reshape(-1) == 1
+        motion = (p1.reshape(-1, 2) - p0)[ok]
+        owner = owner[ok]
+
+        moved = []
+        for i, det in enumerate(detections):
+            flow = motion[owner == i]
+            if len(flow) == 0:
+                moved.append(det)
+                continue
+            dx, dy = np.median(flow, axis=0) / scale[:2]
+            # Keep the box size; clamp the shifted box into the frame
+            dx = float(np.clip(dx, -det["xmin"], 1.0 - det["xmax"]))
+            dy = float(np.clip(dy, -det["ymin"], 1.0 - det["ymax"]))
+            moved.append(dict(det, xmin=det["xmin"] + dx, xmax=det["xmax"] + dx,
+                              ymin=det["ymin"] + dy, ymax=det["ymax"] + dy))
+        return moved
+
+    def _assign_ids(self, detections: Detections, previous: Detections, next_id: int) -> Tuple[Detections, int]:
+        """
+        Carry track ids from previous to new detections of the same label: greedy
+        by IoU first, then nearest centroid within one box size.
+        """
+        ids: List[Optional[int]] = [None] * len(detections)
+        if detections and previous:
+            new = np.array([[d["xmin"], d["ymin"], d["xmax"], d["ymax"]] for d in detections], np.float64)
+            old = np.array([[d["xmin"], d["ymin"], d["xmax"], d["ymax"]] for d in previous], np.float64)
+            same = np.array([[n["label"] == o["label"] for o in previous] for n in detections])
+
+            iw = np.clip(np.minimum(new[:, None, 2], old[None, :, 2]) - np.maximum(new[:, None, 0], old[None, :, 0]), 0, None)
+            ih = np.clip(np.minimum(new[:, None, 3], old[None, :, 3]) - np.maximum(new[:, None, 1], old[None, :, 1]), 0, None)
+            inter = iw * ih
+            area_new = (new[:, 2] - new[:, 0]) * (new[:, 3] - new[:, 1])
+            area_old = (old[:, 2] - old[:, 0]) * (old[:, 3] - old[:, 1])
+            iou = np.where(same, inter / np.maximum(area_new[:, None] + area_old[None, :] - inter, 1e-9), 0.0)
+
+            centers_new = (new[:, :2] + new[:, 2:]) / 2
+            centers_old = (old[:, :2] + old[:, 2:]) / 2
+            dist = np.linalg.norm(centers_new[:, None] - centers_old[None, :], axis=2)
+            reach = np.maximum(old[:, 2] - old[:, 0], old[:, 3] - old[:, 1])[None, :]
+            dist = np.where(same & (dist <= reach), dist, np.inf)
+
+            used_old = set()
+            for score, better in ((iou, lambda v: v >= self.match_iou), (-dist, np.isfinite)):
+                for flat in np.argsort(-score, axis=None):
+                    n, o = np.unravel_index(flat, score.shape)
+                    if not better(score[n, o]):
+                        break
+                    if ids[n] is None and o not in used_old and "track_id" in previous[o]:
+                        ids[n] = previous[o]["track_id"]
+                        used_old.add(o)
+
+        tracked = []
+        for det, track_id in zip(detections, ids):
+            if track_id is None:
+                track_id, next_id = next_id, next_id + 1
+            tracked.append(dict(det, track_id=track_id))
+        return tracked, next_id
@@ -0,0 +1,222 @@
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+Detections = List[Dict[str, Any]]
+# Pixel rectangle x0, y0, x1, y1 (x1/y1 exclusive)
+Region = Tuple[int, int, int, int]
+# Where a region's crop sits in a packed canvas: x, y, width, height
+Placement = Tuple[int, int, int, int]
+
+# Modes reported per frame
+SWEEP, ROI = "sweep", "roi"
+
+
+def _starts(size: int, tile: int, overlap: float) -> List[int]:
+    if size <= tile:
+        return [0]
+    step = max(1, int(tile * (1.0 - overlap)))
+    count = math.ceil((size - tile) / step) + 1
+    # Spread the tiles evenly so the last one ends exactly at the frame edge
+    return [round(i * (size - tile) / (count - 1)) for i in range(count)]
+
+
+def tile_grid(width: int, height: int, tile_w: int, tile_h: int, overlap: float = 0.2) -> List[Region]:
+    """
+    Overlapping tiles covering a frame, each at most tile_w x tile_h.
+
+    Args:
+        width: Frame width in pixels
+        height: Frame height in pixels
+        tile_w: Tile width (normally the model input width, so tiles aren't resized)
+        tile_h: Tile height
+        overlap: Minimum fraction of a tile shared with its neighbour, so an
+                 object cut by one tile border lies whole inside the next tile
+
+    Returns:
+        Tiles row by row
+    """
+    xs = _starts(width, tile_w, overlap)
+    ys = _starts(height, tile_h, overlap)
+    return [(x, y, min(x + tile_w, width), min(y + tile_h, height)) for y in ys for x in xs]
+
+
+def merge_regions(regions: Sequence[Region]) -> List[Region]:
+    """Replace overlapping rectangles by their bounding rectangle until none overlap."""
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        out: List[Region] = []
+        for region in merged:
+            for i, other in enumerate(out):
+                if region[0] < other[2] and other[0] < region[2] and region[1] < other[3] and other[1] < region[3]:
+                    out[i] = (min(region[0], other[0]), min(region[1], other[1]),
+                              max(region[2], other[2]), max(region[3], other[3]))
+                    changed = True
+                    break
+            else:
+                out.append(region)
+        merged = out
+    return merged
+
+
+def roi_regions(detections: Detections, width: int, height: int, margin: float = 0.5,
+                min_size: int = 96) -> List[Region]:
+    """
+    Search regions around contract detections: each box grown by margin times
+    its larger side on every side (at least min_size pixels square), clamped to
+    the frame, with overlapping regions merged.
+    """
+    regions = []
+    for det in detections:
+        x0, y0 = det["xmin"] * width, det["ymin"] * height
+        x1, y1 = det["xmax"] * width, det["ymax"] * height
+        pad = margin * max(x1 - x0, y1 - y0)
+        half_w = max((x1 - x0) / 2 + pad, min_size / 2)
+        half_h = max((y1 - y0) / 2 + pad, min_size / 2)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        region = (max(0, int(cx - half_w)), max(0, int(cy - half_h)),
+                  min(width, math.ceil(cx + half_w)), min(height, math.ceil(cy + half_h)))
+        if region[2] > region[0] and region[3] > region[1]:
+            regions.append(region)
+    return merge_regions(regions)
+
+
+def _shelf_pack(sizes: Sequence[Tuple[int, int]], scale: float, canvas_w: int, canvas_h: int,
+                gap: int) -> Optional[List[Placement]]:
+    placements: List[Optional[Placement]] = [None] * len(sizes)
+    x = y = shelf_h = 0
+    # Tallest first keeps the shelves tight
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        w, h = max(1, int(sizes[i][0] * scale)), max(1, int(sizes[i][1] * scale))
+        if w > canvas_w or h > canvas_h:
+            return None
+        if x + w > canvas_w:
+            x, y, shelf_h = 0, y + shelf_h + gap, 0
+        if y + h > canvas_h:
+            return None
+        placements[i] = (x, y, w, h)
+        x += w + gap
+        shelf_h = max(shelf_h, h)
+    return placements
+
+
+def pack_regions(regions: Sequence[Region], canvas_w: int, canvas_h: int, gap: int = 8,
+                 min_scale: float = 0.5, max_scale: float = 1.0) -> Optional[Tuple[float, List[Placement]]]:
+    """
+    Pack region crops side by side into one canvas (shelf packing), all at the
+    same scale: max_scale when they fit, otherwise the largest scale down to
+    min_scale that does. The gap keeps neighbouring crops apart so the model
+    doesn't see one object across two of them.
+
+    Returns:
+        (scale, placement per region), or None if they don't fit at min_scale
+    """
+    if not regions:
+        return None
+    sizes = [(x1 - x0, y1 - y0) for x0, y0, x1, y1 in regions]
+    area = sum((w + gap) * (h + gap) for w, h in sizes)
+    scale = min(max_scale, math.sqrt(canvas_w * canvas_h / area))
+    while scale >= min_scale:
+        placements = _shelf_pack(sizes, scale, canvas_w, canvas_h, gap)
+        if placements is not None:
+            return scale, placements
+        scale *= 0.9
+    return None
+
+
+class RoiState:
+    """What one session remembers between frames for ROI mode (small and picklable)."""
+
+    __slots__ = ("detections", "since_sweep", "frame_size", "options")
+
+    def __init__(self, detections: Detections, frame_size: Tuple[int, int], options: Dict[str, Any]):
+        self.detections = detections
+        self.since_sweep = 0
+        self.frame_size = frame_size
+        self.options = options
+
+
+class RoiPlanner:
+    """
+    Region-of-interest detection for a frame stream.
+
+    After a full-frame sweep, the following frames are only searched around
+    the previous detections (plus a margin for motion): the color path
+    classifies just those crops, the model path packs them into a single
+    model input (see VLMDetector.detect_regions), at native resolution where
+    they fit, so small objects keep their pixels instead of being downscaled
+    with the whole frame. A sweep runs every sweep_interval frames to pick up new
+    objects, and immediately when there is nothing to follow, the regions
+    would cover most of the frame anyway, the frame size or options changed,
+    or the regions don't fit the model input.
+    """
+
+    def __init__(self, sweep_interval: int = 10, margin: float = 0.5, min_size: int = 96,
+                 max_coverage: float = 0.5):
+        """
+        Args:
+            sweep_interval: Run full-frame detection at least every this many frames
+            margin: Search margin around each previous box, as a fraction of its larger side
+            min_size: Smallest search region side in pixels
+            max_coverage: Sweep instead when the regions cover more than this fraction of the frame
+        """
+        self.sweep_interval = max(1, sweep_interval)
+        self.margin = margin
+        self.min_size = min_size
+        self.max_coverage = max_coverage
+
+    def plan(self, state: Optional[RoiState], width: int, height: int,
+             options: Dict[str, Any]) -> Optional[List[Region]]:
+        """Regions to search in the next frame, or None for a full-frame sweep."""
+        if (state is None or not state.detections or state.frame_size != (width, height)
+                or state.options != options or state.since_sweep + 1 >= self.sweep_interval):
+            return None
+        regions = roi_regions(state.detections, width, height, self.margin, self.min_size)
+        covered = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions)
+        if not regions or covered > self.max_coverage * width * height:
+            return None
+        return regions
+
+    def step(
+        self,
+        frame,
+        state: Optional[RoiState],
+        detector,
+        options: Optional[Dict[str, Any]] = None,
+        timings: Optional[Dict[str, float]] = None,
+        state_options: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[Detections, RoiState, str]:
+        """
+        Produce detections for the next frame of a session.
+
+        Args:
+            frame: BGR frame
+            state: State returned for the previous frame, or None
+            detector: VLMDetector (detect_contract / detect_regions)
+            options: detect_contract keyword arguments
+            timings: If given, filled by the detector plus "roi" (planning) time in seconds
+            state_options: Options a change of which forces a sweep (default: options)
+
+        Returns:
+            (detections, new state, mode)
+        """
+        options = options or {}
+        state_options = options if state_options is None else state_options
+        h, w = frame.shape[:2]
+        start = time.perf_counter()
+        regions = self.plan(state, w, h, state_options)
+        if timings is not None:
+            timings["roi"] = time.perf_counter() - start
+
+        detections = None
+        if regions is not None:
+            detections = detector.detect_regions(frame, regions, timings=timings, **options)
+        if detections is None:
+            detections = detector.detect_contract(frame, timings=timings, **options)
+            return detections, RoiState(detections, (w, h), state_options), SWEEP
+
+        state.since_sweep += 1
+        state.detections = detections
+        return detections, state, ROI
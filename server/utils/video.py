@@ -0,0 +1,274 @@
+import asyncio
+import concurrent.futures
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from server.utils.model_registry import ModelSpec
+
+# (source frame index, timestamp in ms, BGR frame)
+VideoFrame = Tuple[int, float, np.ndarray]
+
+
+def resolve_video_path(video_dir: Optional[str], path: str) -> str:
+    """
+    Local video path for a request, confined to video_dir.
+
+    Raises:
+        ValueError: Local paths are disabled, or path escapes video_dir / doesn't exist
+    """
+    if not video_dir:
+        raise ValueError("Local video paths are disabled (set VIDEO_DIR)")
+    root = os.path.realpath(video_dir)
+    full = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full]) != root:
+        raise ValueError("Video path is outside VIDEO_DIR")
+    if not os.path.isfile(full):
+        raise ValueError(f"Video not found: {path}")
+    return full
+
+
+class VideoFrameReader:
+    """
+    Decodes a video file on a producer thread into a bounded queue.
+
+    Frames are sampled before they are converted: skipped frames are only
+    grabbed (demuxed/decoded, never retrieved), kept ones are every stride-th
+    frame, thinned further to at most max_fps frames per second of video.
+    The queue holds at most queue_size decoded frames, so memory stays flat
+    however long the video is and the thread waits when the consumer is slower.
+    """
+
+    def __init__(self, path: str, stride: int = 1, max_fps: float = 0.0, max_frames: int = 0, queue_size: int = 8):
+        """
+        Args:
+            path: Video file readable by cv2.VideoCapture
+            stride: Keep every stride-th source frame
+            max_fps: At most this many frames per second of video (0 = no limit)
+            max_frames: Stop after this many frames (0 = whole video)
+            queue_size: Decoded frames buffered ahead of the consumer
+        """
+        self.path = path
+        self.stride = max(1, stride)
+        self.max_fps = max(0.0, max_fps)
+        self.max_frames = max(0, max_frames)
+        self.queue_size = max(1, queue_size)
+        self.info: Dict[str, Any] = {}
+        self.frames_read = 0
+        self.frames_emitted = 0
+        self._capture: Optional[cv2.VideoCapture] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def open(self) -> Dict[str, Any]:
+        """
+        Open the file and read its properties. Blocking; run it off the event loop.
+
+        Raises:
+            ValueError: The file can't be decoded
+        """
+        capture = cv2.VideoCapture(self.path)
+        if not capture.isOpened():
+            capture.release()
+            raise ValueError("Could not open video")
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        self._capture = capture
+        self.info = {
+            "frames": count,
+            "fps": fps,
+            "width": int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "duration_s": count / fps if fps > 0 else None,
+            "stride": self.stride,
+            "max_fps": self.max_fps or None,
+        }
+        return self.info
+
+    def start(self) -> None:
+        """Start decoding into a queue read with get(); call from the event loop after open()."""
+        if self._capture is None:
+            raise RuntimeError("open() must be called before start()")
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._thread = threading.Thread(target=self._run, name="video-reader", daemon=True)
+        self._thread.start()
+
+    async def get(self) -> Optional[VideoFrame]:
+        """Next sampled frame, or None at the end of the video."""
+        return await self._queue.get()
+
+    async def close(self) -> None:
+        """Stop decoding and release the file."""
+        self._stop.set()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+        elif self._capture is not None:
+            self._capture.release()
+        self._capture = None
+
+    def _put(self, item: Optional[VideoFrame]) -> bool:
+        """Hand an item to the event loop, waiting while the queue is full; False once stopped."""
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                if self._stop.is_set():
+                    future.cancel()
+                    return False
+
+    def _run(self) -> None:
+        capture = self._capture
+        fps = self.info.get("fps") or 0.0
+        period_ms = 1000.0 / self.max_fps if self.max_fps > 0 else 0.0
+        # Half a source frame of slack so e.g. 10 fps out of 30 fps keeps every third frame
+        tolerance_ms = 500.0 / fps if fps > 0 else 0.0
+        next_ms = 0.0
+        index = -1
+        try:
+            while not self._stop.is_set():
+                if not capture.grab():
+                    break
+                index += 1
+                self.frames_read += 1
+                if index % self.stride:
+                    continue
+                ts_ms = index * 1000.0 / fps if fps > 0 else capture.get(cv2.CAP_PROP_POS_MSEC)
+                if period_ms:
+                    if ts_ms < next_ms - tolerance_ms:
+                        continue
+                    next_ms = max(next_ms, ts_ms - tolerance_ms) + period_ms
+                ok, frame = capture.retrieve()
+                if not ok:
+                    continue
+                if not self._put((index, ts_ms, frame)):
+                    return
+                self.frames_emitted += 1
+                if self.max_frames and self.frames_emitted >= self.max_frames:
+                    break
+            self._put(None)
+        except Exception as e:
+            print(f"Video decode failed: {e}")
+            self._put(None)
+        finally:
+            capture.release()
+
+
+async def detect_video(
+    scheduler,
+    reader: VideoFrameReader,
+    options: Optional[Dict[str, Any]] = None,
+    model: Optional[ModelSpec] = None,
+    max_inflight: int = 2,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run every frame of a started reader through the scheduler's worker pool.
+
+    Up to max_inflight frames are in detection at once; results are yielded
+    in frame order as soon as the oldest one is ready, so decode, detection
+    and the consumer's serialization overlap.
+
+    Yields:
+        {"index", "ts_ms", "width", "height", "detections"} per frame, or
+        {"index", "ts_ms", "error"} when detection failed
+    """
+    pending: Deque[Tuple[int, float, asyncio.Future]] = deque()
+    max_inflight = max(1, max_inflight)
+
+    def finished(index: int, ts_ms: float, task: asyncio.Future) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {"index": index, "ts_ms": round(ts_ms, 3)}
+        try:
+            job = task.result()
+        except Exception as e:
+            job = {"error": str(e)}
+        if "error" in job:
+            entry["error"] = job["error"]
+        else:
+            entry.update(width=job["width"], height=job["height"], detections=job["detections"])
+            entry["inference_ms"] = round(sum(job.get("timings", {}).values()) * 1000.0, 3)
+        return entry
+
+    try:
+        while True:
+            item = await reader.get()
+            if item is None:
+                break
+            index, ts_ms, frame = item
+            pending.append((index, ts_ms, asyncio.ensure_future(scheduler.detect_frame(frame, options, model))))
+            del item, frame
+            # Ordered reassembly: yield from the head whenever it's done or the window is full
+            while pending and (len(pending) >= max_inflight or pending[0][2].done()):
+                index, ts_ms, task = pending.popleft()
+                await asyncio.wait({task})
+                yield finished(index, ts_ms, task)
+        while pending:
+            index, ts_ms, task = pending.popleft()
+            await asyncio.wait({task})
+            yield finished(index, ts_ms, task)
+    finally:
+        for _, _, task in pending:
+            task.cancel()
+
+
+class VideoJobStats:
+    """Timing of one video job for its closing summary line."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.processed = 0
+        self.errors = 0
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        if "error" in entry:
+            self.errors += 1
+        else:
+            self.processed += 1
+
+    def summary(self, reader: VideoFrameReader) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        done = self.processed + self.errors
+        return {
+            "frames_read": reader.frames_read,
+            "frames_sampled": reader.frames_emitted,
+            "frames_processed": self.processed,
+            "errors": self.errors,
+            "elapsed_s": round(elapsed, 3),
+            "processing_fps": round(done / elapsed, 2) if elapsed > 0 else None,
+        }
+
+
+async def spool_to_file(chunks: AsyncIterator[bytes], max_bytes: int, suffix: str = ".video") -> str:
+    """
+    Write an uploaded stream to a temporary file (cv2.VideoCapture needs a
+    path). Disk writes run off the event loop; the caller deletes the file.
+
+    Raises:
+        ValueError: The upload exceeds max_bytes (0 = unlimited) or is empty
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="vlm-video-")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise ValueError(f"Video exceeds {max_bytes // 2**20} MB")
+                if chunk:
+                    await asyncio.to_thread(f.write, chunk)
+        if size == 0:
+            raise ValueError("No video data provided")
+        return path
+    except BaseException:
+        os.remove(path)
+        raise
@@ -1,23 +1,84 @@
 import cv2
 import numpy as np
-import onnxruntime as ort
 import os
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+from server.utils.color_classifier import ColorClassifier
+from server.utils.onnx_session import create_session, warm_up
+from server.utils.postprocess import (
+    BoxTransform,
+    DEFAULT_CONF_THRESHOLD,
+    DEFAULT_IOU_THRESHOLD,
+    DEFAULT_TOP_K,
+    arrays_to_contract,
+    empty_arrays,
+    nms,
+    normalize_detections,
+    postprocess_model_output,
+)
+from server.utils.preprocess import Preprocessor
+from server.utils.tiling import Region, pack_regions, tile_grid
 
 class VLMDetector:
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        batcher=None,
+        mask_scale: float = 1.0,
+        letterbox: bool = False,
+        session_config: Optional[Dict[str, Any]] = None,
+        warmup_runs: int = 1,
+        session=None,
+        tiling: bool = False,
+        tile_overlap: float = 0.2,
+        tile_min_side: int = 1280,
+    ):
         """
         Initialize the VLM detector.
         
         Args:
             model_path: Path to the ONNX model file. If None, uses a simple color-based detection.
+            batcher: Optional shared BatchingEngine; when given, inference goes through it
+                     (and its session) instead of a private InferenceSession.
+            mask_scale: Downscale factor for the color-detection mask (1.0 = full resolution)
+            letterbox: Keep the frame aspect ratio (pad) when resizing to the model input
+            session_config: create_session keyword arguments (threads, optimization level, ...)
+            warmup_runs: Dummy inferences run at load time so the first frame isn't slow
+            session: Optional already loaded (and warmed up) InferenceSession shared
+                     with other detectors, e.g. from the ModelRegistry
+            tiling: Run frames whose longer side is at least tile_min_side through
+                    the model as overlapping native-resolution tiles (see _tiled_arrays)
+            tile_overlap: Fraction of a tile shared with its neighbours
+            tile_min_side: Smallest frame side (longer one) that is tiled
         """
         self.model_path = model_path
         self.session = None
+        self.batcher = batcher
+        self.color_classifier = ColorClassifier(mask_scale=mask_scale)
+        # Model input (width, height)
+        self.input_size = (640, 640)
+        self.preprocessor = Preprocessor(self.input_size, letterbox=letterbox)
+        self.input_name = 'input'
+        self.tiling = tiling
+        self.tile_overlap = tile_overlap
+        self.tile_min_side = tile_min_side
+        self._tile_tensor: Optional[np.ndarray] = None
         
-        if model_path and os.path.exists(model_path):
+        if batcher is not None:
+            # The shared engine owns (and has already warmed up) the session
+            self.session = batcher.session
+            self.input_name = batcher.input_name
+            self.use_model = True
+        elif session is not None:
+            self.session = session
+            self.input_name = session.get_inputs()[0].name
+            self.use_model = True
+        elif model_path and os.path.exists(model_path):
             try:
-                self.session = ort.InferenceSession(model_path)
+                self.session = create_session(model_path, **(session_config or {}))
+                self.input_name = self.session.get_inputs()[0].name
+                warm_up(self.session, self.input_size, warmup_runs)
                 self.use_model = True
             except Exception as e:
                 print(f"Failed to load model: {e}")
@@ -25,6 +86,10 @@ class VLMDetector:
         else:
             self.use_model = False
             print("No model provided, using simple color-based detection")
+
+        # Tiles go through the model as one batch unless the batch dimension is fixed
+        batch_dim = self.session.get_inputs()[0].shape[0] if self.session is not None else None
+        self.batch_dim = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
     
     def detect_objects(self, frame: np.ndarray) -> List[Dict[str, Any]]:
         """
@@ -40,6 +105,108 @@ class VLMDetector:
             return self._detect_with_model(frame)
         else:
             return self._detect_simple(frame)
+
+    def detect_contract(
+        self,
+        frame: np.ndarray,
+        conf_threshold: Optional[float] = None,
+        iou_threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Detect objects and return them directly in the normalized API contract format.
+
+        Args:
+            frame: Input frame as numpy array (BGR format)
+            conf_threshold: Minimum score (model default 0.5; color path unfiltered if None)
+            iou_threshold: Class-aware NMS overlap threshold (model path only)
+            top_k: Maximum number of detections
+            timings: If given, filled with "inference" and "contract" durations in seconds
+
+        Returns:
+            List of {label, score, xmin, ymin, xmax, ymax} with coordinates in [0, 1]
+        """
+        start = time.perf_counter()
+        h, w = frame.shape[:2]
+        if self.use_model and self.session:
+            if self.tiling and max(w, h) >= self.tile_min_side:
+                boxes, scores, class_ids = self._tiled_arrays(frame, conf_threshold, iou_threshold, top_k)
+            else:
+                boxes, scores, class_ids = self._model_arrays(frame, conf_threshold, iou_threshold, top_k)
+            inferred = time.perf_counter()
+            contract = arrays_to_contract(boxes, scores, class_ids)
+        else:
+            detections = self._filter_simple(self._detect_simple(frame), conf_threshold, top_k)
+            inferred = time.perf_counter()
+            contract = normalize_detections(detections, w, h)
+        if timings is not None:
+            timings["inference"] = inferred - start
+            timings["contract"] = time.perf_counter() - inferred
+        return contract
+
+    def detect_regions(
+        self,
+        frame: np.ndarray,
+        regions: List[Region],
+        conf_threshold: Optional[float] = None,
+        iou_threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Detect objects only inside some regions of a frame (see RoiPlanner).
+
+        The color path classifies each crop; the model path packs all crops
+        into one model input, at the scale a full-frame pass would use or
+        finer, and runs it once.
+
+        Args:
+            frame: Input frame as numpy array (BGR format)
+            regions: Non-overlapping pixel rectangles x0, y0, x1, y1
+            conf_threshold, iou_threshold, top_k, timings: As for detect_contract
+
+        Returns:
+            Contract detections in full-frame coordinates, or None if the regions
+            don't fit into the model input (detect the whole frame instead)
+        """
+        start = time.perf_counter()
+        h, w = frame.shape[:2]
+        if self.use_model and self.session:
+            in_w, in_h = self.input_size
+            # Never coarser than the full frame would be seen
+            frame_scale = min(in_w / w, in_h / h)
+            packed = pack_regions(regions, in_w, in_h, min_scale=frame_scale, max_scale=max(1.0, frame_scale))
+            if packed is None:
+                return None
+            boxes, scores, class_ids = self._mosaic_arrays(frame, regions, packed[1], conf_threshold,
+                                                           iou_threshold, top_k)
+            inferred = time.perf_counter()
+            contract = arrays_to_contract(boxes, scores, class_ids)
+        else:
+            detections = []
+            for x0, y0, x1, y1 in regions:
+                for det in self._detect_simple(frame[y0:y1, x0:x1]):
+                    bx0, by0, bx1, by1 = det['bbox']
+                    det['bbox'] = [bx0 + x0, by0 + y0, bx1 + x0, by1 + y0]
+                    detections.append(det)
+            detections = self._filter_simple(detections, conf_threshold, top_k)
+            inferred = time.perf_counter()
+            contract = normalize_detections(detections, w, h)
+        if timings is not None:
+            timings["inference"] = inferred - start
+            timings["contract"] = time.perf_counter() - inferred
+        return contract
+
+    @staticmethod
+    def _filter_simple(
+        detections: List[Dict[str, Any]], conf_threshold: Optional[float], top_k: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        if conf_threshold is not None:
+            detections = [d for d in detections if d['confidence'] > conf_threshold]
+        if top_k is not None and top_k > 0:
+            detections = sorted(detections, key=lambda d: d['confidence'], reverse=True)[:top_k]
+        return detections
     
     def _detect_with_model(self, frame: np.ndarray) -> List[Dict[str, Any]]:
         """
@@ -47,137 +214,222 @@ class VLMDetector:
         This is a placeholder implementation - you would need to adjust this
         based on your specific model's input/output format.
         """
-        # Resize frame to model input size (example: 640x640)
-        input_size = (640, 640)
-        resized_frame = cv2.resize(frame, input_size)
-        
-        # Convert BGR to RGB
-        rgb_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
-        
-        # Normalize pixel values to [0, 1]
-        input_image = rgb_frame.astype(np.float32) / 255.0
-        
-        # Change HWC to CHW format
-        input_image = np.transpose(input_image, (2, 0, 1))
-        
-        # Add batch dimension
-        input_image = np.expand_dims(input_image, axis=0)
-        
-        # Run inference
+        boxes, scores, class_ids = self._model_arrays(frame)
+        h, w = frame.shape[:2]
+        pixel_boxes = (boxes * np.array([w, h, w, h], np.float32)).astype(np.int64)
+        return [
+            {
+                'bbox': bbox,
+                'confidence': score,
+                'class_id': class_id,
+                'label': f'object_{class_id}'
+            }
+            for bbox, score, class_id in zip(pixel_boxes.tolist(), scores.tolist(), class_ids.tolist())
+        ]
+
+    def _model_arrays(
+        self,
+        frame: np.ndarray,
+        conf_threshold: Optional[float] = None,
+        iou_threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+    ):
+        """
+        Run the model and vectorized post-processing.
+
+        Returns:
+            (boxes, scores, class_ids) arrays, boxes normalized to the frame
+        """
+        output, transform = self._run_model(frame)
+        if output is None:
+            return empty_arrays()
+        return self._postprocess(output, transform, conf_threshold, iou_threshold, top_k)
+
+    @staticmethod
+    def _postprocess(output, transform, conf_threshold, iou_threshold, top_k):
+        return postprocess_model_output(
+            output,
+            transform,
+            conf_threshold=DEFAULT_CONF_THRESHOLD if conf_threshold is None else conf_threshold,
+            iou_threshold=DEFAULT_IOU_THRESHOLD if iou_threshold is None else iou_threshold,
+            top_k=DEFAULT_TOP_K if top_k is None else top_k,
+        )
+
+    def _tiled_arrays(
+        self,
+        frame: np.ndarray,
+        conf_threshold: Optional[float] = None,
+        iou_threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+    ):
+        """
+        Model pass over overlapping model-input-sized tiles at native
+        resolution, plus the whole (resized) frame for objects larger than a
+        tile. All views are pre-processed into one batch tensor and run
+        together; per-view boxes are mapped to frame coordinates and merged by
+        class-aware NMS across tiles.
+
+        Returns:
+            (boxes, scores, class_ids) arrays, boxes normalized to the frame
+        """
+        h, w = frame.shape[:2]
+        in_w, in_h = self.input_size
+        views = tile_grid(w, h, in_w, in_h, self.tile_overlap) + [(0, 0, w, h)]
+        if self._tile_tensor is None or len(self._tile_tensor) < len(views):
+            self._tile_tensor = np.empty((len(views), 3, in_h, in_w), np.float32)
+        batch = self._tile_tensor[:len(views)]
+        transforms = [
+            self.preprocessor.into(frame[y0:y1, x0:x1], batch[i]) for i, (x0, y0, x1, y1) in enumerate(views)
+        ]
+        outputs = self._infer_views(batch)
+        if outputs is None:
+            return empty_arrays()
+
+        parts = []
+        for output, transform, (x0, y0, x1, y1) in zip(outputs, transforms, views):
+            boxes, scores, class_ids = self._postprocess(output, transform, conf_threshold, iou_threshold, top_k)
+            gain = np.array([(x1 - x0) / w, (y1 - y0) / h] * 2, np.float32)
+            offset = np.array([x0 / w, y0 / h] * 2, np.float32)
+            parts.append((boxes * gain + offset, scores, class_ids))
+        boxes = np.concatenate([p[0] for p in parts])
+        scores = np.concatenate([p[1] for p in parts])
+        class_ids = np.concatenate([p[2] for p in parts])
+        keep = nms(
+            boxes, scores, DEFAULT_IOU_THRESHOLD if iou_threshold is None else iou_threshold, class_ids,
+            DEFAULT_TOP_K if top_k is None else top_k,
+        )
+        return boxes[keep], scores[keep], class_ids[keep]
+
+    def _infer_views(self, batch: np.ndarray) -> Optional[List[np.ndarray]]:
+        """Per-view outputs of a batch tensor, in chunks of the model's fixed batch size if it has one."""
+        size = self.batch_dim or len(batch)
+        outputs = []
+        for i in range(0, len(batch), size):
+            chunk = batch[i:i + size]
+            count = len(chunk)
+            if count < size:
+                chunk = np.concatenate([chunk, np.zeros((size - count,) + chunk.shape[1:], chunk.dtype)])
+            output = self._infer(chunk, batched=True)
+            if output is None:
+                return None
+            # A (K, 6) output only comes from single-image batches
+            outputs.extend(output[:count] if output.ndim == 3 else [output])
+        return outputs
+
+    def _mosaic_arrays(
+        self,
+        frame: np.ndarray,
+        regions: List[Region],
+        placements,
+        conf_threshold: Optional[float] = None,
+        iou_threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+    ):
+        """
+        Model pass over region crops packed into one input (Preprocessor.mosaic).
+        Each box is assigned to the crop containing its center, clipped to
+        that crop and mapped back to the frame; boxes in the padding are dropped.
+
+        Returns:
+            (boxes, scores, class_ids) arrays, boxes normalized to the frame
+        """
+        output = self._infer(self.preprocessor.mosaic(frame, regions, placements))
+        if output is None:
+            return empty_arrays()
+        in_w, in_h = self.input_size
+        input_px = np.array([in_w, in_h, in_w, in_h], np.float32)
+        boxes, scores, class_ids = self._postprocess(
+            output, BoxTransform.stretch(self.input_size), conf_threshold, iou_threshold, top_k
+        )
+        boxes *= input_px
+        cx, cy = (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2
+
+        h, w = frame.shape[:2]
+        mapped = np.empty_like(boxes)
+        owner = np.full(len(boxes), -1, np.int64)
+        for i, ((x0, y0, x1, y1), (px, py, pw, ph)) in enumerate(zip(regions, placements)):
+            inside = (owner < 0) & (cx >= px) & (cx < px + pw) & (cy >= py) & (cy < py + ph)
+            if not inside.any():
+                continue
+            owner[inside] = i
+            low = np.array([px, py, px, py], np.float32)
+            local = np.clip(boxes[inside], low, low + np.array([pw, ph, pw, ph], np.float32)) - low
+            gain = np.array([(x1 - x0) / (pw * w), (y1 - y0) / (ph * h)] * 2, np.float32)
+            mapped[inside] = local * gain + np.array([x0 / w, y0 / h] * 2, np.float32)
+        keep = owner >= 0
+        return mapped[keep], scores[keep], class_ids[keep]
+
+    def _run_model(self, frame: np.ndarray) -> Tuple[Optional[np.ndarray], BoxTransform]:
+        """
+        Pre-process a frame and run it through the ONNX session.
+
+        Returns:
+            (raw first output, box transform). The output is assumed to be
+            [batch_size, num_detections, 6] where the last dimension is
+            [x1, y1, x2, y2, confidence, class_id]; None on failure
+        """
+        # Resize (optionally letterboxed), BGR->RGB, /255 and HWC->CHW into reused buffers
+        input_image, transform = self.preprocessor(frame)
+        return self._infer(input_image), transform
+
+    def _infer(self, input_tensor: np.ndarray, batched: bool = False) -> Optional[np.ndarray]:
+        """
+        Run a pre-processed NCHW tensor through the ONNX session.
+
+        Args:
+            input_tensor: Model input
+            batched: The tensor already holds several images (e.g. tiles); runs
+                     on the session directly instead of the shared batcher
+
+        Returns:
+            Raw first output, or None on failure
+        """
         try:
-            if self.session is not None:
-                outputs = self.session.run(None, {'input': input_image})
-                
-                # Process outputs (this depends on your model's output format)
-                # This is a simplified example - you would need to adjust based on your model
-                detections = []
-                if len(outputs) > 0:
-                    # Assuming output is [batch_size, num_detections, 6] where last dimension is [x1, y1, x2, y2, confidence, class_id]
-                    # Handle SparseTensor conversion if needed
-                    output = outputs[0]
-                    # Convert to numpy array if it's not already a numpy array
-                    # This handles SparseTensor and other special types
-                    if not isinstance(output, np.ndarray):
-                        try:
-                            # Use np.asarray which can handle most array-like objects including sparse tensors
-                            output = np.asarray(output)
-                        except Exception as e:
-                            print(f"Error converting output to numpy array: {e}")
-                            # Fallback to np.array conversion
-                            output = np.array(output)
-                    
-                    # Access first batch (first element)
-                    if len(output) > 0:
-                        output = output[0]
-                    
-                    for detection in output:
-                        x1, y1, x2, y2, conf, class_id = detection
-                        if conf > 0.5:  # Confidence threshold
-                            # Convert coordinates back to original frame size
-                            h, w = frame.shape[:2]
-                            x1 = int(x1 * w / input_size[0])
-                            y1 = int(y1 * h / input_size[1])
-                            x2 = int(x2 * w / input_size[0])
-                            y2 = int(y2 * h / input_size[1])
-                            
-                            detections.append({
-                                'bbox': [x1, y1, x2, y2],
-                                'confidence': float(conf),
-                                'class_id': int(class_id),
-                                'label': f'object_{int(class_id)}'
-                            })
-                
-                return detections
+            if self.session is None:
+                return None
+            if self.batcher is not None and not batched:
+                outputs = self.batcher.infer(input_tensor)
             else:
-                return []
+                outputs = self.session.run(None, {self.input_name: input_tensor})
+            if len(outputs) == 0:
+                return None
+            # np.asarray handles SparseTensor and other array-like outputs
+            return np.asarray(outputs[0])
         except Exception as e:
             print(f"Error during model inference: {e}")
-            return []
+            return None
     
     def _detect_simple(self, frame: np.ndarray) -> List[Dict[str, Any]]:
         """
-        Optimized multi-color object detection.
+        Multi-color object detection (LUT labelling, packed morphology, one labelling pass; see ColorClassifier).
         """
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        detections = []
-        
-        # Define color ranges for multiple objects
-        colors = {
-            'red': ([0, 50, 50], [10, 255, 255], [170, 50, 50], [180, 255, 255]),
-            'blue': ([100, 50, 50], [130, 255, 255]),
-            'green': ([40, 50, 50], [80, 255, 255]),
-            'yellow': ([20, 50, 50], [40, 255, 255])
-        }
-        
-        kernel = np.ones((3, 3), np.uint8)
-        
-        for color_name, ranges in colors.items():
-            if len(ranges) == 4:  # Red has two ranges
-                mask1 = cv2.inRange(hsv, np.array(ranges[0]), np.array(ranges[1]))
-                mask2 = cv2.inRange(hsv, np.array(ranges[2]), np.array(ranges[3]))
-                mask = mask1 + mask2
-            else:
-                mask = cv2.inRange(hsv, np.array(ranges[0]), np.array(ranges[1]))
-            
-            # Clean up mask
-            mask = cv2.morphologyEx(mask.astype(np.uint8), cv2.MORPH_OPEN, kernel)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-            
-            # Find contours
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                if area > 300:  # Lower threshold for better detection
-                    x, y, w, h = cv2.boundingRect(contour)
-                    # Filter out very thin or very wide rectangles
-                    aspect_ratio = w / h if h > 0 else 0
-                    if 0.2 < aspect_ratio < 5.0:
-                        detections.append({
-                            'bbox': [x, y, x + w, y + h],
-                            'confidence': min(0.95, area / 8000),
-                            'class_id': list(colors.keys()).index(color_name),
-                            'label': color_name
-                        })
-        
-        return detections
+        return self.color_classifier.detect(frame)
 
-def draw_detections(frame: np.ndarray, detections: List[Dict[str, Any]]) -> np.ndarray:
+def draw_detections(frame: np.ndarray, detections: List[Dict[str, Any]], in_place: bool = False) -> np.ndarray:
     """
     Draw detection bounding boxes on a frame.
     
     Args:
         frame: Input frame as numpy array (BGR format)
-        detections: List of detections from detect_objects
+        detections: List of detections from detect_objects (pixel "bbox"), or
+                    contract detections from detect_contract (normalized xmin..ymax)
+        in_place: Draw on frame itself instead of a copy, when the caller no
+                  longer needs the clean frame
         
     Returns:
         Frame with drawn detections
     """
-    result_frame = frame.copy()
+    result_frame = frame if in_place else frame.copy()
+    h, w = result_frame.shape[:2]
     
     for detection in detections:
-        x1, y1, x2, y2 = detection['bbox']
-        confidence = detection['confidence']
+        if 'bbox' in detection:
+            x1, y1, x2, y2 = detection['bbox']
+            confidence = detection['confidence']
+        else:
+            x1, y1 = int(detection['xmin'] * w), int(detection['ymin'] * h)
+            x2, y2 = int(detection['xmax'] * w), int(detection['ymax'] * h)
+            confidence = detection['score']
         label = detection['label']
         
         # Draw bounding box